@@ -52,6 +52,21 @@ PDF_DIR = os.path.join(UPLOAD_DIR, "pdfs")
 SEGMENTS_DIR = os.path.join(UPLOAD_DIR, "segments")
 IMAGES_DIR = os.path.join(UPLOAD_DIR, "chem_images")
 
+# SQLite database holding every structure recognised by the OCSR engines
+STRUCTURE_INDEX_PATH = os.getenv("STRUCTURE_INDEX_PATH") or os.path.join(
+    UPLOAD_DIR, "structure_index.sqlite3"
+)
+
+# SQLite database caching LLM extraction responses
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or os.path.join(
+    UPLOAD_DIR, "openai_results", "llm_cache.sqlite3"
+)
+
+# SQLite database holding saved OpenAI extraction results
+EXTRACTION_STORE_PATH = os.getenv("EXTRACTION_STORE_PATH") or os.path.join(
+    UPLOAD_DIR, "openai_results", "extractions.sqlite3"
+)
+
 # Create directories if they don't exist
 os.makedirs(PDF_DIR, exist_ok=True)
 os.makedirs(SEGMENTS_DIR, exist_ok=True)
@@ -61,6 +76,9 @@ os.makedirs(IMAGES_DIR, exist_ok=True)
 SECRET_KEY = validated_env["SECRET_KEY"]
 OPENAI_API_KEY = validated_env["OPENAI_API_KEY"]
 OPENAI_MODEL_ID = validated_env.get("OPENAI_MODEL_ID", "gpt-4")
+# Key required in the X-Admin-Key header of administrative endpoints, such as
+# clearing the LLM cache; those endpoints are disabled while it is unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
 
 # CORS configuration
 CORS_ORIGINS = get_cors_origins()
@@ -89,6 +107,84 @@ ALLOWED_FILE_TYPES = [
     "image/webp",
 ]
 
+# OpenAI client configuration
+# Point OPENAI_BASE_URL at a local stub server to run the annotation module offline.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "") or None
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1.0"))
+
+# Texts longer than OPENAI_CHUNK_SIZE characters are split on paragraph or
+# sentence boundaries and the chunks are annotated concurrently
+OPENAI_CHUNK_SIZE = int(os.getenv("OPENAI_CHUNK_SIZE", "6000"))
+OPENAI_CHUNK_OVERLAP = int(os.getenv("OPENAI_CHUNK_OVERLAP", "300"))
+
+# LLM response cache: identical prompts for the same model are answered locally
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "0"))
+
+# Session management: only sessions with recent or in-flight work count
+# against MARCUS_MAX_CONCURRENT_USERS, so idle sessions do not block the queue
+MARCUS_MAX_CONCURRENT_USERS = int(os.getenv("MARCUS_MAX_CONCURRENT_USERS", "3"))
+MARCUS_SESSION_IDLE_TIMEOUT = float(os.getenv("MARCUS_SESSION_IDLE_TIMEOUT", "60"))
+
+# Admission control: heavy requests reserve work units from a budget and are
+# only started while the host has CPU and memory headroom. The budget is kept
+# in each worker process, so ADMISSION_CAPACITY_UNITS, the budget of the whole
+# host, is split evenly between the WORKERS processes.
+ADMISSION_CONTROL_ENABLED = (
+    os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+)
+ADMISSION_CAPACITY_UNITS = int(os.getenv("ADMISSION_CAPACITY_UNITS", "8"))
+ADMISSION_WORKERS = max(
+    1, int(os.getenv("WORKERS") or os.getenv("WEB_CONCURRENCY") or "1")
+)
+ADMISSION_WORKER_CAPACITY_UNITS = max(1, ADMISSION_CAPACITY_UNITS // ADMISSION_WORKERS)
+ADMISSION_COSTS = {
+    "ocsr": int(os.getenv("ADMISSION_COST_OCSR", "2")),
+    "segmentation": int(os.getenv("ADMISSION_COST_SEGMENTATION", "4")),
+    "docling": int(os.getenv("ADMISSION_COST_DOCLING", "4")),
+    "depiction": int(os.getenv("ADMISSION_COST_DEPICTION", "1")),
+}
+ADMISSION_MAX_CPU_LOAD = float(os.getenv("ADMISSION_MAX_CPU_LOAD", "0.9"))
+ADMISSION_MIN_FREE_MEMORY_MB = float(os.getenv("ADMISSION_MIN_FREE_MEMORY_MB", "512"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "120"))
+# Waiting requests are shared out between priority classes by weight, and
+# between sessions within a class equally
+ADMISSION_PRIORITIES = {
+    "ocsr": os.getenv("ADMISSION_PRIORITY_OCSR", "interactive"),
+    "segmentation": os.getenv("ADMISSION_PRIORITY_SEGMENTATION", "batch"),
+    "docling": os.getenv("ADMISSION_PRIORITY_DOCLING", "batch"),
+    "depiction": os.getenv("ADMISSION_PRIORITY_DEPICTION", "interactive"),
+}
+ADMISSION_PRIORITY_WEIGHTS = {
+    "interactive": int(os.getenv("ADMISSION_WEIGHT_INTERACTIVE", "3")),
+    "batch": int(os.getenv("ADMISSION_WEIGHT_BATCH", "1")),
+}
+
+# CDK JVM configuration
+# Each backend worker process starts its own JVM, so the effective memory
+# footprint of the CDK subsystem is WORKERS x CDK_JVM_HEAP.
+CDK_JVM_HEAP = os.getenv("CDK_JVM_HEAP", "4096M")
+CDK_JVM_INITIAL_HEAP = os.getenv("CDK_JVM_INITIAL_HEAP", "")
+CDK_JVM_GC = os.getenv("CDK_JVM_GC", "").lower()
+CDK_JVM_ASSERTIONS = os.getenv("CDK_JVM_ASSERTIONS", "false").lower() == "true"
+CDK_JVM_EXTRA_OPTIONS = os.getenv("CDK_JVM_EXTRA_OPTIONS", "")
+
+# Number of threads running CDK structure layout for bulk conversions
+CDK_LAYOUT_WORKERS = int(os.getenv("CDK_LAYOUT_WORKERS", "4"))
+
+# Offline CDK jar directory and expected SHA-256 checksums
+CDK_JAR_DIR = os.getenv("CDK_JAR_DIR", "")
+CDK_JAR_OFFLINE = os.getenv("CDK_JAR_OFFLINE", "false").lower() == "true"
+CDK_JAR_SHA256 = {
+    "cdk-2.10": os.getenv("CDK_JAR_SHA256", "").lower(),
+    "centres": os.getenv("CENTRES_JAR_SHA256", "").lower(),
+}
+
 # Logging configuration for security events
 SECURITY_LOG_LEVEL = os.getenv("SECURITY_LOG_LEVEL", "INFO")
 
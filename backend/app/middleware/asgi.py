@@ -0,0 +1,35 @@
+"""
+Helpers shared by the plain ASGI middleware of the MARCUS application.
+"""
+
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+Headers = Iterable[Tuple[bytes, bytes]]
+
+
+def get_header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    """Return a request header from an ASGI scope; name must be lowercase."""
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def send_json_response(
+    send, status_code: int, content: Dict[str, Any], headers: Headers = ()
+):
+    """Send a complete JSON response through an ASGI send channel."""
+    body = json.dumps(content).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
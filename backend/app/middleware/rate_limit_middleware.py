@@ -1,100 +1,131 @@
 """
 Rate limiting middleware for MARCUS application.
-Implements rate limiting middleware.
+Implements rate limiting as plain ASGI middleware.
 """
 
 import logging
-from typing import Callable, Dict, Any
-from fastapi import Request, Response, HTTPException, status
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+import time
+from typing import Any, Dict, List, Tuple
 
-from app.security.rate_limiter import rate_limiter, get_client_identifier
+from app.middleware.asgi import send_json_response
+from app.security.rate_limiter import get_scope_client_identifier, rate_limiter
 
 logger = logging.getLogger(__name__)
 
-
-class RateLimitMiddleware(BaseHTTPMiddleware):
+Headers = List[Tuple[bytes, bytes]]
+
+# Paths exempt from rate limiting, matched exactly
+EXEMPT_PATHS = ["/", "/favicon.ico"]
+# Path prefixes exempt from rate limiting
+EXEMPT_PREFIXES = [
+    "/docs",
+    "/redoc",
+    "/openapi.json",
+    "/health",
+    "/latest/docs",
+    "/latest/redoc",
+    "/latest/openapi.json",
+    "/v1/docs",
+    "/v1/redoc",
+    "/v1/openapi.json",
+]
+
+
+class RateLimitMiddleware:
     """
     Middleware to enforce rate limiting across the application.
+
+    Written against ASGI directly rather than BaseHTTPMiddleware, so checked
+    requests cost one limiter call and response bodies, streaming ones
+    included, are passed through untouched; only the response start message
+    gains the rate limit headers.
     """
 
-    def __init__(self, app, exempt_paths: list = None, enabled: bool = True):
+    def __init__(
+        self,
+        app,
+        exempt_paths: list = None,
+        enabled: bool = True,
+        exempt_prefixes: list = None,
+    ):
         """
         Initialize rate limiting middleware.
 
         Args:
-            app: FastAPI application instance
-            exempt_paths: List of paths exempt from rate limiting
+            app: ASGI application to wrap
+            exempt_paths: Paths exempt from rate limiting, matched exactly
             enabled: Whether rate limiting is enabled
+            exempt_prefixes: Path prefixes exempt from rate limiting
         """
-        super().__init__(app)
+        self.app = app
         self.enabled = enabled
-        self.exempt_paths = exempt_paths or [
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/health",
-            "/",
-            "/favicon.ico",
-        ]
+        self.exempt_paths = frozenset(exempt_paths or EXEMPT_PATHS)
+        # A prefix such as "/" would exempt every path, so those are exact only
+        self._exempt_prefixes = tuple(
+            prefix
+            for prefix in (exempt_prefixes or EXEMPT_PREFIXES)
+            if prefix.strip("/")
+        )
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope, receive, send):
         """
         Process request through rate limiting checks.
 
         Args:
-            request: Incoming HTTP request
-            call_next: Next middleware/handler in chain
-
-        Returns:
-            Response: HTTP response
+            scope: ASGI connection scope
+            receive: ASGI receive channel
+            send: ASGI send channel
         """
-        # Skip rate limiting if disabled
-        if not self.enabled or not rate_limiter.enabled:
-            return await call_next(request)
-
-        path = request.url.path
-
-        # Check if path is exempt from rate limiting
-        if self._is_exempt_path(path):
-            return await call_next(request)
-
-        # Get client identifier
-        client_id = get_client_identifier(request)
+        # Skip rate limiting if disabled, for non-HTTP traffic and exempt paths
+        if (
+            scope["type"] != "http"
+            or not self.enabled
+            or not rate_limiter.enabled
+            or scope["path"] in self.exempt_paths
+            or scope["path"].startswith(self._exempt_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        client_id = get_scope_client_identifier(scope)
 
         # Check rate limit
         rate_check = rate_limiter.is_allowed(client_id, path)
 
         if not rate_check["allowed"]:
             # Rate limit exceeded - return error response
-            return self._create_rate_limit_response(rate_check, client_id, path)
-
-        # Add rate limit headers to response
-        response = await call_next(request)
-        self._add_rate_limit_headers(response, rate_check)
+            await self._send_rate_limit_response(send, rate_check, client_id, path)
+            return
 
         # Log rate limit info if high usage
-        remaining = rate_check.get("remaining", 0)
-        if remaining <= 3:  # Warn when close to limit
+        if rate_check["remaining"] <= 3:  # Warn when close to limit
             logger.warning(
                 f"Client {client_id} approaching rate limit on {rate_check['endpoint_type']}: "
                 f"{rate_check['current_requests']}/{rate_check['limit']} requests"
             )
 
-        return response
+        rate_limit_headers = self._rate_limit_headers(rate_check)
 
-    def _is_exempt_path(self, path: str) -> bool:
-        """Check if path is exempt from rate limiting."""
-        return any(path.startswith(exempt) for exempt in self.exempt_paths)
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + (
+                    rate_limit_headers
+                )
+            await send(message)
 
-    def _create_rate_limit_response(
-        self, rate_check: Dict[str, Any], client_id: str, path: str
-    ) -> JSONResponse:
-        """Create rate limit exceeded response."""
+        await self.app(scope, receive, send_with_headers)
+
+    async def _send_rate_limit_response(
+        self, send, rate_check: Dict[str, Any], client_id: str, path: str
+    ):
+        """Send the rate limit exceeded response."""
         reason = rate_check.get("reason", "unknown")
         retry_after = rate_check.get("retry_after", 60)
         endpoint_type = rate_check.get("endpoint_type", "unknown")
+        limit = rate_check.get("limit", 0)
+        window = rate_check.get("window", 60)
+        current_requests = rate_check.get("current_requests", 0)
 
         # Log rate limit violation
         logger.warning(
@@ -105,11 +136,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         # Create response based on reason
         if reason == "penalty_period":
             detail = "You are currently in a penalty period due to rate limit violations. Please wait before trying again."
-            status_code = status.HTTP_429_TOO_MANY_REQUESTS
         else:
-            current_requests = rate_check.get("current_requests", 0)
-            limit = rate_check.get("limit", 0)
-            window = rate_check.get("window", 60)
             violations = rate_check.get("violations", 0)
 
             detail = (
@@ -120,55 +147,42 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             if violations > 1:
                 detail += f" Repeated violations ({violations}) will result in longer penalties."
 
-            status_code = status.HTTP_429_TOO_MANY_REQUESTS
-
-        headers = {
-            "Retry-After": str(retry_after),
-            "X-RateLimit-Limit": str(rate_check.get("limit", 0)),
-            "X-RateLimit-Remaining": "0",
-            "X-RateLimit-Reset": str(int(time.time()) + retry_after),
-            "X-RateLimit-Type": endpoint_type,
-        }
-
-        return JSONResponse(
-            status_code=status_code,
-            content={
+        await send_json_response(
+            send,
+            429,
+            {
                 "detail": detail,
                 "error_code": "RATE_LIMIT_EXCEEDED",
                 "retry_after": retry_after,
                 "endpoint_type": endpoint_type,
-                "current_requests": rate_check.get("current_requests", 0),
-                "limit": rate_check.get("limit", 0),
-                "window": rate_check.get("window", 60),
+                "current_requests": current_requests,
+                "limit": limit,
+                "window": window,
             },
-            headers=headers,
+            headers=[
+                (b"retry-after", str(retry_after).encode()),
+                (b"x-ratelimit-limit", str(limit).encode()),
+                (b"x-ratelimit-remaining", b"0"),
+                (b"x-ratelimit-reset", str(int(time.time()) + retry_after).encode()),
+                (b"x-ratelimit-type", endpoint_type.encode()),
+            ],
         )
 
-    def _add_rate_limit_headers(self, response: Response, rate_check: Dict[str, Any]):
-        """Add rate limiting headers to response."""
-        try:
-            import time
-
-            limit = rate_check.get("limit", 0)
-            remaining = rate_check.get("remaining", 0)
-            window = rate_check.get("window", 60)
-            endpoint_type = rate_check.get("endpoint_type", "default")
-
-            # Add standard rate limit headers
-            response.headers["X-RateLimit-Limit"] = str(limit)
-            response.headers["X-RateLimit-Remaining"] = str(remaining)
-            response.headers["X-RateLimit-Reset"] = str(int(time.time()) + window)
-            response.headers["X-RateLimit-Type"] = endpoint_type
-
-            # Add custom headers for debugging
-            response.headers["X-RateLimit-Current"] = str(
-                rate_check.get("current_requests", 0)
-            )
-            response.headers["X-RateLimit-Window"] = str(window)
-
-        except Exception as e:
-            logger.error(f"Error adding rate limit headers: {e}")
-
-
-# Import time module at module level
-import time
+    def _rate_limit_headers(self, rate_check: Dict[str, Any]) -> Headers:
+        """Build the rate limiting headers of an allowed response."""
+        limit = rate_check.get("limit", 0)
+        window = rate_check.get("window", 60)
+
+        return [
+            # Standard rate limit headers
+            (b"x-ratelimit-limit", str(limit).encode()),
+            (b"x-ratelimit-remaining", str(rate_check.get("remaining", 0)).encode()),
+            (b"x-ratelimit-reset", str(int(time.time()) + window).encode()),
+            (b"x-ratelimit-type", rate_check.get("endpoint_type", "default").encode()),
+            # Custom headers for debugging
+            (
+                b"x-ratelimit-current",
+                str(rate_check.get("current_requests", 0)).encode(),
+            ),
+            (b"x-ratelimit-window", str(window).encode()),
+        ]
@@ -1,72 +1,113 @@
 """
 Session middleware for MARCUS application.
-Validates active sessions and tracks API usage.
+Validates active sessions and tracks API usage as plain ASGI middleware.
 """
 
-import time
-from fastapi import Request, HTTPException
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from http.cookies import CookieError, SimpleCookie
+from typing import Optional
+from urllib.parse import parse_qs
+from app.middleware.asgi import get_header, send_json_response
+from app.modules.admission_control import (
+    AdmissionTimeoutError,
+    admission_controller,
+    classify_request,
+)
 from app.modules.session_manager import session_manager
 import logging
 
 logger = logging.getLogger(__name__)
 
-
-class SessionMiddleware(BaseHTTPMiddleware):
-    """Middleware to enforce session management and track API usage."""
-
-    def __init__(self, app, exempt_paths=None):
-        super().__init__(app)
-        # Paths that don't require active session validation
-        self.exempt_paths = exempt_paths or [
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/health",
-            "/session",  # Session management endpoints
-            "/",
-            "/latest",
-            "/v1",
-        ]
-
-    async def dispatch(self, request: Request, call_next):
-        # Check if this path is exempt from session validation
-        path = request.url.path
-
-        # Allow exempt paths
-        if any(path.startswith(exempt) for exempt in self.exempt_paths):
-            return await call_next(request)
+# Paths that don't require active session validation, matched exactly
+EXEMPT_PATHS = ["/", "/latest", "/v1"]
+# Path prefixes that don't require active session validation
+EXEMPT_PREFIXES = [
+    "/docs",
+    "/redoc",
+    "/openapi.json",
+    "/health",
+    "/session",  # Session management endpoints
+    "/latest/docs",
+    "/latest/redoc",
+    "/latest/openapi.json",
+    "/v1/docs",
+    "/v1/redoc",
+    "/v1/openapi.json",
+]
+
+
+class SessionMiddleware:
+    """
+    Middleware to enforce session management and track API usage.
+
+    Written against ASGI directly rather than BaseHTTPMiddleware: active
+    sessions are recognised without copying the session record, activity
+    timestamps are batched by the session manager, and response bodies,
+    streaming ones included, are passed through untouched.
+    """
+
+    def __init__(self, app, exempt_paths=None, exempt_prefixes=None):
+        self.app = app
+        self.exempt_paths = frozenset(exempt_paths or EXEMPT_PATHS)
+        # A prefix such as "/" would exempt every path, so those are exact only
+        self.exempt_prefixes = tuple(
+            prefix
+            for prefix in (exempt_prefixes or EXEMPT_PREFIXES)
+            if prefix.strip("/")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+
+        # Allow exempt paths; heavy requests still go through admission control
+        if path in self.exempt_paths or path.startswith(self.exempt_prefixes):
+            await self.call_with_admission(
+                scope, receive, send, self.extract_session_id(scope)
+            )
+            return
+
+        # Continue processing requests outside the API; admission control
+        # never depends on which of these branches a request takes
+        if not path.startswith(("/v1/", "/latest/")):
+            await self.call_with_admission(scope, receive, send, None)
+            return
 
         # For API endpoints, validate session
-        if path.startswith("/v1/") or path.startswith("/latest/"):
-            session_id = self.extract_session_id(request)
-
-            if not session_id:
-                return JSONResponse(
-                    status_code=401,
-                    content={
-                        "detail": "Session ID required. Please create a session first.",
-                        "error_code": "NO_SESSION",
-                    },
-                )
-
-            # Validate session is active
+        session_id = self.extract_session_id(scope)
+        if not session_id:
+            await send_json_response(
+                send,
+                401,
+                {
+                    "detail": "Session ID required. Please create a session first.",
+                    "error_code": "NO_SESSION",
+                },
+            )
+            return
+
+        # Active sessions need one lookup; others may be promoted from the queue
+        if session_manager.session_state(session_id) != "active":
             session_status = await session_manager.get_session_status(session_id)
 
             if not session_status:
-                return JSONResponse(
-                    status_code=404,
-                    content={
+                await send_json_response(
+                    send,
+                    404,
+                    {
                         "detail": "Session not found or expired.",
                         "error_code": "SESSION_NOT_FOUND",
                     },
                 )
+                return
 
             if session_status.get("status") != "active":
-                return JSONResponse(
-                    status_code=403,
-                    content={
+                await send_json_response(
+                    send,
+                    403,
+                    {
                         "detail": "Session is not active. Please wait in queue.",
                         "error_code": "SESSION_NOT_ACTIVE",
                         "queue_position": session_status.get("queue_position"),
@@ -75,39 +116,85 @@ class SessionMiddleware(BaseHTTPMiddleware):
                         ),
                     },
                 )
+                return
 
-            # Update session activity
-            await session_manager.update_session_activity(session_id)
-
-            # Add session info to request state for use in endpoints
-            request.state.session_id = session_id
-            request.state.session_status = session_status
-
-        # Continue processing request
-        response = await call_next(request)
+        # Add session info to request state for use in endpoints
+        scope.setdefault("state", {})["session_id"] = session_id
 
         # Add session info to response headers for debugging
-        if hasattr(request.state, "session_id"):
-            response.headers["X-Session-ID"] = request.state.session_id
-            response.headers["X-Session-Status"] = "active"
+        session_headers = [
+            (b"x-session-id", session_id.encode("latin-1")),
+            (b"x-session-status", b"active"),
+        ]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + session_headers
+            await send(message)
 
-        return response
+        # Validated API requests are admission controlled and mark the session busy
+        await self.call_with_admission(scope, receive, send_with_headers, session_id)
 
-    def extract_session_id(self, request: Request) -> str:
+    async def call_with_admission(
+        self, scope, receive, send, session_id: Optional[str]
+    ):
+        """Run a request, reserving work units for heavy request classes."""
+        request_class = classify_request(scope["method"], scope["path"])
+        # Marks the session busy, so it keeps its slot while the request runs
+        if session_id:
+            await session_manager.begin_request(session_id)
+        try:
+            if request_class is None:
+                await self.app(scope, receive, send)
+                return
+
+            try:
+                ticket = await admission_controller.acquire(request_class, session_id)
+            except AdmissionTimeoutError as e:
+                logger.warning(f"Request from session {session_id} not admitted: {e}")
+                await send_json_response(
+                    send,
+                    503,
+                    {
+                        "detail": "Server is at capacity. Please try again shortly.",
+                        "error_code": "SERVER_BUSY",
+                    },
+                    headers=[(b"retry-after", b"10")],
+                )
+                return
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                service_time = admission_controller.release(ticket)
+                session_manager.record_job_time(request_class, service_time)
+        finally:
+            if session_id:
+                await session_manager.end_request(session_id)
+
+    def extract_session_id(self, scope) -> Optional[str]:
         """Extract session ID from request headers or query parameters."""
         # Check headers first
-        session_id = request.headers.get("X-Session-ID")
+        session_id = get_header(scope, b"x-session-id")
         if session_id:
             return session_id
 
         # Check query parameters
-        session_id = request.query_params.get("session_id")
-        if session_id:
-            return session_id
+        query_string = scope.get("query_string", b"")
+        if b"session_id=" in query_string:
+            values = parse_qs(query_string.decode("latin-1")).get("session_id")
+            if values and values[0]:
+                return values[0]
 
         # Check cookies
-        session_id = request.cookies.get("marcus_session_id")
-        if session_id:
-            return session_id
+        cookie_header = get_header(scope, b"cookie")
+        if cookie_header and "marcus_session_id" in cookie_header:
+            cookies = SimpleCookie()
+            try:
+                cookies.load(cookie_header)
+            except CookieError:
+                return None
+            morsel = cookies.get("marcus_session_id")
+            if morsel and morsel.value:
+                return morsel.value
 
         return None
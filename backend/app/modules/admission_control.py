@@ -0,0 +1,481 @@
+"""
+Capacity-aware admission control for MARCUS.
+Heavy requests reserve work units from a budget before they run, and are
+only admitted while the host has CPU and memory headroom, so concurrency
+follows the actual workload instead of the number of connected users.
+
+The budget and the queues live in each worker process. Every worker gets an
+equal share of the host budget, and requests are scheduled fairly among
+those waiting in the same worker.
+
+Waiting requests are scheduled by deficit round robin on two levels: across
+priority classes in proportion to their weights, and within a priority class
+across sessions, so neither a flood of batch work nor one session's backlog
+can starve interactive requests from others.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.config import (
+    ADMISSION_CONTROL_ENABLED,
+    ADMISSION_COSTS,
+    ADMISSION_MAX_CPU_LOAD,
+    ADMISSION_MIN_FREE_MEMORY_MB,
+    ADMISSION_PRIORITIES,
+    ADMISSION_PRIORITY_WEIGHTS,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_WORKER_CAPACITY_UNITS,
+)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Router prefix -> request class; only POST requests to these routers do heavy work
+REQUEST_CLASS_BY_PREFIX = {
+    "ocsr": "ocsr",
+    "decimer": "segmentation",
+    "docling_conversion": "docling",
+    "depiction": "depiction",
+}
+
+# Seconds between headroom samples, and between re-checks while requests wait
+HEADROOM_SAMPLE_INTERVAL = 1.0
+HEADROOM_POLL_INTERVAL = 0.5
+
+# Priority class of request classes without a configured one
+DEFAULT_PRIORITY = "default"
+
+
+class AdmissionTimeoutError(Exception):
+    """Raised when a request could not be admitted within the queue timeout."""
+
+
+@dataclass
+class AdmissionTicket:
+    """Work units reserved by acquire(), to be handed back to release()."""
+
+    request_class: str
+    cost: int
+    session_id: Optional[str] = None
+    enqueued_at: float = 0.0
+    admitted_at: float = 0.0
+
+
+@dataclass
+class ClassMetrics:
+    """Queue-wait and service-time totals of one request class."""
+
+    admitted: int = 0
+    rejected: int = 0
+    completed: int = 0
+    total_wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    total_service_time: float = 0.0
+    max_service_time: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "average_wait_time": (
+                round(self.total_wait_time / self.admitted, 3) if self.admitted else 0.0
+            ),
+            "max_wait_time": round(self.max_wait_time, 3),
+            "average_service_time": (
+                round(self.total_service_time / self.completed, 3)
+                if self.completed
+                else 0.0
+            ),
+            "max_service_time": round(self.max_service_time, 3),
+        }
+
+
+Waiter = Tuple[AdmissionTicket, asyncio.Future]
+
+
+class _Flow:
+    """Waiting requests of one session in one priority class, in arrival order."""
+
+    __slots__ = ("waiters", "deficit")
+
+    def __init__(self):
+        self.waiters: Deque[Waiter] = deque()
+        self.deficit = 0
+
+
+class _PriorityQueue:
+    """Sessions with requests waiting in one priority class, in round-robin order."""
+
+    __slots__ = ("weight", "flows", "deficit")
+
+    def __init__(self, weight: int):
+        self.weight = weight
+        self.flows: "OrderedDict[str, _Flow]" = OrderedDict()
+        self.deficit = 0
+
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    """
+    Return the request class of a versioned API request.
+
+    Args:
+        method: HTTP method
+        path: Request path such as ``/v1/ocsr/generate_smiles``
+
+    Returns:
+        Request class name, or None for requests that are not admission controlled
+    """
+    if method != "POST":
+        return None
+    parts = path.split("/", 3)
+    if len(parts) < 3:
+        return None
+    return REQUEST_CLASS_BY_PREFIX.get(parts[2])
+
+
+def _cpu_load() -> float:
+    """Return the recent CPU load as a fraction of the available cores."""
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None) / 100.0
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def _available_memory_mb() -> Optional[float]:
+    """Return the memory available to new work in MB, if it can be measured."""
+    if psutil is not None:
+        return psutil.virtual_memory().available / (1024 * 1024)
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class AdmissionController:
+    """Admit requests fairly against a work-unit budget and host headroom."""
+
+    def __init__(
+        self,
+        capacity: int,
+        costs: Dict[str, int],
+        max_cpu_load: float = 0.9,
+        min_free_memory_mb: float = 512,
+        queue_timeout: float = 120,
+        enabled: bool = True,
+        priorities: Optional[Dict[str, str]] = None,
+        weights: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Initialize the admission controller.
+
+        Args:
+            capacity: Work units that may be reserved at the same time
+            costs: Work units reserved by one request of each request class
+            max_cpu_load: CPU load above which no extra work is admitted
+            min_free_memory_mb: Available memory below which no extra work is admitted
+            queue_timeout: Seconds a request may wait before it is rejected
+            enabled: Whether admission control is enabled
+            priorities: Priority class of each request class
+            weights: Share of the capacity each priority class gets under contention
+        """
+        self.capacity = capacity
+        self.costs = costs
+        self.max_cpu_load = max_cpu_load
+        self.min_free_memory_mb = min_free_memory_mb
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self.priorities = priorities or {}
+        self.weights = weights or {}
+
+        self.in_flight_units = 0
+        self.in_flight_by_class: Dict[str, int] = {name: 0 for name in costs}
+        self.metrics: Dict[str, ClassMetrics] = {name: ClassMetrics() for name in costs}
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_time = 0.0
+        # Priority classes with waiting requests, in round-robin order
+        self._queues: "OrderedDict[str, _PriorityQueue]" = OrderedDict()
+        # Waiter chosen by the scheduler, admitted as soon as it fits
+        self._next: Optional[Waiter] = None
+        self._headroom = (0.0, 0.0, None)  # (sampled_at, cpu_load, available_mb)
+
+    def cost_of(self, request_class: str) -> int:
+        """Return the work units reserved by a request class, capped at capacity."""
+        return min(self.costs.get(request_class, 1), self.capacity)
+
+    def priority_of(self, request_class: str) -> str:
+        """Return the priority class a request class is scheduled in."""
+        return self.priorities.get(request_class, DEFAULT_PRIORITY)
+
+    def _metrics_for(self, request_class: str) -> ClassMetrics:
+        metrics = self.metrics.get(request_class)
+        if metrics is None:
+            metrics = self.metrics[request_class] = ClassMetrics()
+        return metrics
+
+    def _sample_headroom(self) -> Tuple[float, Optional[float]]:
+        """Return (cpu_load, available_mb), sampling at most once per interval."""
+        sampled_at, cpu_load, available_mb = self._headroom
+        now = time.monotonic()
+        if now - sampled_at >= HEADROOM_SAMPLE_INTERVAL:
+            cpu_load, available_mb = _cpu_load(), _available_memory_mb()
+            self._headroom = (now, cpu_load, available_mb)
+        return cpu_load, available_mb
+
+    def _can_admit(self, cost: int) -> bool:
+        # An idle server always admits one request, so a busy host cannot stall it
+        if self.in_flight_units == 0:
+            return True
+        if self.in_flight_units + cost > self.capacity:
+            return False
+        cpu_load, available_mb = self._sample_headroom()
+        if cpu_load > self.max_cpu_load:
+            return False
+        return available_mb is None or available_mb >= self.min_free_memory_mb
+
+    def _enqueue(self, waiter: Waiter):
+        """Add a waiter behind the earlier requests of its session and priority."""
+        ticket = waiter[0]
+        priority = self.priority_of(ticket.request_class)
+        queue = self._queues.get(priority)
+        if queue is None:
+            weight = max(1, self.weights.get(priority, 1))
+            queue = self._queues[priority] = _PriorityQueue(weight)
+        flow = queue.flows.get(ticket.session_id or "")
+        if flow is None:
+            flow = queue.flows[ticket.session_id or ""] = _Flow()
+        flow.waiters.append(waiter)
+
+    def _select_next(self) -> Optional[Waiter]:
+        """
+        Take the next waiter by deficit round robin.
+
+        Priority classes earn weight x capacity units per round and sessions
+        within a class earn capacity units per round; a waiter is chosen when
+        both its class and its session have earned its cost. Since every
+        cost is capped at the capacity, one round always suffices.
+        """
+        while self._queues:
+            priority, queue = next(iter(self._queues.items()))
+            session_key, flow = next(iter(queue.flows.items()))
+            ticket, future = flow.waiters[0]
+            if not future.done():
+                if queue.deficit < ticket.cost:
+                    queue.deficit += queue.weight * self.capacity
+                    self._queues.move_to_end(priority)
+                    continue
+                if flow.deficit < ticket.cost:
+                    flow.deficit += self.capacity
+                    queue.flows.move_to_end(session_key)
+                    continue
+                queue.deficit -= ticket.cost
+                flow.deficit -= ticket.cost
+
+            # Chosen, or given up by a request that timed out or disconnected
+            flow.waiters.popleft()
+            if not flow.waiters:
+                del queue.flows[session_key]
+                if not queue.flows:
+                    del self._queues[priority]
+            if not future.done():
+                return ticket, future
+        return None
+
+    def _admit_waiters(self):
+        """Hand free capacity to waiting requests in scheduling order."""
+        while True:
+            if self._next is None:
+                self._next = self._select_next()
+                if self._next is None:
+                    return
+            ticket, future = self._next
+            if future.done():
+                self._next = None
+                continue
+            # The chosen request keeps its turn until it fits
+            if not self._can_admit(ticket.cost):
+                return
+            self._next = None
+            self.in_flight_units += ticket.cost
+            future.set_result(ticket)
+
+    async def acquire(
+        self, request_class: str, session_id: Optional[str] = None
+    ) -> AdmissionTicket:
+        """
+        Wait until a request of this class can run and reserve its work units.
+
+        Args:
+            request_class: Request class from classify_request
+            session_id: Session making the request, for fair sharing between sessions
+
+        Returns:
+            Ticket for the reserved work units, to be passed to release()
+
+        Raises:
+            AdmissionTimeoutError: If the request waited longer than the queue timeout
+        """
+        started = time.monotonic()
+        ticket = AdmissionTicket(
+            request_class,
+            self.cost_of(request_class) if self.enabled else 0,
+            session_id=session_id,
+            enqueued_at=started,
+            admitted_at=started,
+        )
+        if not self.enabled:
+            return ticket
+
+        metrics = self._metrics_for(request_class)
+        if self._next is None and not self._queues and self._can_admit(ticket.cost):
+            self.in_flight_units += ticket.cost
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._enqueue((ticket, future))
+            try:
+                while not future.done():
+                    if time.monotonic() - started > self.queue_timeout:
+                        self.rejected += 1
+                        metrics.rejected += 1
+                        raise AdmissionTimeoutError(
+                            f"No capacity for {request_class} request after "
+                            f"{self.queue_timeout:.0f} seconds"
+                        )
+                    await asyncio.wait({future}, timeout=HEADROOM_POLL_INTERVAL)
+                    # Headroom changes without releases, so re-check periodically
+                    self._admit_waiters()
+            except BaseException:
+                if future.done() and not future.cancelled():
+                    self.in_flight_units -= ticket.cost
+                else:
+                    future.cancel()
+                # Pass the turn on if this request had been chosen next
+                self._admit_waiters()
+                raise
+
+        ticket.admitted_at = time.monotonic()
+        wait_time = ticket.admitted_at - started
+        self.in_flight_by_class[request_class] = (
+            self.in_flight_by_class.get(request_class, 0) + 1
+        )
+        self.admitted += 1
+        self.total_wait_time += wait_time
+        metrics.admitted += 1
+        metrics.total_wait_time += wait_time
+        metrics.max_wait_time = max(metrics.max_wait_time, wait_time)
+        return ticket
+
+    def release(self, ticket: AdmissionTicket) -> float:
+        """
+        Return the work units of a finished request and admit waiting ones.
+
+        Args:
+            ticket: Value returned by acquire()
+
+        Returns:
+            Seconds the request ran since it was admitted
+        """
+        service_time = time.monotonic() - ticket.admitted_at
+        if not self.enabled:
+            return service_time
+        metrics = self._metrics_for(ticket.request_class)
+        metrics.completed += 1
+        metrics.total_service_time += service_time
+        metrics.max_service_time = max(metrics.max_service_time, service_time)
+
+        self.in_flight_units -= ticket.cost
+        self.in_flight_by_class[ticket.request_class] -= 1
+        self._admit_waiters()
+        return service_time
+
+    @asynccontextmanager
+    async def admit(self, request_class: str, session_id: Optional[str] = None):
+        """Reserve work units for the duration of a block."""
+        ticket = await self.acquire(request_class, session_id)
+        try:
+            yield ticket.cost
+        finally:
+            self.release(ticket)
+
+    def _waiting_by_class(self) -> Dict[str, int]:
+        waiting: Dict[str, int] = {}
+        waiters = [
+            waiter
+            for queue in self._queues.values()
+            for flow in queue.flows.values()
+            for waiter in flow.waiters
+        ]
+        if self._next is not None:
+            waiters.append(self._next)
+        for ticket, future in waiters:
+            if not future.done():
+                waiting[ticket.request_class] = waiting.get(ticket.request_class, 0) + 1
+        return waiting
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return in-flight work, queue length, admission counts and per-class metrics."""
+        cpu_load, available_mb = self._sample_headroom()
+        waiting = self._waiting_by_class()
+        return {
+            "enabled": self.enabled,
+            "capacity_units": self.capacity,
+            "in_flight_units": self.in_flight_units,
+            "in_flight_by_class": dict(self.in_flight_by_class),
+            "waiting": sum(waiting.values()),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_wait_time": (
+                round(self.total_wait_time / self.admitted, 3) if self.admitted else 0.0
+            ),
+            "costs": dict(self.costs),
+            "classes": {
+                name: {
+                    "priority": self.priority_of(name),
+                    "waiting": waiting.get(name, 0),
+                    "in_flight": self.in_flight_by_class.get(name, 0),
+                    **metrics.to_dict(),
+                }
+                for name, metrics in self.metrics.items()
+            },
+            "priority_weights": {
+                priority: max(1, self.weights.get(priority, 1))
+                for priority in sorted(
+                    set(map(self.priority_of, self.metrics)) | set(self.weights)
+                )
+            },
+            "cpu_load": round(cpu_load, 3),
+            "available_memory_mb": (
+                round(available_mb) if available_mb is not None else None
+            ),
+        }
+
+
+# Global admission controller instance, holding this worker's share of the budget
+admission_controller = AdmissionController(
+    ADMISSION_WORKER_CAPACITY_UNITS,
+    ADMISSION_COSTS,
+    max_cpu_load=ADMISSION_MAX_CPU_LOAD,
+    min_free_memory_mb=ADMISSION_MIN_FREE_MEMORY_MB,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    enabled=ADMISSION_CONTROL_ENABLED,
+    priorities=ADMISSION_PRIORITIES,
+    weights=ADMISSION_PRIORITY_WEIGHTS,
+)
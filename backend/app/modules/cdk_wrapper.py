@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import hashlib
 import os
-from typing import List, Any, Union
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from typing import List, Any, Union, Dict, Iterable, Iterator, Optional
 
 import pystow
+from pystow.utils import download
 from jpype import getDefaultJVMPath
 from jpype import isJVMStarted
 from jpype import JClass
@@ -11,39 +16,224 @@ from jpype import JPackage
 from jpype import JVMNotFoundException
 from jpype import startJVM
 
+from app.config import (
+    CDK_JAR_DIR,
+    CDK_JAR_OFFLINE,
+    CDK_JAR_SHA256,
+    CDK_JVM_ASSERTIONS,
+    CDK_JVM_EXTRA_OPTIONS,
+    CDK_JVM_GC,
+    CDK_JVM_HEAP,
+    CDK_JVM_INITIAL_HEAP,
+    CDK_LAYOUT_WORKERS,
+)
+
+# Jars required on the JVM classpath and their download locations
+CDK_JAR_URLS = {
+    "cdk-2.10": "https://github.com/cdk/cdk/releases/download/cdk-2.10/cdk-2.10.jar",
+    "centres": "https://github.com/SiMolecule/centres/releases/download/1.0/centres.jar",
+}
+
+# Supported values for CDK_JVM_GC ("" leaves the choice to the JVM)
+JVM_GC_OPTIONS = {
+    "": None,
+    "g1": "-XX:+UseG1GC",
+    "parallel": "-XX:+UseParallelGC",
+    "serial": "-XX:+UseSerialGC",
+}
+
+
+def get_jvm_options() -> List[str]:
+    """Build the JVM start-up options from the CDK_JVM_* configuration.
 
-def setup_jvm():
-    try:
-        jvmPath = getDefaultJVMPath()
-    except JVMNotFoundException:
-        print("If you see this message, for some reason JPype cannot find jvm.dll.")
-        print(
-            "This indicates that the environment variable JAVA_HOME is not set properly."
+    Returns:
+        List[str]: Options passed to startJVM.
+
+    Raises:
+        ValueError: If CDK_JVM_GC names an unsupported collector.
+    """
+    if CDK_JVM_GC not in JVM_GC_OPTIONS:
+        raise ValueError(
+            f"Unsupported CDK_JVM_GC '{CDK_JVM_GC}'. "
+            f"Choose one of: {', '.join(k for k in JVM_GC_OPTIONS if k)}"
         )
-        print("You can set it or set it manually in the code")
-        jvmPath = "Define/path/or/set/JAVA_HOME/variable/properly"
 
-    print(jvmPath)
+    options = [f"-Xmx{CDK_JVM_HEAP}"]
+    if CDK_JVM_INITIAL_HEAP:
+        options.append(f"-Xms{CDK_JVM_INITIAL_HEAP}")
+    if JVM_GC_OPTIONS[CDK_JVM_GC]:
+        options.append(JVM_GC_OPTIONS[CDK_JVM_GC])
+    if CDK_JVM_ASSERTIONS:
+        options.append("-ea")
+    options.extend(CDK_JVM_EXTRA_OPTIONS.split())
+    return options
 
-    if not isJVMStarted():
-        paths = {
-            "cdk-2.10": "https://github.com/cdk/cdk/releases/download/cdk-2.10/cdk-2.10.jar",
-            "centres": "https://github.com/SiMolecule/centres/releases/download/1.0/centres.jar",
-        }
 
-        jar_paths = {
-            key: str(pystow.join("CDK_Jar")) + f"/{key}.jar" for key in paths.keys()
-        }
-        for key, url in paths.items():
-            if not os.path.exists(jar_paths[key]):
+def _sha256_of_file(path: str) -> str:
+    """Return the hex SHA-256 digest of a file, reading it in chunks."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def resolve_jar_paths() -> Dict[str, str]:
+    """Locate (and if allowed, download) the jars needed by the CDK JVM.
+
+    Jars are taken from CDK_JAR_DIR when it is set, otherwise from the pystow
+    cache. Missing jars are only downloaded when CDK_JAR_OFFLINE is false.
+    Every jar with a configured SHA-256 checksum is verified before use.
+
+    Returns:
+        Dict[str, str]: Jar name to local path.
+
+    Raises:
+        RuntimeError: If a jar is missing in offline mode or fails verification.
+    """
+    jar_dir = CDK_JAR_DIR or str(pystow.join("CDK_Jar"))
+    jar_paths = {key: os.path.join(jar_dir, f"{key}.jar") for key in CDK_JAR_URLS}
+
+    for key, url in CDK_JAR_URLS.items():
+        if not os.path.exists(jar_paths[key]):
+            if CDK_JAR_OFFLINE:
+                raise RuntimeError(
+                    f"CDK jar '{key}' not found at {jar_paths[key]} and "
+                    "CDK_JAR_OFFLINE is enabled"
+                )
+            if CDK_JAR_DIR:
+                os.makedirs(CDK_JAR_DIR, exist_ok=True)
+                download(url=url, path=jar_paths[key])
+            else:
                 pystow.ensure("CDK_Jar", url=url)
 
-        startJVM("-ea", "-Xmx4096M", classpath=[jar_paths[key] for key in jar_paths])
+        expected = CDK_JAR_SHA256.get(key)
+        if expected:
+            actual = _sha256_of_file(jar_paths[key])
+            if actual != expected:
+                raise RuntimeError(
+                    f"Checksum mismatch for CDK jar '{key}' at {jar_paths[key]}: "
+                    f"expected {expected}, got {actual}"
+                )
+
+    return jar_paths
+
+
+_jvm_lock = threading.Lock()
+
+
+def setup_jvm():
+    """Start the CDK JVM unless it is already running."""
+    if isJVMStarted():
+        return
+
+    with _jvm_lock:
+        if isJVMStarted():
+            return
+
+        try:
+            jvmPath = getDefaultJVMPath()
+        except JVMNotFoundException:
+            print("If you see this message, for some reason JPype cannot find jvm.dll.")
+            print(
+                "This indicates that the environment variable JAVA_HOME is not set properly."
+            )
+            print("You can set it or set it manually in the code")
+            jvmPath = "Define/path/or/set/JAVA_HOME/variable/properly"
+
+        print(jvmPath)
+
+        jar_paths = resolve_jar_paths()
+        jvm_options = get_jvm_options()
+        print(f"Starting CDK JVM with options: {' '.join(jvm_options)}")
+        startJVM(*jvm_options, classpath=list(jar_paths.values()))
+
+
+def requires_jvm(func):
+    """Start the CDK JVM, if needed, before calling a function using CDK classes.
+
+    The JVM is started on first use rather than at import, so importing the
+    module stays cheap and jars are only resolved when CDK is needed.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        setup_jvm()
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def get_jvm_metrics() -> Dict[str, Any]:
+    """Return heap, non-heap and garbage collector statistics of the CDK JVM.
+
+    Returns:
+        Dict[str, Any]: JVM runtime metrics, or {"started": False} before start-up.
+    """
+    if not isJVMStarted():
+        return {"started": False}
+
+    ManagementFactory = JClass("java.lang.management.ManagementFactory")
+    memory = ManagementFactory.getMemoryMXBean()
+    heap = memory.getHeapMemoryUsage()
+    non_heap = memory.getNonHeapMemoryUsage()
+    runtime = ManagementFactory.getRuntimeMXBean()
+
+    return {
+        "started": True,
+        "options": [str(arg) for arg in runtime.getInputArguments()],
+        "uptime_ms": int(runtime.getUptime()),
+        "heap": {
+            "used_bytes": int(heap.getUsed()),
+            "committed_bytes": int(heap.getCommitted()),
+            "max_bytes": int(heap.getMax()),
+        },
+        "non_heap": {
+            "used_bytes": int(non_heap.getUsed()),
+            "committed_bytes": int(non_heap.getCommitted()),
+        },
+        "garbage_collectors": [
+            {
+                "name": str(gc.getName()),
+                "collection_count": int(gc.getCollectionCount()),
+                "collection_time_ms": int(gc.getCollectionTime()),
+            }
+            for gc in ManagementFactory.getGarbageCollectorMXBeans()
+        ],
+        "threads": int(ManagementFactory.getThreadMXBean().getThreadCount()),
+    }
 
 
-setup_jvm()
 cdk_base = "org.openscience.cdk"
 
+# Per-thread reusable SDF writers and the shared structure layout pool
+_sdf_writer_local = threading.local()
+_layout_executor = ThreadPoolExecutor(
+    max_workers=CDK_LAYOUT_WORKERS, thread_name_prefix="cdk-layout"
+)
+
+# Parsed molecules kept per unique SMILES / molfile. CDK containers are
+# mutable (layout and depiction modify them), so callers always get a clone.
+CDK_PARSE_CACHE_SIZE = 1024
+_clone_lock = threading.Lock()
+
+
+def _clone_container(molecule: Any) -> Any:
+    """Return a private copy of a cached IAtomContainer."""
+    with _clone_lock:
+        return molecule.clone()
+
+
+@lru_cache(maxsize=CDK_PARSE_CACHE_SIZE)
+@requires_jvm
+def _parse_CDK_smiles(smiles: str) -> Any:
+    """Parse a SMILES string once; the result is shared and must not be modified."""
+    SCOB = JClass(cdk_base + ".silent.SilentChemObjectBuilder")
+    SmilesParser = JClass(
+        cdk_base + ".smiles.SmilesParser",
+    )(SCOB.getInstance())
+    return SmilesParser.parseSmiles(smiles)
+
 
 def get_CDK_IAtomContainer(smiles: str):
     """This function takes the input SMILES and creates a CDK IAtomContainer.
@@ -54,14 +244,10 @@ def get_CDK_IAtomContainer(smiles: str):
     Returns:
         mol (object): IAtomContainer with CDK.
     """
-    SCOB = JClass(cdk_base + ".silent.SilentChemObjectBuilder")
-    SmilesParser = JClass(
-        cdk_base + ".smiles.SmilesParser",
-    )(SCOB.getInstance())
-    molecule = SmilesParser.parseSmiles(smiles)
-    return molecule
+    return _clone_container(_parse_CDK_smiles(smiles))
 
 
+@requires_jvm
 def get_CDK_SDG(molecule: any):
     """This function takes the input IAtomContainer and Creates a.
 
@@ -82,6 +268,43 @@ def get_CDK_SDG(molecule: any):
     return molecule_
 
 
+@requires_jvm
+def _get_sdf_writer():
+    """Return this thread's reusable (StringWriter, SDFWriter) pair.
+
+    Writers are created once per thread and reused for every record, so
+    converting many molecules does not allocate a new writer per molecule.
+    """
+    writers = getattr(_sdf_writer_local, "writers", None)
+    if writers is None:
+        string_writer = JClass("java.io.StringWriter")()
+        sdf_writer = JClass(cdk_base + ".io.SDFWriter")(string_writer)
+        writers = (string_writer, sdf_writer)
+        _sdf_writer_local.writers = writers
+    return writers
+
+
+def write_sdf_record(molecule: any, V3000=False) -> str:
+    """Serialise a molecule as a single SDF record using the thread's writer.
+
+    Args:
+        molecule (IAtomContainer): molecule to write, with coordinates.
+        V3000 (bool, optional): Option to return V3000 mol. Defaults to False.
+
+    Returns:
+        str: SDF record including any molecule properties as data items.
+    """
+    string_writer, sdf_writer = _get_sdf_writer()
+    buffer = string_writer.getBuffer()
+    buffer.setLength(0)
+    sdf_writer.setAlwaysV3000(V3000)
+    sdf_writer.write(molecule)
+    sdf_writer.flush()
+    record = str(buffer.toString())
+    buffer.setLength(0)
+    return record
+
+
 def get_CDK_SDG_mol(molecule: any, V3000=False) -> str:
     """Returns a mol block string with Structure Diagram Layout for the given.
 
@@ -94,16 +317,84 @@ def get_CDK_SDG_mol(molecule: any, V3000=False) -> str:
     Returns:
         str: CDK Structure Diagram Layout mol block.
     """
-    StringW = JClass("java.io.StringWriter")()
     moleculeSDG = get_CDK_SDG(molecule)
-    SDFW = JClass(cdk_base + ".io.SDFWriter")(StringW)
-    SDFW.setAlwaysV3000(V3000)
-    SDFW.write(moleculeSDG)
-    SDFW.flush()
-    mol_str = str(StringW.toString())
-    return mol_str
+    return write_sdf_record(moleculeSDG, V3000=V3000)
+
 
+@requires_jvm
+def _smiles_to_molfile_record(
+    index: int, smiles: str, V3000: bool, sdf_properties: bool
+) -> Dict[str, Any]:
+    """Lay out one SMILES and return its molfile or the error it raised."""
+    record = {"index": index, "smiles": smiles}
+    try:
+        molecule = get_CDK_IAtomContainer(smiles)
+        if sdf_properties:
+            molecule.setProperty("index", str(index))
+            molecule.setProperty("smiles", smiles)
+        record["molfile"] = get_CDK_SDG_mol(molecule, V3000=V3000)
+        record["success"] = True
+    except Exception as e:
+        record["success"] = False
+        record["error"] = str(e)
+        if sdf_properties:
+            # Emit an empty record so SDF record positions match the input
+            SCOB = JClass(cdk_base + ".silent.SilentChemObjectBuilder")
+            placeholder = SCOB.getInstance().newAtomContainer()
+            placeholder.setProperty("index", str(index))
+            placeholder.setProperty("smiles", smiles)
+            placeholder.setProperty("error", str(e))
+            record["molfile"] = write_sdf_record(placeholder, V3000=V3000)
+    return record
+
+
+def iter_smiles_to_molfiles(
+    smiles_list: Iterable[str],
+    V3000: bool = False,
+    sdf_properties: bool = False,
+    chunk_size: int = 64,
+) -> Iterator[Dict[str, Any]]:
+    """Convert many SMILES to molfiles on the layout worker pool.
+
+    Structure diagram layout runs on a shared thread pool in chunks, and
+    results are yielded in input order as soon as each chunk is done, so
+    callers can stream them without holding the whole batch in memory.
+
+    Args:
+        smiles_list (Iterable[str]): SMILES strings to convert.
+        V3000 (bool, optional): Option to return V3000 mol. Defaults to False.
+        sdf_properties (bool, optional): Attach index/smiles/error data items to
+            each record and emit placeholder records for failures. Defaults to False.
+        chunk_size (int, optional): Records submitted to the pool at a time.
 
+    Yields:
+        Dict[str, Any]: index, smiles, success and either molfile or error.
+    """
+    chunk = []
+    for index, smiles in enumerate(smiles_list):
+        chunk.append((index, smiles))
+        if len(chunk) >= chunk_size:
+            yield from _convert_chunk(chunk, V3000, sdf_properties)
+            chunk = []
+    if chunk:
+        yield from _convert_chunk(chunk, V3000, sdf_properties)
+
+
+def _convert_chunk(
+    chunk: List[tuple], V3000: bool, sdf_properties: bool
+) -> Iterator[Dict[str, Any]]:
+    """Run one chunk of conversions on the layout pool, preserving order."""
+    futures = [
+        _layout_executor.submit(
+            _smiles_to_molfile_record, index, smiles, V3000, sdf_properties
+        )
+        for index, smiles in chunk
+    ]
+    for future in futures:
+        yield future.result()
+
+
+@requires_jvm
 def get_cip_annotation(molecule: any, add_coordinates=False) -> str:
     """Return the CIP (Cahn–Ingold–Prelog) annotations using the CDK CIP.
 
@@ -225,6 +516,7 @@ def get_cip_annotation(molecule: any, add_coordinates=False) -> str:
     return SDGMol
 
 
+@requires_jvm
 def get_CXSMILES(molecule: any) -> str:
     """Generate CXSMILES representation with 2D atom coordinates from the.
 
@@ -247,6 +539,7 @@ def get_CXSMILES(molecule: any) -> str:
     return str(CXSMILES)
 
 
+@requires_jvm
 def get_canonical_SMILES(molecule: any) -> str:
     """Generate Canonical SMILES representation with 2D atom coordinates from.
 
@@ -271,6 +564,8 @@ def read_molfile_as_cdk_mol(molfile_string: str) -> Any:
     """
     Convert a molfile string directly to a CDK molecule object with its existing coordinates.
 
+    Molfiles are parsed once and cached; every call returns a fresh copy.
+
     Args:
         molfile_string: String representation of a molfile
 
@@ -283,6 +578,24 @@ def read_molfile_as_cdk_mol(molfile_string: str) -> Any:
     if not molfile_string:
         raise ValueError("No molfile content provided")
 
+    return _clone_container(_parse_molfile_as_cdk_mol(molfile_string))
+
+
+@lru_cache(maxsize=CDK_PARSE_CACHE_SIZE)
+@requires_jvm
+def _parse_molfile_as_cdk_mol(molfile_string: str) -> Any:
+    """
+    Parse a molfile into a CDK molecule; the result is shared and must not be modified.
+
+    Args:
+        molfile_string: String representation of a molfile
+
+    Returns:
+        CDK IAtomContainer molecule with existing coordinates
+
+    Raises:
+        ValueError: If the molfile cannot be parsed
+    """
     try:
         # Import necessary Java classes
         from jpype import JClass, java
@@ -318,3 +631,27 @@ def read_molfile_as_cdk_mol(molfile_string: str) -> Any:
         return molecule
     except Exception as e:
         raise ValueError(f"Error parsing molfile: {str(e)}")
+
+
+def get_cdk_parse_cache_info() -> Dict[str, Any]:
+    """
+    Return hit/miss statistics of the parsed SMILES and molfile caches.
+
+    Returns:
+        Dictionary with statistics for each cache
+    """
+    stats = {}
+    for name, cached in (
+        ("smiles", _parse_CDK_smiles),
+        ("molfile", _parse_molfile_as_cdk_mol),
+    ):
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+        }
+    return stats
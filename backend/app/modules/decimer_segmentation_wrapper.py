@@ -13,6 +13,7 @@ from fastapi import HTTPException, status
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from decimer_segmentation import segment_chemical_structures
 from app.config import PDF_DIR, SEGMENTS_DIR
+from app.modules.state_backend import get_state_backend
 from functools import lru_cache
 import time
 from contextlib import contextmanager
@@ -22,9 +23,10 @@ import multiprocessing as mp
 segment_info_lock = threading.Lock()
 stored_segment_info = {}
 
-# Cache for PDF metadata
-pdf_cache_lock = threading.Lock()
-pdf_metadata_cache = {}
+# Cache for PDF metadata, shared by all workers through the state backend
+PDF_METADATA_KEY_PREFIX = "marcus:segments:"
+PDF_METADATA_TTL = 24 * 3600
+state_backend = get_state_backend()
 
 
 # Performance monitoring decorator
@@ -296,12 +298,12 @@ def get_complete_segments(path_to_pdf: str, collect_all: bool = True) -> Dict[st
         # Quick cache check using file hash
         pdf_hash = get_pdf_hash(path_to_pdf)
 
-        with thread_safe_dict_access(pdf_cache_lock):
-            if pdf_hash in pdf_metadata_cache:
-                cached_result = pdf_metadata_cache[pdf_hash]
-                # Verify cached files still exist
-                if os.path.exists(cached_result["segment_directory"]):
-                    return cached_result
+        cached = state_backend.get(PDF_METADATA_KEY_PREFIX + pdf_hash)
+        if cached:
+            cached_result = json.loads(cached)
+            # Verify cached files still exist
+            if os.path.exists(cached_result["segment_directory"]):
+                return cached_result
 
         # Check if segments already exist
         segments_exist_result = segments_exist(path_to_pdf)
@@ -353,8 +355,9 @@ def get_complete_segments(path_to_pdf: str, collect_all: bool = True) -> Dict[st
         }
 
         # Cache the result
-        with thread_safe_dict_access(pdf_cache_lock):
-            pdf_metadata_cache[pdf_hash] = result
+        state_backend.set(
+            PDF_METADATA_KEY_PREFIX + pdf_hash, json.dumps(result), ttl=PDF_METADATA_TTL
+        )
 
         return result
 
@@ -638,13 +641,12 @@ def load_segment_metadata(directory: str) -> List[Dict[str, Any]]:
 # Cleanup function for API shutdown
 def cleanup_caches():
     """Clean up caches and temporary files"""
-    global stored_segment_info, pdf_metadata_cache
+    global stored_segment_info
 
     with thread_safe_dict_access(segment_info_lock):
         stored_segment_info.clear()
 
-    with thread_safe_dict_access(pdf_cache_lock):
-        pdf_metadata_cache.clear()
+    state_backend.delete(*state_backend.scan_keys(PDF_METADATA_KEY_PREFIX))
 
     # Clean up old cache files
     cache_pattern = os.path.join(SEGMENTS_DIR, "cache_highlighted_*.png")
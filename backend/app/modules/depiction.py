@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import xml.etree.ElementTree as ET
 import base64
-from typing import Dict, Any, Tuple, Literal
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Literal
 from jpype import JClass
 from fastapi import HTTPException, status
 
@@ -12,6 +13,7 @@ from app.modules.cdk_wrapper import (
     get_CDK_SDG,
     get_cip_annotation,
     read_molfile_as_cdk_mol,
+    requires_jvm,
 )
 
 # Only import cairosvg if needed for PNG conversion
@@ -22,6 +24,199 @@ try:
 except ImportError:
     CAIROSVG_AVAILABLE = False
 
+# Maximum number of compiled SMARTS highlight patterns kept in memory
+SMARTS_PATTERN_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=SMARTS_PATTERN_CACHE_SIZE)
+@requires_jvm
+def get_smarts_pattern(smarts: str) -> Any:
+    """
+    Compile a SMARTS pattern with CDK, caching the compiled pattern.
+
+    The same MCS SMARTS is typically highlighted on every engine's structure in
+    turn, so compiled patterns are kept in an LRU cache keyed by SMARTS string.
+    Invalid patterns raise and are not cached.
+
+    Args:
+        smarts: SMARTS pattern string
+
+    Returns:
+        Compiled CDK SmartsPattern
+    """
+    cdk_base = "org.openscience.cdk"
+    SmartsPattern = JClass(cdk_base + ".smarts.SmartsPattern")
+    SCOB = JClass(cdk_base + ".silent.SilentChemObjectBuilder")
+    return SmartsPattern.create(smarts, SCOB.getInstance())
+
+
+def get_smarts_cache_info() -> Dict[str, Any]:
+    """
+    Return hit/miss statistics of the compiled SMARTS pattern cache.
+
+    Returns:
+        Dictionary with hits, misses, hit rate, current size and max size
+    """
+    info = get_smarts_pattern.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+
+@requires_jvm
+def _build_depiction_generator(
+    mol_size: Tuple[int, int],
+    unicolor: bool = False,
+    transparent: bool = False,
+) -> Any:
+    """
+    Create a CDK DepictionGenerator with the standard MARCUS styling.
+
+    Args:
+        mol_size: Size of the output image (width, height)
+        unicolor: Whether to use a single color for all atoms
+        transparent: Whether to use transparent background
+
+    Returns:
+        Configured CDK DepictionGenerator
+    """
+    cdk_base = "org.openscience.cdk"
+    StandardGenerator = JClass(
+        cdk_base + ".renderer.generators.standard.StandardGenerator"
+    )
+    Color = JClass("java.awt.Color")
+    UniColor = JClass(cdk_base + ".renderer.color.UniColor")
+    CDK2DAtomColors = JClass(cdk_base + ".renderer.color.CDK2DAtomColors")()
+
+    # Configure the depiction generator
+    if unicolor:
+        depiction_generator = (
+            JClass(cdk_base + ".depict.DepictionGenerator")()
+            .withSize(mol_size[0], mol_size[1])
+            .withParam(StandardGenerator.StrokeRatio.class_, 1.0)
+            .withAnnotationColor(Color.BLACK)
+            .withParam(StandardGenerator.AtomColor.class_, UniColor(Color.BLACK))
+            .withFillToFit()
+        )
+    else:
+        depiction_generator = (
+            JClass(cdk_base + ".depict.DepictionGenerator")()
+            .withAtomColors(CDK2DAtomColors)
+            .withSize(mol_size[0], mol_size[1])
+            .withParam(StandardGenerator.StrokeRatio.class_, 1.0)
+            .withFillToFit()
+        )
+
+    # Set background color
+    if transparent:
+        # Use transparent background
+        depiction_generator = depiction_generator.withBackgroundColor(None)
+    else:
+        # Use white background
+        depiction_generator = depiction_generator.withBackgroundColor(Color.WHITE)
+
+    return depiction_generator
+
+
+@requires_jvm
+def _prepare_depiction_molecule(
+    molecule: Any,
+    rotate: float = 0,
+    kekulize: bool = False,
+    cip: bool = True,
+    add_coords: bool = True,
+) -> Any:
+    """
+    Lay out, annotate, kekulize and rotate a molecule ready for depiction.
+
+    Args:
+        molecule: CDK IAtomContainer molecule object
+        rotate: Rotation angle in degrees
+        kekulize: Whether to kekulize the molecule
+        cip: Whether to add CIP stereochemistry annotations
+        add_coords: Whether to generate 2D coordinates if not present
+
+    Returns:
+        CDK IAtomContainer ready to be passed to a DepictionGenerator
+
+    Raises:
+        ValueError: If molecule cannot be processed
+    """
+    cdk_base = "org.openscience.cdk"
+    Kekulization = JClass(cdk_base + ".aromaticity.Kekulization")
+
+    if add_coords:
+        sdg_mol = get_CDK_SDG(molecule)
+    else:
+        # Use existing coordinates if available
+        sdg_mol = molecule
+
+    # Apply CIP stereochemistry annotations if requested
+    if cip:
+        sdg_mol = get_cip_annotation(sdg_mol, add_coordinates=add_coords)
+
+    if not sdg_mol:
+        raise ValueError("Failed to process molecule for depiction")
+
+    # Apply kekulization if requested
+    if kekulize:
+        try:
+            Kekulization.kekulize(sdg_mol)
+        except Exception as e:
+            print(f"Kekulization error: {str(e)}")
+    # Apply rotation if requested
+    if rotate != 0:
+        point = JClass(cdk_base + ".geometry.GeometryTools").get2DCenter(sdg_mol)
+        JClass(cdk_base + ".geometry.GeometryTools").rotate(
+            sdg_mol,
+            point,
+            (rotate * JClass("java.lang.Math").PI / 180.0),
+        )
+
+    return sdg_mol
+
+
+@requires_jvm
+def _apply_highlight(depiction_generator: Any, molecules: List[Any], highlight: str):
+    """
+    Highlight every match of a SMARTS pattern in the given molecules.
+
+    Highlighting errors are logged and the unmodified generator is returned,
+    so a bad pattern never prevents the depiction itself.
+
+    Args:
+        depiction_generator: CDK DepictionGenerator to configure
+        molecules: CDK IAtomContainers that will be depicted
+        highlight: SMARTS pattern to highlight
+
+    Returns:
+        DepictionGenerator with the highlight applied
+    """
+    cdk_base = "org.openscience.cdk"
+    Color = JClass("java.awt.Color")
+    SmartsPattern = JClass(cdk_base + ".smarts.SmartsPattern")
+
+    try:
+        tmp_pattern = get_smarts_pattern(highlight.strip())
+        light_blue = Color(173, 216, 230)
+        for sdg_mol in molecules:
+            SmartsPattern.prepare(sdg_mol)
+            tmp_mappings = tmp_pattern.matchAll(sdg_mol)
+            tmp_substructures = tmp_mappings.toSubstructures()
+            depiction_generator = depiction_generator.withHighlight(
+                tmp_substructures, light_blue
+            )
+        depiction_generator = depiction_generator.withOuterGlowHighlight()
+    except Exception as e:
+        print(f"Highlighting error: {str(e)}")
+
+    return depiction_generator
+
 
 def get_cdk_depiction(
     molecule: Any,
@@ -55,85 +250,19 @@ def get_cdk_depiction(
         ValueError: If molecule cannot be processed
     """
     try:
-        cdk_base = "org.openscience.cdk"
-        StandardGenerator = JClass(
-            cdk_base + ".renderer.generators.standard.StandardGenerator"
+        depiction_generator = _build_depiction_generator(
+            mol_size, unicolor=unicolor, transparent=transparent
         )
-        Color = JClass("java.awt.Color")
-        UniColor = JClass(cdk_base + ".renderer.color.UniColor")
-        CDK2DAtomColors = JClass(cdk_base + ".renderer.color.CDK2DAtomColors")()
-        Kekulization = JClass(cdk_base + ".aromaticity.Kekulization")
-        SmartsPattern = JClass(cdk_base + ".smarts.SmartsPattern")
-        SCOB = JClass(cdk_base + ".silent.SilentChemObjectBuilder")
-
-        # Configure the depiction generator
-        if unicolor:
-            depiction_generator = (
-                JClass(cdk_base + ".depict.DepictionGenerator")()
-                .withSize(mol_size[0], mol_size[1])
-                .withParam(StandardGenerator.StrokeRatio.class_, 1.0)
-                .withAnnotationColor(Color.BLACK)
-                .withParam(StandardGenerator.AtomColor.class_, UniColor(Color.BLACK))
-                .withFillToFit()
-            )
-        else:
-            depiction_generator = (
-                JClass(cdk_base + ".depict.DepictionGenerator")()
-                .withAtomColors(CDK2DAtomColors)
-                .withSize(mol_size[0], mol_size[1])
-                .withParam(StandardGenerator.StrokeRatio.class_, 1.0)
-                .withFillToFit()
-            )
-
-        # Set background color
-        if transparent:
-            # Use transparent background
-            depiction_generator = depiction_generator.withBackgroundColor(None)
-        else:
-            # Use white background
-            depiction_generator = depiction_generator.withBackgroundColor(Color.WHITE)
 
-        if add_coords:
-            sdg_mol = get_CDK_SDG(molecule)
-        else:
-            # Use existing coordinates if available
-            sdg_mol = molecule
-
-        # Apply CIP stereochemistry annotations if requested
-        if cip:
-            sdg_mol = get_cip_annotation(sdg_mol, add_coordinates=add_coords)
-
-        if not sdg_mol:
-            raise ValueError("Failed to process molecule for depiction")
-
-        # Apply kekulization if requested
-        if kekulize:
-            try:
-                Kekulization.kekulize(sdg_mol)
-            except Exception as e:
-                print(f"Kekulization error: {str(e)}")
-        # Apply rotation if requested
-        if rotate != 0:
-            point = JClass(cdk_base + ".geometry.GeometryTools").get2DCenter(sdg_mol)
-            JClass(cdk_base + ".geometry.GeometryTools").rotate(
-                sdg_mol,
-                point,
-                (rotate * JClass("java.lang.Math").PI / 180.0),
-            )
+        sdg_mol = _prepare_depiction_molecule(
+            molecule, rotate=rotate, kekulize=kekulize, cip=cip, add_coords=add_coords
+        )
 
         # Apply highlighting if requested
         if highlight and highlight.strip():
-            try:
-                tmp_pattern = SmartsPattern.create(highlight, SCOB.getInstance())
-                SmartsPattern.prepare(sdg_mol)
-                tmp_mappings = tmp_pattern.matchAll(sdg_mol)
-                tmp_substructures = tmp_mappings.toSubstructures()
-                light_blue = Color(173, 216, 230)
-                depiction_generator = depiction_generator.withHighlight(
-                    tmp_substructures, light_blue
-                ).withOuterGlowHighlight()
-            except Exception as e:
-                print(f"Highlighting error: {str(e)}")
+            depiction_generator = _apply_highlight(
+                depiction_generator, [sdg_mol], highlight
+            )
 
         # Generate SVG
         mol_image_svg = depiction_generator.depict(sdg_mol).toSvgStr("px").getBytes()
@@ -314,3 +443,229 @@ def generate_depiction(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating depiction: {str(e)}",
         )
+
+
+def _load_grid_molecule(
+    smiles: Optional[str] = None,
+    molfile: Optional[str] = None,
+    use_molfile_directly: bool = False,
+) -> Tuple[Any, bool, str]:
+    """
+    Load a single grid entry as a CDK molecule.
+
+    Args:
+        smiles: SMILES string (optional if molfile is provided)
+        molfile: Molfile string (optional if SMILES is provided)
+        use_molfile_directly: Whether to keep the molfile coordinates
+
+    Returns:
+        Tuple of (CDK molecule, whether coordinates must be generated, source type)
+
+    Raises:
+        ValueError: If neither input can be parsed
+    """
+    if molfile and (use_molfile_directly or not smiles):
+        try:
+            return read_molfile_as_cdk_mol(molfile), False, "molfile_with_coords"
+        except Exception as e:
+            if not smiles:
+                raise ValueError(
+                    f"Failed to parse molfile and no SMILES fallback available: {str(e)}"
+                )
+            return get_CDK_IAtomContainer(smiles), True, "smiles_fallback"
+
+    if not smiles:
+        raise ValueError("Either SMILES or molfile must be provided")
+
+    return get_CDK_IAtomContainer(smiles), True, "smiles_generated"
+
+
+@requires_jvm
+def get_cdk_grid_depiction(
+    molecules: List[Any],
+    rows: int,
+    columns: int,
+    cell_size: Tuple[int, int] = (256, 256),
+    highlight: str = "",
+    unicolor: bool = False,
+    transparent: bool = False,
+) -> str:
+    """
+    Render prepared molecules into a single grid SVG using CDK's grid depiction.
+
+    Args:
+        molecules: CDK IAtomContainers already prepared for depiction
+        rows: Number of grid rows
+        columns: Number of grid columns
+        cell_size: Size of each grid cell (width, height)
+        highlight: SMARTS pattern to highlight in every molecule
+        unicolor: Whether to use a single color for all atoms
+        transparent: Whether to use transparent background
+
+    Returns:
+        SVG string containing the whole grid
+
+    Raises:
+        ValueError: If the grid cannot be rendered
+    """
+    try:
+        depiction_generator = _build_depiction_generator(
+            (cell_size[0] * columns, cell_size[1] * rows),
+            unicolor=unicolor,
+            transparent=transparent,
+        )
+
+        if highlight and highlight.strip():
+            depiction_generator = _apply_highlight(
+                depiction_generator, molecules, highlight
+            )
+
+        mol_list = JClass("java.util.ArrayList")()
+        for mol in molecules:
+            mol_list.add(mol)
+
+        grid_svg = (
+            depiction_generator.depict(mol_list, rows, columns)
+            .toSvgStr("px")
+            .getBytes()
+        )
+
+        return ET.tostring(ET.fromstring(grid_svg), encoding="unicode")
+
+    except Exception as e:
+        raise ValueError(f"Error generating CDK grid depiction: {str(e)}")
+
+
+@requires_jvm
+def generate_grid_depiction(
+    structures: List[Dict[str, Any]],
+    columns: int = 4,
+    cell_size: Tuple[int, int] = (256, 256),
+    kekulize: bool = True,
+    cip: bool = True,
+    unicolor: bool = False,
+    highlight: str = "",
+    transparent: bool = False,
+    format: Literal["svg", "png", "base64"] = "svg",
+) -> Dict[str, Any]:
+    """
+    Generate one grid depiction for many structures plus a per-cell index.
+
+    Structures that fail to parse or lay out are rendered as empty cells and
+    reported with ``success: False`` so cell indices always match the input order.
+
+    Cell rectangles tile the image evenly and ignore CDK's grid margin and
+    padding, so they approximate where each structure is drawn.
+
+    Args:
+        structures: Dicts with ``smiles``, ``molfile`` and ``use_molfile_directly`` keys
+        columns: Maximum number of grid columns
+        cell_size: Size of each grid cell (width, height)
+        kekulize: Whether to kekulize the molecules
+        cip: Whether to add CIP stereochemistry annotations
+        unicolor: Whether to use a single color for all atoms
+        highlight: SMARTS pattern to highlight in every molecule
+        transparent: Whether to use transparent background
+        format: Output format (svg, png, or base64-encoded png)
+
+    Returns:
+        Dictionary containing the grid depiction, its dimensions and the cell index
+
+    Raises:
+        HTTPException: If input or parameters are invalid
+    """
+    if not structures:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one structure must be provided",
+        )
+
+    columns = max(1, min(columns, len(structures)))
+    rows = (len(structures) + columns - 1) // columns
+    cell_width, cell_height = cell_size
+
+    try:
+        SCOB = JClass("org.openscience.cdk.silent.SilentChemObjectBuilder")
+
+        molecules = []
+        cells = []
+        for index, structure in enumerate(structures):
+            row, column = divmod(index, columns)
+            # Even tiling; CDK scales its margin and padding into the same area
+            cell = {
+                "index": index,
+                "row": row,
+                "column": column,
+                "x": column * cell_width,
+                "y": row * cell_height,
+                "width": cell_width,
+                "height": cell_height,
+                "smiles": structure.get("smiles"),
+            }
+            try:
+                cdk_molecule, add_coords, source_type = _load_grid_molecule(
+                    smiles=structure.get("smiles"),
+                    molfile=structure.get("molfile"),
+                    use_molfile_directly=structure.get("use_molfile_directly", False),
+                )
+                molecules.append(
+                    _prepare_depiction_molecule(
+                        cdk_molecule,
+                        kekulize=kekulize,
+                        cip=cip,
+                        add_coords=add_coords,
+                    )
+                )
+                cell.update({"success": True, "source_type": source_type})
+            except Exception as e:
+                # Keep the slot so the grid layout matches the input order
+                molecules.append(SCOB.getInstance().newAtomContainer())
+                cell.update({"success": False, "error": str(e)})
+            cells.append(cell)
+
+        svg_string = get_cdk_grid_depiction(
+            molecules,
+            rows=rows,
+            columns=columns,
+            cell_size=cell_size,
+            highlight=highlight,
+            unicolor=unicolor,
+            transparent=transparent,
+        )
+
+        result = {
+            "format": "svg",
+            "engine": "cdk",
+            "depiction": svg_string,
+            "width": cell_width * columns,
+            "height": cell_height * rows,
+            "rows": rows,
+            "columns": columns,
+            "cells": cells,
+        }
+
+        if format == "svg":
+            return result
+
+        if not CAIROSVG_AVAILABLE:
+            result["warning"] = "cairosvg not available, returning SVG instead"
+            return result
+
+        try:
+            png_data = cairosvg.svg2png(bytestring=svg_string.encode())
+        except Exception as e:
+            result["warning"] = (
+                f"PNG conversion failed: {str(e)}, returning SVG instead"
+            )
+            return result
+
+        # The cell index is JSON, so PNG grids are always base64-encoded
+        result["format"] = "base64"
+        result["depiction"] = base64.b64encode(png_data).decode()
+        return result
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating grid depiction: {str(e)}",
+        )
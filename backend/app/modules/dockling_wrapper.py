@@ -11,6 +11,7 @@ from docling.document_converter import (
 )
 from PyPDF2 import PdfReader, PdfWriter
 from app.config import PDF_DIR
+from app.security.file_validator import stream_upload
 
 artifacts_path = "/Users/kohulanrajan/.cache/docling/models"
 
@@ -420,9 +421,7 @@ async def extract_pdf_text(
             pass
         else:
             # Save the uploaded file with original name
-            with open(file_path, "wb") as buffer:
-                content = await pdf_file.read()
-                buffer.write(content)
+            await stream_upload(pdf_file, file_path)
 
         # Process the PDF file
         json_data = get_converted_document(file_path, number_of_pages=pages)
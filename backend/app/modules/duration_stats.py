@@ -0,0 +1,136 @@
+"""
+Rolling duration statistics for MARCUS.
+Keeps an exponentially weighted moving average and a window of recent samples
+for quantiles, in a form that serialises to a short JSON value, so workers
+sharing a state backend build one set of statistics together.
+"""
+
+import json
+import math
+from bisect import bisect_right
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Weight of the newest sample in the moving average
+EWMA_ALPHA = 0.2
+# Recent samples kept for quantiles
+SAMPLE_WINDOW = 200
+REPORTED_QUANTILES = (0.5, 0.9, 0.95)
+
+
+class DurationStats:
+    """
+    EWMA and quantiles of a stream of durations in seconds.
+
+    The average follows changes in the workload within a few samples, while
+    the quantiles of the last SAMPLE_WINDOW samples describe the spread.
+    """
+
+    def __init__(
+        self,
+        alpha: float = EWMA_ALPHA,
+        window: int = SAMPLE_WINDOW,
+        default: Optional[float] = None,
+    ):
+        """
+        Initialize empty statistics.
+
+        Args:
+            alpha: Weight of the newest sample in the moving average
+            window: Number of recent samples kept for quantiles
+            default: Duration assumed before any sample has been recorded
+        """
+        self.alpha = alpha
+        self.default = default
+        self.count = 0
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._sorted: Optional[List[float]] = None
+
+    def add(self, duration: float):
+        """Record one duration."""
+        duration = max(0.0, round(duration, 3))
+        self.count += 1
+        if self.ewma is None:
+            self.ewma = duration
+        else:
+            self.ewma += self.alpha * (duration - self.ewma)
+        self.samples.append(duration)
+        self._sorted = None
+
+    @property
+    def mean(self) -> Optional[float]:
+        """Moving average, or the default before any sample was recorded."""
+        return self.ewma if self.ewma is not None else self.default
+
+    def _sorted_samples(self) -> List[float]:
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return self._sorted
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the q-quantile of the recent samples, interpolating linearly."""
+        samples = self._sorted_samples()
+        if not samples:
+            return self.default
+        position = q * (len(samples) - 1)
+        lower = math.floor(position)
+        upper = min(lower + 1, len(samples) - 1)
+        return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+    def expected_remaining(self, elapsed: float) -> Optional[float]:
+        """
+        Return the expected time left of a duration that has lasted elapsed.
+
+        Uses the recent samples longer than elapsed, so long-running items
+        are not expected to end just because the average has passed. Falls
+        back to the moving average when no sample is that long.
+        """
+        samples = self._sorted_samples()
+        longer = samples[bisect_right(samples, elapsed) :]
+        if longer:
+            return sum(longer) / len(longer) - elapsed
+        mean = self.mean
+        if mean is None:
+            return None
+        return max(0.0, mean - elapsed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the count, moving average and quantiles for reporting."""
+        summary = {
+            "count": self.count,
+            "ewma": _round(self.ewma),
+        }
+        for q in REPORTED_QUANTILES:
+            summary[f"p{round(q * 100)}"] = _round(
+                self.quantile(q) if self.samples else None
+            )
+        return summary
+
+    def dumps(self) -> str:
+        """Serialise the statistics for a state backend."""
+        return json.dumps(
+            {"count": self.count, "ewma": self.ewma, "samples": list(self.samples)},
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(
+        cls,
+        value: Optional[str],
+        alpha: float = EWMA_ALPHA,
+        window: int = SAMPLE_WINDOW,
+        default: Optional[float] = None,
+    ) -> "DurationStats":
+        """Restore statistics written by dumps(); None gives empty statistics."""
+        stats = cls(alpha=alpha, window=window, default=default)
+        if value:
+            data = json.loads(value)
+            stats.count = data["count"]
+            stats.ewma = data["ewma"]
+            stats.samples.extend(data["samples"])
+        return stats
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
@@ -0,0 +1,96 @@
+"""
+Deadline-ordered expiry scheduling for MARCUS.
+Keeps the keys of expiring items in a min-heap by deadline, so cleanup only
+touches the items that are due instead of scanning everything tracked.
+"""
+
+import heapq
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+# Rebuild the heap once stale entries outnumber live keys by this factor
+COMPACT_FACTOR = 2
+COMPACT_MIN_ENTRIES = 64
+
+
+class ExpiryScheduler:
+    """
+    Tracks one deadline per key and returns the keys whose deadline passed.
+
+    Heap entries are invalidated lazily. Cancelling a key only drops it from
+    the deadline map, and moving a deadline later, as every activity update
+    does, only updates the map; the old entry is moved once it reaches the
+    top of the heap. Scheduling is O(log n) at worst and pop_expired costs
+    O(log n) per due or moved entry, independent of the number of keys.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._deadlines: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = 0  # Tie-breaker, so keys themselves are never compared
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def _push(self, deadline: float, key: Hashable):
+        self._counter += 1
+        heapq.heappush(self._heap, (deadline, self._counter, key))
+
+    def _compact(self):
+        """Drop stale heap entries once they dominate the heap."""
+        if len(self._heap) <= max(
+            COMPACT_MIN_ENTRIES, COMPACT_FACTOR * len(self._deadlines)
+        ):
+            return
+        self._heap = []
+        for key, deadline in self._deadlines.items():
+            self._counter += 1
+            self._heap.append((deadline, self._counter, key))
+        heapq.heapify(self._heap)
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Set the deadline of a key, replacing any previous deadline."""
+        with self._lock:
+            previous = self._deadlines.get(key)
+            self._deadlines[key] = deadline
+            # A later deadline is picked up when the earlier entry surfaces
+            if previous is None or deadline < previous:
+                self._push(deadline, key)
+                self._compact()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Stop tracking a key; returns True if it was scheduled."""
+        with self._lock:
+            return self._deadlines.pop(key, None) is not None
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        with self._lock:
+            return self._deadlines.get(key)
+
+    def pop_expired(self, now: Optional[float] = None) -> List[Hashable]:
+        """Remove and return every key whose deadline is at or before now."""
+        now = self.clock() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, key = heapq.heappop(self._heap)
+                deadline = self._deadlines.get(key)
+                if deadline is None:
+                    continue  # Cancelled or already expired
+                if deadline <= now:
+                    del self._deadlines[key]
+                    expired.append(key)
+                else:
+                    self._push(deadline, key)  # Postponed since it was queued
+        return expired
+
+    def clear(self):
+        with self._lock:
+            self._deadlines.clear()
+            self._heap.clear()
@@ -0,0 +1,305 @@
+"""
+Indexed store of OpenAI extraction results for MARCUS.
+Keeps every saved extraction in a local SQLite database with metadata columns,
+so results can be listed, filtered and paginated without a directory scan.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import EXTRACTION_STORE_PATH, UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+# Directory where extraction results used to be written as JSON files
+LEGACY_RESULTS_DIR = os.path.join(UPLOAD_DIR, "openai_results")
+
+# Length of the input text preview returned by listings
+PREVIEW_LENGTH = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    filename TEXT PRIMARY KEY,
+    text_hash TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    created_time REAL NOT NULL,
+    input_text TEXT NOT NULL,
+    input_text_preview TEXT NOT NULL,
+    extracted_json TEXT NOT NULL,
+    positions TEXT NOT NULL,
+    entity_count INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_extractions_created ON extractions (created_time);
+CREATE INDEX IF NOT EXISTS idx_extractions_hash ON extractions (text_hash);
+CREATE TABLE IF NOT EXISTS extraction_labels (
+    filename TEXT NOT NULL,
+    label TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (label, filename)
+);
+CREATE INDEX IF NOT EXISTS idx_extraction_labels_file ON extraction_labels (filename);
+"""
+
+_LISTING_COLUMNS = (
+    "filename, text_hash, timestamp, created_time, input_text_preview, "
+    "entity_count, size_bytes"
+)
+
+
+def extraction_filename(input_text: str) -> str:
+    """
+    Return the key of an extraction, based on a hash of its input text.
+
+    Args:
+        input_text: The original text input
+
+    Returns:
+        Key in the ``extraction_<hash>.json`` form used by earlier file storage
+    """
+    text_hash = hashlib.md5(input_text.encode()).hexdigest()[:8]
+    return f"extraction_{text_hash}.json"
+
+
+def _preview(input_text: str) -> str:
+    """Shorten the input text for listings."""
+    if len(input_text) > PREVIEW_LENGTH:
+        return input_text[:PREVIEW_LENGTH] + "..."
+    return input_text
+
+
+def _label_counts(positions: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Count located entities per label."""
+    counts: Dict[str, int] = {}
+    for position in positions:
+        label = position.get("label")
+        if label is not None:
+            counts[label] = counts.get(label, 0) + 1
+    return counts
+
+
+class ExtractionStore:
+    """SQLite-backed store of extraction results keyed by filename."""
+
+    def __init__(self, db_path: str, legacy_dir: Optional[str] = None):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        if legacy_dir:
+            self._import_legacy_files(legacy_dir)
+
+    def _import_legacy_files(self, legacy_dir: str):
+        """Import extraction JSON files written before the store existed, once."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM extractions LIMIT 1").fetchone():
+                return
+        if not os.path.isdir(legacy_dir):
+            return
+
+        imported = 0
+        for filename in os.listdir(legacy_dir):
+            if not (filename.startswith("extraction_") and filename.endswith(".json")):
+                continue
+            file_path = os.path.join(legacy_dir, filename)
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._insert(
+                    filename,
+                    data.get("input_text", ""),
+                    data.get("extracted_json"),
+                    data.get("positions") or [],
+                    timestamp=data.get("timestamp"),
+                    created_time=os.stat(file_path).st_ctime,
+                )
+                imported += 1
+            except Exception as e:
+                logger.warning(f"Could not import extraction file {filename}: {e}")
+        if imported:
+            logger.info(f"Imported {imported} extraction files into {self.db_path}")
+
+    def _insert(
+        self,
+        filename: str,
+        input_text: str,
+        extracted_json: Any,
+        positions: List[Dict[str, Any]],
+        timestamp: Optional[str] = None,
+        created_time: Optional[float] = None,
+    ):
+        """Insert or replace one extraction and its label counts."""
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        extracted = json.dumps(extracted_json, ensure_ascii=False)
+        positions_json = json.dumps(positions, ensure_ascii=False)
+        counts = _label_counts(positions)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (filename, text_hash, timestamp, "
+                "created_time, input_text, input_text_preview, extracted_json, "
+                "positions, entity_count, size_bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    filename,
+                    hashlib.sha256(input_text.encode()).hexdigest(),
+                    timestamp,
+                    time.time() if created_time is None else created_time,
+                    input_text,
+                    _preview(input_text),
+                    extracted,
+                    positions_json,
+                    len(positions),
+                    len(input_text.encode()) + len(extracted) + len(positions_json),
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM extraction_labels WHERE filename = ?", (filename,)
+            )
+            self._conn.executemany(
+                "INSERT INTO extraction_labels (filename, label, count) VALUES (?, ?, ?)",
+                [(filename, label, count) for label, count in counts.items()],
+            )
+            self._conn.commit()
+
+    def save(
+        self, input_text: str, extracted_json: Any, positions: List[Dict[str, Any]]
+    ) -> str:
+        """
+        Save an extraction result, keeping an existing result for the same text.
+
+        Args:
+            input_text: The original text input
+            extracted_json: The extracted JSON result
+            positions: The extracted positions
+
+        Returns:
+            Key of the saved result
+        """
+        filename = extraction_filename(input_text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text_hash FROM extractions WHERE filename = ?", (filename,)
+            ).fetchone()
+        if row and row["text_hash"] == hashlib.sha256(input_text.encode()).hexdigest():
+            return filename
+
+        self._insert(filename, input_text, extracted_json, positions)
+        return filename
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a saved extraction in the same form as the earlier JSON files.
+
+        Args:
+            filename: Key of the extraction
+
+        Returns:
+            Dictionary with timestamp, input_text, extracted_json and positions,
+            or None if no extraction has this key
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT timestamp, input_text, extracted_json, positions "
+                "FROM extractions WHERE filename = ?",
+                (filename,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "timestamp": row["timestamp"],
+            "input_text": row["input_text"],
+            "extracted_json": json.loads(row["extracted_json"]),
+            "positions": json.loads(row["positions"]),
+        }
+
+    def list(
+        self,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        label: Optional[str] = None,
+        min_entities: Optional[int] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        List saved extractions, newest first.
+
+        Args:
+            limit: Maximum number of results, or None for all of them
+            offset: Number of results to skip
+            since: Only results created at or after this Unix time
+            until: Only results created before this Unix time
+            label: Only results with at least one entity of this label
+            min_entities: Only results with at least this many located entities
+            search: Only results whose input text contains this string
+
+        Returns:
+            Tuple of (results, total number of matching results)
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("created_time >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_time < ?")
+            params.append(until)
+        if label:
+            conditions.append(
+                "filename IN (SELECT filename FROM extraction_labels WHERE label = ?)"
+            )
+            params.append(label)
+        if min_entities is not None:
+            conditions.append("entity_count >= ?")
+            params.append(min_entities)
+        if search:
+            conditions.append("instr(input_text, ?) > 0")
+            params.append(search)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # SQLite treats a negative limit as no limit
+        page = "ORDER BY created_time DESC, filename LIMIT ? OFFSET ?"
+        page_params = [*params, -1 if limit is None else limit, offset]
+
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM extractions {where}", params
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {_LISTING_COLUMNS} FROM extractions {where} {page}",
+                page_params,
+            ).fetchall()
+            # Joined on the page rather than listing filenames, so unbounded
+            # pages stay within SQLite's limit on query parameters
+            label_rows = self._conn.execute(
+                "SELECT filename, label, count FROM extraction_labels "
+                f"JOIN (SELECT filename FROM extractions {where} {page}) "
+                "USING (filename)",
+                page_params,
+            ).fetchall()
+
+        label_counts: Dict[str, Dict[str, int]] = {}
+        for row in label_rows:
+            label_counts.setdefault(row["filename"], {})[row["label"]] = row["count"]
+
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["label_counts"] = label_counts.get(row["filename"], {})
+            results.append(result)
+        return results, total
+
+
+# Global extraction store instance
+extraction_store = ExtractionStore(EXTRACTION_STORE_PATH, legacy_dir=LEGACY_RESULTS_DIR)
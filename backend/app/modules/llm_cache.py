@@ -0,0 +1,200 @@
+"""
+Persistent LLM response cache for MARCUS.
+Stores completions in a local SQLite database keyed by a hash of everything
+that determines the answer, so re-annotating a text costs no API call.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.config import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_DAYS,
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at);
+"""
+
+# Cache hits whose last use is written at most this many at a time
+TOUCH_BATCH_SIZE = 256
+
+
+def make_cache_key(
+    system_prompt: str, user_message: str, model: str, temperature: float
+) -> str:
+    """
+    Hash the inputs that determine an LLM response.
+
+    Args:
+        system_prompt: System message sent with the request
+        user_message: Text sent as the user message
+        model: Model id the request is sent to
+        temperature: Sampling temperature
+
+    Returns:
+        Hex SHA-256 digest of the inputs
+    """
+    payload = json.dumps(
+        [system_prompt, user_message, model, temperature], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed read-through cache with LRU eviction and optional TTL.
+
+    Cache hits only read from the database. Their last use is kept in memory
+    and written in one transaction by the next set(), or once TOUCH_BATCH_SIZE
+    hits have accumulated, so a hit does not wait for a commit.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 10000,
+        ttl_days: float = 0,
+        enabled: bool = True,
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_days * 86400
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # Last use of cache hits not yet written, by key
+        self._pending_touches: Dict[str, float] = {}
+
+    def _flush_touches(self):
+        """Write the last use of recent cache hits; the lock must be held."""
+        if not self._pending_touches:
+            return
+        self._conn.executemany(
+            "UPDATE responses SET last_used_at = ? WHERE key = ?",
+            [(used_at, key) for key, used_at in self._pending_touches.items()],
+        )
+        self._pending_touches.clear()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return a cached response and mark it as recently used.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            Cached response, or None if missing, expired or the cache is disabled
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            self._pending_touches[key] = now
+            if len(self._pending_touches) >= TOUCH_BATCH_SIZE:
+                self._flush_touches()
+                self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, model: str, response: str):
+        """
+        Store a response, evicting the least recently used entries over the limit.
+
+        Args:
+            key: Cache key from make_cache_key
+            model: Model id that produced the response
+            response: Response content
+        """
+        if not self.enabled or not response:
+            return
+
+        now = time.time()
+        with self._lock:
+            # Eviction below needs the last use of recent hits
+            self._flush_touches()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, model, response, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            if self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (now - self.ttl_seconds,),
+                )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> int:
+        """
+        Remove all cached responses.
+
+        Returns:
+            Number of removed entries
+        """
+        with self._lock:
+            self._pending_touches.clear()
+            removed = self._conn.execute("DELETE FROM responses").rowcount
+            self._conn.commit()
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counts and the number of cached responses."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "size": size,
+            "max_size": self.max_entries,
+            "ttl_days": self.ttl_seconds / 86400,
+            "db_path": self.db_path,
+        }
+
+
+# Global LLM response cache instance
+llm_cache = LLMResponseCache(
+    LLM_CACHE_PATH,
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    ttl_days=LLM_CACHE_TTL_DAYS,
+    enabled=LLM_CACHE_ENABLED,
+)
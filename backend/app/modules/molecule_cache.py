@@ -0,0 +1,157 @@
+"""
+Shared molecule canonicalisation cache for MARCUS.
+Parses each unique SMILES or molfile once and keeps a compact canonical form
+(canonical SMILES, InChIKey and packed fingerprints) for the similarity, MCS,
+structure index and OCSR post-processing code paths.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+# ECFP4 fingerprint settings used for all structure comparisons
+MORGAN_RADIUS = 2
+FINGERPRINT_BITS = 2048
+
+# Maximum number of parsed inputs kept in memory; molfiles are larger keys
+SMILES_CACHE_SIZE = 8192
+MOLFILE_CACHE_SIZE = 2048
+
+
+@dataclass(frozen=True)
+class CanonicalStructure:
+    """Compact, immutable canonical form of a parsed structure."""
+
+    canonical_smiles: str
+    inchikey: Optional[str]
+    morgan_fp: bytes  # Packed ECFP4 bits, FINGERPRINT_BITS // 8 bytes
+    pattern_fp: bytes  # Packed RDKit pattern fingerprint for substructure screening
+    num_atoms: int
+    num_bonds: int
+    num_fragments: int
+
+    def to_mol(self) -> Any:
+        """Return a fresh RDKit molecule built from the canonical SMILES."""
+        return Chem.MolFromSmiles(self.canonical_smiles)
+
+
+def pack_bitvect(fp: Any) -> bytes:
+    """Pack an RDKit bit vector into bytes, 8 bits per byte."""
+    bits = np.frombuffer(fp.ToBitString().encode("ascii"), dtype=np.uint8) - ord("0")
+    return np.packbits(bits).tobytes()
+
+
+def _inchikey(mol: Any) -> Optional[str]:
+    """Return the InChIKey of a molecule, or None if InChI is unavailable."""
+    try:
+        return Chem.MolToInchiKey(mol) or None
+    except Exception:
+        return None
+
+
+def _build_structure(mol: Any) -> CanonicalStructure:
+    """Compute the canonical form of a sanitised RDKit molecule."""
+    return CanonicalStructure(
+        canonical_smiles=Chem.MolToSmiles(mol),
+        inchikey=_inchikey(mol),
+        morgan_fp=pack_bitvect(
+            AllChem.GetMorganFingerprintAsBitVect(
+                mol, MORGAN_RADIUS, nBits=FINGERPRINT_BITS
+            )
+        ),
+        pattern_fp=pack_bitvect(Chem.PatternFingerprint(mol, fpSize=FINGERPRINT_BITS)),
+        num_atoms=mol.GetNumAtoms(),
+        num_bonds=mol.GetNumBonds(),
+        num_fragments=len(Chem.GetMolFrags(mol)),
+    )
+
+
+@lru_cache(maxsize=SMILES_CACHE_SIZE)
+def get_structure_from_smiles(smiles: str) -> Optional[CanonicalStructure]:
+    """
+    Parse a SMILES string once and return its canonical form.
+
+    Args:
+        smiles: Input SMILES string
+
+    Returns:
+        CanonicalStructure, or None if the SMILES cannot be parsed
+    """
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    return _build_structure(mol)
+
+
+@lru_cache(maxsize=MOLFILE_CACHE_SIZE)
+def get_structure_from_molfile(molfile: str) -> Optional[CanonicalStructure]:
+    """
+    Parse a molfile once and return its canonical form.
+
+    Molfiles that fail sanitisation on read are retried with an explicit
+    sanitisation step, matching how OCSR molfiles were parsed before.
+
+    Args:
+        molfile: Molfile (V2000 or V3000) string
+
+    Returns:
+        CanonicalStructure, or None if the molfile cannot be parsed
+    """
+    mol = Chem.MolFromMolBlock(molfile, sanitize=True)
+    if mol is None:
+        try:
+            mol = Chem.MolFromMolBlock(molfile, sanitize=False)
+            Chem.SanitizeMol(mol)
+        except Exception:
+            return None
+    return _build_structure(mol)
+
+
+def get_canonical_structure(
+    smiles: Optional[str] = None, molfile: Optional[str] = None
+) -> Optional[CanonicalStructure]:
+    """
+    Return the canonical form of a structure given as SMILES or molfile.
+
+    SMILES is preferred; the molfile is used when no SMILES is given or the
+    SMILES cannot be parsed.
+
+    Args:
+        smiles: Input SMILES string
+        molfile: Input molfile string
+
+    Returns:
+        CanonicalStructure, or None if neither input can be parsed
+    """
+    structure = get_structure_from_smiles(smiles) if smiles else None
+    if structure is None and molfile:
+        structure = get_structure_from_molfile(molfile)
+    return structure
+
+
+def get_molecule_cache_info() -> Dict[str, Any]:
+    """
+    Return hit/miss statistics of the SMILES and molfile parsing caches.
+
+    Returns:
+        Dictionary with statistics for each cache
+    """
+    stats = {}
+    for name, cached in (
+        ("smiles", get_structure_from_smiles),
+        ("molfile", get_structure_from_molfile),
+    ):
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+        }
+    return stats
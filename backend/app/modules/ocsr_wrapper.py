@@ -231,16 +231,15 @@ def get_smiles_ocsr(
         return get_molnextr_prediction(path, data_type=data_type)
 
 
-def save_uploaded_image(file_content: bytes, filename: str) -> str:
+def uploaded_image_path(filename: str) -> str:
     """
-    Save an uploaded image to the images directory with a unique filename
+    Return a unique path in the images directory for an uploaded image
 
     Args:
-        file_content: The binary content of the uploaded file
         filename: Original filename
 
     Returns:
-        str: Path to the saved image file
+        str: Path to save the uploaded image to
     """
     # Generate unique ID
     unique_id = str(uuid.uuid4())[:8]
@@ -248,13 +247,7 @@ def save_uploaded_image(file_content: bytes, filename: str) -> str:
 
     # Generate safe filename with unique ID
     safe_filename = f"{name}_{unique_id}{ext}"
-    file_path = os.path.join(IMAGES_DIR, safe_filename)
-
-    # Save the file
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-
-    return file_path
+    return os.path.join(IMAGES_DIR, safe_filename)
 
 
 def process_chemical_structure(
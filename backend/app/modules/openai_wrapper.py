@@ -1,9 +1,25 @@
 import os
 import json
 import re
+import random
+import asyncio
+import hashlib
 import logging
 from typing import Dict, List, Tuple, Any, Optional
-from openai import OpenAI
+
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+from app.config import (
+    OPENAI_BASE_URL,
+    OPENAI_CHUNK_OVERLAP,
+    OPENAI_CHUNK_SIZE,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_DELAY,
+    OPENAI_TIMEOUT,
+)
+from app.modules.llm_cache import llm_cache, make_cache_key
 from app.security.validators import APIKeyManager
 
 # Configure logging
@@ -23,104 +39,454 @@ except Exception as e:
     logger.error(f"OpenAI API key configuration failed: {e}")
     raise
 
-# Initialize OpenAI client with validated key
-client = OpenAI(api_key=api_key_manager.api_key)
+# Upper bound on a single backoff delay (seconds)
+OPENAI_RETRY_MAX_DELAY = 30.0
+
+# Shared connection pool; retries are handled here rather than by the SDK
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(OPENAI_TIMEOUT),
+)
+
+# Initialize async OpenAI client with validated key
+client = AsyncOpenAI(
+    api_key=api_key_manager.api_key,
+    base_url=OPENAI_BASE_URL,
+    http_client=http_client,
+    max_retries=0,
+    timeout=OPENAI_TIMEOUT,
+)
+
+# Limits concurrent completions per worker process
+_request_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Span extractions currently running, keyed by text hash, so that identical
+# concurrent requests share one completion
+_in_flight_spans: Dict[str, "asyncio.Task[Tuple[str, List[Dict[str, Any]]]]"] = {}
+
+# Boundaries at which long texts are split into chunks, in order of preference
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+# Prompt settings; both are part of the LLM cache key
+SYSTEM_MESSAGE = "Extract the compound information from the Paragraph."
+TEMPERATURE = 0.3
 
 # Use environment variable for model ID or fall back to the existing value
 OPENAI_MODEL_ID = os.environ.get("OPENAI_MODEL_ID", "gpt-4")
 
-try:
-    retrieve_job_response = client.fine_tuning.jobs.retrieve(OPENAI_MODEL_ID)
-    fine_tuned_model = retrieve_job_response.fine_tuned_model
-    logger.info(f"Fine-tuned model configured: {fine_tuned_model}")
-except Exception as e:
-    logger.warning(f"Could not retrieve fine-tuned model, using base model: {e}")
-    fine_tuned_model = OPENAI_MODEL_ID
+# Resolved on the first request, since the async client cannot be used at import
+fine_tuned_model: Optional[str] = None
+
 
+async def get_model_id() -> str:
+    """
+    Resolve the model to use, looking up the fine-tuning job only once.
 
-def get_response(user_message: str, endpoint: str = "chat_completion") -> str:
+    Returns:
+        str: Fine-tuned model name, or OPENAI_MODEL_ID if it is not a job id
+    """
+    global fine_tuned_model
+    if fine_tuned_model is None:
+        try:
+            retrieve_job_response = await client.fine_tuning.jobs.retrieve(
+                OPENAI_MODEL_ID
+            )
+            fine_tuned_model = retrieve_job_response.fine_tuned_model or OPENAI_MODEL_ID
+            logger.info(f"Fine-tuned model configured: {fine_tuned_model}")
+        except Exception as e:
+            logger.warning(
+                f"Could not retrieve fine-tuned model, using base model: {e}"
+            )
+            fine_tuned_model = OPENAI_MODEL_ID
+    return fine_tuned_model
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are retried."""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Exponential backoff with jitter, honouring a Retry-After header."""
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), OPENAI_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    delay = min(OPENAI_RETRY_BASE_DELAY * (2**attempt), OPENAI_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def get_response(
+    user_message: str,
+    endpoint: str = "chat_completion",
+    timeout: Optional[float] = None,
+    use_cache: bool = True,
+) -> str:
     """
     Get response from OpenAI API using fine-tuned model with security logging
 
+    Responses are read through the persistent LLM cache. At most
+    OPENAI_MAX_CONCURRENCY calls run at once per worker. Rate limits and
+    server errors are retried with exponential backoff.
+
     Args:
         user_message (str): User message to process
         endpoint (str): API endpoint being used for logging
+        timeout (float, optional): Per-call timeout in seconds. Defaults to OPENAI_TIMEOUT.
+        use_cache (bool, optional): Set to False to bypass cached responses.
+            The fresh response still replaces the cached one. Defaults to True.
 
     Returns:
         str: OpenAI API response content
     """
-    system_message = "Extract the compound information from the Paragraph."
     test_messages = []
-    test_messages.append({"role": "system", "content": system_message})
+    test_messages.append({"role": "system", "content": SYSTEM_MESSAGE})
     test_messages.append({"role": "user", "content": user_message})
 
-    try:
-        # Log API key usage for security monitoring
-        api_key_manager.log_usage(endpoint)
+    model = await get_model_id()
 
-        response = client.chat.completions.create(
-            model=fine_tuned_model, messages=test_messages, temperature=0.3
-        )
+    cache_key = make_cache_key(SYSTEM_MESSAGE, user_message, model, TEMPERATURE)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"LLM cache hit for endpoint: {endpoint}")
+            return cached
 
-        result = response.choices[0].message.content
-        logger.info(f"OpenAI API request successful for endpoint: {endpoint}")
-        return result
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            # Log API key usage for security monitoring
+            api_key_manager.log_usage(endpoint)
+
+            async with _request_semaphore:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=test_messages,
+                    temperature=TEMPERATURE,
+                    timeout=timeout or OPENAI_TIMEOUT,
+                )
+
+            result = response.choices[0].message.content
+            logger.info(f"OpenAI API request successful for endpoint: {endpoint}")
+            llm_cache.set(cache_key, model, result)
+            return result
+
+        except Exception as e:
+            if _is_retryable(e) and attempt < OPENAI_MAX_RETRIES:
+                delay = _retry_delay(e, attempt)
+                logger.warning(
+                    f"OpenAI API call on {endpoint} failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s ({attempt + 1}/{OPENAI_MAX_RETRIES})"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            logger.error(f"Error calling OpenAI API on {endpoint}: {str(e)}")
+            # Don't expose API key in error messages
+            sanitized_error = str(e).replace(OPENAI_API_KEY, "***REDACTED***")
+            raise Exception(
+                "OpenAI API error: An internal error occurred while processing your request."
+            )
+
+
+def _trie_pattern(values: List[str]) -> str:
+    """
+    Build a regex alternation of values with common prefixes factored out
 
-    except Exception as e:
-        logger.error(f"Error calling OpenAI API on {endpoint}: {str(e)}")
-        # Don't expose API key in error messages
-        sanitized_error = str(e).replace(OPENAI_API_KEY, "***REDACTED***")
-        raise Exception(
-            "OpenAI API error: An internal error occurred while processing your request."
-        )
+    Alternatives sharing a prefix are only tried once, and optional
+    continuations are greedy, so the pattern matches the longest value
+    starting at a position.
+
+    Args:
+        values (list): Distinct non-empty values
+
+    Returns:
+        str: Regular expression matching any of the values
+    """
+    trie: Dict[str, dict] = {}
+    for value in values:
+        node = trie
+        for char in value:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End of a value
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def _locate_values(main_text: str, values: List[str]) -> Dict[str, List[int]]:
+    """
+    Find the start offsets of every value in one pass over the text
+
+    A single lookahead over a prefix-factored alternation reports each
+    position where at least one value starts, together with the longest such
+    value. Shorter values starting at the same position are exactly its
+    prefixes that are also values, which are precomputed. Occurrences of each
+    value are reduced to leftmost non-overlapping matches, as re.finditer
+    would return them.
+
+    Args:
+        main_text (str): Text to search
+        values (list): Distinct non-empty values
+
+    Returns:
+        dict: Start offsets of each value found, in increasing order
+    """
+    value_set = set(values)
+    lengths = sorted({len(value) for value in value_set}, reverse=True)
+    # Any value starting where a longer one starts is a prefix of it
+    candidates = {
+        value: [value]
+        + [
+            value[:length]
+            for length in lengths
+            if length < len(value) and value[:length] in value_set
+        ]
+        for value in value_set
+    }
+    matcher = re.compile(f"(?=({_trie_pattern(sorted(value_set))}))")
+
+    found: Dict[str, List[int]] = {}
+    last_end: Dict[str, int] = {}
+    for match in matcher.finditer(main_text):
+        start = match.start()
+        for value in candidates[match.group(1)]:
+            if start >= last_end.get(value, 0):
+                found.setdefault(value, []).append(start)
+                last_end[value] = start + len(value)
+    return found
 
 
 def find_positions(
-    main_text: str, extracted_text: Dict[str, str]
+    main_text: str, extracted_text: Dict[str, str], overlap: str = "all"
 ) -> List[Dict[str, Any]]:
     """
     Find positions of extracted entities in the main text
 
+    All values of all labels are located with one multi-pattern scan.
+
+    Overlaps are resolved deterministically. With overlap="all", every
+    mention of every value is reported (nested entities included), grouped by
+    label and value in extraction order. With overlap="longest", overlapping
+    mentions are reduced to the leftmost-longest one (ties go to the label
+    listed first) and results are ordered by offset.
+
     Args:
         main_text (str): Original text
         extracted_text (dict): Dictionary of extracted entities
+        overlap (str, optional): "all" or "longest". Defaults to "all".
 
     Returns:
         list: List of dictionaries with label, start_offset, and end_offset
     """
-    positions = []
-    labels = list(extracted_text.keys())
-
-    for label in labels:
+    label_values = []
+    for label in extracted_text:
         values = extracted_text[label].split(", ")
         values = [
             x.strip("' ") for x in values
         ]  # Clean string from trailing and leading whitespaces and apostrophes
+        values = [x for x in values if x != "nan" and x.strip()]  # Skip empty/"nan"
+        label_values.append((label, list(dict.fromkeys(values))))
+
+    all_values = {value for _, values in label_values for value in values}
+    if not all_values:
+        return []
+    found = _locate_values(main_text, list(all_values))
 
+    positions = []
+    for label, values in label_values:
         for value in values:
-            if value != "nan" and value.strip():  # Skip empty or "nan" values
-                matches = re.finditer(
-                    re.escape(value), main_text
-                )  # Use finditer to find all mentions
-
-                for match in matches:
-                    positions.append(
-                        {
-                            "label": label,
-                            "start_offset": match.start(),
-                            "end_offset": match.end(),
-                        }
-                    )
+            for start in found.get(value, []):
+                positions.append(
+                    {
+                        "label": label,
+                        "start_offset": start,
+                        "end_offset": start + len(value),
+                    }
+                )
+
+    if overlap == "longest":
+        label_order = {label: i for i, (label, _) in enumerate(label_values)}
+        positions.sort(
+            key=lambda p: (
+                p["start_offset"],
+                p["start_offset"] - p["end_offset"],
+                label_order[p["label"]],
+            )
+        )
+        kept = []
+        for position in positions:
+            if not kept or position["start_offset"] >= kept[-1]["end_offset"]:
+                kept.append(position)
+        positions = kept
 
     return positions
 
 
-def get_spans(user_message: str) -> Tuple[str, List[Dict[str, Any]]]:
+async def get_spans(
+    user_message: str, use_cache: bool = True
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Extract spans from user message, sharing the result between identical
+    requests that are in flight at the same time.
+
+    Args:
+        user_message (str): Text to process
+        use_cache (bool, optional): Set to False to bypass the LLM cache. Defaults to True.
+
+    Returns:
+        tuple: (extracted_text, positions) or appropriate fallback
+    """
+    key = hashlib.sha256(user_message.encode("utf-8")).hexdigest()
+    key = f"{key}:{use_cache}"
+    task = _in_flight_spans.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_extract_spans(user_message, use_cache))
+        _in_flight_spans[key] = task
+        task.add_done_callback(lambda _: _in_flight_spans.pop(key, None))
+    else:
+        logger.info("Joining in-flight span extraction for identical text")
+
+    # Shield so one client disconnecting does not cancel the shared extraction
+    return await asyncio.shield(task)
+
+
+def _split_segments(
+    text: str, start: int, end: int, pattern: re.Pattern
+) -> List[Tuple[int, int]]:
+    """Split text[start:end] after each match of pattern."""
+    segments = []
+    position = start
+    for match in pattern.finditer(text, start, end):
+        if match.end() > position:
+            segments.append((position, match.end()))
+            position = match.end()
+    if position < end:
+        segments.append((position, end))
+    return segments
+
+
+def split_text(
+    text: str, chunk_size: Optional[int] = None, overlap: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """
+    Split text into chunks on paragraph, then sentence, boundaries
+
+    Paragraphs longer than chunk_size are split into sentences, and sentences
+    still longer than chunk_size are cut at chunk_size. Consecutive chunks
+    share whole trailing paragraphs or sentences of up to overlap characters.
+
+    Args:
+        text (str): Text to split
+        chunk_size (int, optional): Maximum chunk length in characters.
+            Defaults to OPENAI_CHUNK_SIZE.
+        overlap (int, optional): Maximum overlap between consecutive chunks in
+            characters. Defaults to OPENAI_CHUNK_OVERLAP.
+
+    Returns:
+        list: (start, end) offsets of each chunk in text
+    """
+    chunk_size = chunk_size or OPENAI_CHUNK_SIZE
+    overlap = OPENAI_CHUNK_OVERLAP if overlap is None else overlap
+    if len(text) <= chunk_size:
+        return [(0, len(text))]
+
+    pieces = []
+    for paragraph in _split_segments(text, 0, len(text), _PARAGRAPH_BREAK):
+        if paragraph[1] - paragraph[0] <= chunk_size:
+            pieces.append(paragraph)
+            continue
+        for sentence in _split_segments(text, *paragraph, _SENTENCE_BREAK):
+            if sentence[1] - sentence[0] <= chunk_size:
+                pieces.append(sentence)
+                continue
+            pieces.extend(
+                (offset, min(offset + chunk_size, sentence[1]))
+                for offset in range(sentence[0], sentence[1], chunk_size)
+            )
+
+    chunks = []
+    first = 0
+    while first < len(pieces):
+        start = pieces[first][0]
+        last = first + 1
+        while last < len(pieces) and pieces[last][1] - start <= chunk_size:
+            last += 1
+        chunks.append((start, pieces[last - 1][1]))
+        if last == len(pieces):
+            break
+
+        # Start the next chunk with trailing pieces of this one, as long as
+        # they fit in the overlap and leave room for the next new piece
+        next_first = last
+        while (
+            next_first - 1 > first
+            and pieces[last - 1][1] - pieces[next_first - 1][0] <= overlap
+            and pieces[last][1] - pieces[next_first - 1][0] <= chunk_size
+        ):
+            next_first -= 1
+        first = next_first
+
+    return chunks
+
+
+def merge_extracted_entities(
+    merged: Dict[str, str], extracted: Dict[str, Any]
+) -> Dict[str, str]:
+    """
+    Merge entities extracted from one chunk into the combined result
+
+    Values are kept in first-seen order and duplicates, e.g. from chunk
+    overlaps, are dropped.
+
+    Args:
+        merged (dict): Combined result, updated in place
+        extracted (dict): Entities extracted from one chunk
+
+    Returns:
+        dict: The combined result
+    """
+    for label, value in extracted.items():
+        values = value if isinstance(value, list) else str(value).split(", ")
+        existing = merged[label].split(", ") if merged.get(label) else []
+        for item in values:
+            item = str(item).strip("' ")
+            if item and item != "nan" and item not in existing:
+                existing.append(item)
+        if existing:
+            merged[label] = ", ".join(existing)
+    return merged
+
+
+async def _extract_spans(
+    user_message: str, use_cache: bool = True
+) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Extract spans from user message and handle JSON parsing errors gracefully.
 
+    Texts longer than OPENAI_CHUNK_SIZE are annotated in concurrent chunks.
+
     Args:
         user_message (str): Text to process
+        use_cache (bool, optional): Set to False to bypass the LLM cache. Defaults to True.
 
     Returns:
         tuple: (extracted_text, positions) or appropriate fallback
@@ -131,64 +497,149 @@ def get_spans(user_message: str) -> Tuple[str, List[Dict[str, Any]]]:
         else user_message
     )
 
+    if len(user_message) > OPENAI_CHUNK_SIZE:
+        return await _extract_chunked_spans(user_message, use_cache)
+
     # Get response
     try:
-        extracted_text = get_response(user_message)
+        extracted_text = await get_response(user_message, use_cache=use_cache)
     except Exception as e:
         print(f"Error getting response: {str(e)}")
         return "", []
 
+    extracted_text, data_dict = _parse_extracted_text(extracted_text)
+    if data_dict is None:
+        return extracted_text, []
+
+    try:
+        positions = find_positions(user_message, data_dict)
+        return extracted_text, positions
+    except Exception as e:
+        print(f"Error finding positions: {str(e)}")
+        return extracted_text, []
+
+
+async def _extract_chunked_spans(
+    user_message: str, use_cache: bool = True
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Annotate a long text as concurrent chunks and merge the results.
+
+    Entities from all chunks are merged, then located in the full text, so
+    offsets refer to the original text exactly as for a single request.
+
+    Args:
+        user_message (str): Text to process
+        use_cache (bool, optional): Set to False to bypass the LLM cache. Defaults to True.
+
+    Returns:
+        tuple: (extracted_text, positions) or appropriate fallback
+    """
+    chunks = split_text(user_message)
+    logger.info(
+        f"Annotating {len(chunks)} chunks of up to {OPENAI_CHUNK_SIZE} characters"
+    )
+
+    responses = await asyncio.gather(
+        *(
+            get_response(user_message[start:end], use_cache=use_cache)
+            for start, end in chunks
+        ),
+        return_exceptions=True,
+    )
+
+    merged: Dict[str, str] = {}
+    unparsed = []
+    for (start, end), response in zip(chunks, responses):
+        if isinstance(response, Exception):
+            logger.error(
+                f"Error getting response for chunk {start}-{end}: {str(response)}"
+            )
+            continue
+        extracted_text, data_dict = _parse_extracted_text(response)
+        if isinstance(data_dict, dict):
+            merge_extracted_entities(merged, data_dict)
+        elif extracted_text:
+            unparsed.append(extracted_text)
+
+    if not merged:
+        return "\n".join(unparsed), []
+
+    try:
+        positions = find_positions(user_message, merged)
+    except Exception as e:
+        logger.error(f"Error finding positions: {str(e)}")
+        positions = []
+    return json.dumps(merged, ensure_ascii=False), positions
+
+
+def _parse_extracted_text(extracted_text: str) -> Tuple[str, Optional[Any]]:
+    """
+    Parse an LLM response as JSON, recovering embedded JSON where possible
+
+    Args:
+        extracted_text (str): Raw LLM response
+
+    Returns:
+        tuple: (extracted_text, parsed data) with the text replaced by the
+            recovered JSON if needed; parsed data is None if parsing failed
+    """
     # Print response for debugging
-    print(f"Response received (length: {len(extracted_text)})")
+    print(f"Response received (length: {len(extracted_text or '')})")
     print(
         f"Response preview: {extracted_text[:200]}..."
-        if len(extracted_text) > 200
+        if len(extracted_text or "") > 200
         else extracted_text
     )
 
     # Handle empty response
     if not extracted_text or extracted_text.strip() == "":
         print("Warning: Empty response received")
-        return "", []
+        return "", None
 
     # Parse JSON with error handling
     try:
-        data_dict = json.loads(extracted_text)
+        return extracted_text, json.loads(extracted_text)
     except json.JSONDecodeError as e:
         print(f"JSON parsing error: {str(e)}")
 
-        # Try to recover JSON from response if possible
-        try:
-            # Look for JSON-like patterns (text between curly braces)
-            potential_json = re.search(r"(\{.*\})", extracted_text, re.DOTALL)
-            if potential_json:
-                cleaned_json = potential_json.group(1)
-                print(f"Attempting to parse potential JSON: {cleaned_json[:100]}...")
-                data_dict = json.loads(cleaned_json)
-                positions = find_positions(user_message, data_dict)
-                return cleaned_json, positions
-        except Exception:
-            pass  # If recovery fails, continue to fallback
-
-        # Fallback when JSON parsing fails
-        fallback_dict = {"spans": []}
-        try:
-            positions = find_positions(user_message, fallback_dict)
-            return extracted_text, positions
-        except Exception as pos_error:
-            print(f"Error finding positions with fallback: {str(pos_error)}")
-            return extracted_text, []
+    # Try to recover JSON from response if possible
+    try:
+        # Look for JSON-like patterns (text between curly braces)
+        potential_json = re.search(r"(\{.*\})", extracted_text, re.DOTALL)
+        if potential_json:
+            cleaned_json = potential_json.group(1)
+            print(f"Attempting to parse potential JSON: {cleaned_json[:100]}...")
+            return cleaned_json, json.loads(cleaned_json)
+    except Exception:
+        pass  # If recovery fails, continue to fallback
+
+    # Fallback when JSON parsing fails
+    return extracted_text, None
+
+
+def spans_to_json(extracted_text: str) -> Dict[str, Any]:
+    """
+    Convert the extracted text returned by get_spans into JSON data
+
+    Args:
+        extracted_text (str): Extracted text from get_spans
 
-    # If JSON parsing succeeds, continue as normal
+    Returns:
+        dict: Extracted JSON data, raw text or error message
+    """
+    if not extracted_text:
+        return {"error": "No data extracted"}
+
+    # Try to parse as JSON
     try:
-        positions = find_positions(user_message, data_dict)
-        return extracted_text, positions
-    except Exception as e:
-        print(f"Error finding positions: {str(e)}")
-        return extracted_text, []
+        return json.loads(extracted_text)
+    except json.JSONDecodeError:
+        # Return as raw text if not valid JSON
+        return {"raw_text": extracted_text}
 
 
-def get_extracted_json(text: str) -> Dict[str, Any]:
+async def get_extracted_json(text: str) -> Dict[str, Any]:
     """
     Extract JSON data from text
 
@@ -199,24 +650,14 @@ def get_extracted_json(text: str) -> Dict[str, Any]:
         dict: Extracted JSON data or error message
     """
     try:
-        extracted_text, _ = get_spans(text)
-
-        if not extracted_text:
-            return {"error": "No data extracted"}
-
-        # Try to parse as JSON
-        try:
-            json_data = json.loads(extracted_text)
-            return json_data
-        except json.JSONDecodeError:
-            # Return as raw text if not valid JSON
-            return {"raw_text": extracted_text}
+        extracted_text, _ = await get_spans(text)
+        return spans_to_json(extracted_text)
 
     except Exception as e:
         return {"error": f"Error extracting data: {str(e)}"}
 
 
-def get_extracted_positions(text: str) -> List[Dict[str, Any]]:
+async def get_extracted_positions(text: str) -> List[Dict[str, Any]]:
     """
     Extract positions from text
 
@@ -227,7 +668,7 @@ def get_extracted_positions(text: str) -> List[Dict[str, Any]]:
         list: List of position dictionaries or empty list on error
     """
     try:
-        _, positions = get_spans(text)
+        _, positions = await get_spans(text)
         return positions
     except Exception as e:
         print(f"Error extracting positions: {str(e)}")
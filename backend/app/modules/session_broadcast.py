@@ -0,0 +1,214 @@
+"""
+Queue broadcasts to WebSocket clients for MARCUS sessions.
+Changes are coalesced over a short window, the queue is read and the shared
+part of the payload is encoded once per broadcast, and each client is only
+sent its own state when that state has changed.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from app.modules.session_manager import SessionManager
+
+logger = logging.getLogger(__name__)
+
+# Bumped on every queue change, so workers sharing the state backend notice
+# changes made by other workers and update their own WebSocket clients
+QUEUE_VERSION_KEY = "marcus:sessions:queue_version"
+QUEUE_VERSION_POLL_INTERVAL = 1.0
+
+# Changes within this window are sent as a single broadcast
+BROADCAST_COALESCE_WINDOW = 0.1
+
+# Re-read the queue this often even without changes, since idle sessions free
+# slots without any event; unchanged clients are not sent anything
+QUEUE_REFRESH_INTERVAL = 5.0
+
+SEND_TIMEOUT = 2.0
+BROADCAST_TIMEOUT = 3.0
+
+# Session fields sent to clients, as produced by SessionManager.get_queue_snapshot
+CLIENT_STATE_FIELDS = (
+    "session_id",
+    "status",
+    "queue_position",
+    "estimated_wait_time",
+    "active_users_count",
+)
+
+MESSAGE_TEMPLATE = '{"type": "%s", "session_status": %s, "queue_status": %s}'
+
+
+class SessionWebSocketManager:
+    """Manages WebSocket connections for session updates."""
+
+    def __init__(self, session_manager: SessionManager):
+        self.session_manager = session_manager
+        self.connections: Dict[str, object] = {}
+        self._changed = asyncio.Event()
+        self._queue_version: Optional[str] = None
+        self._last_refresh = 0.0
+        self._worker_task: Optional[asyncio.Task] = None
+
+        # Last state sent to each client, and the encoded queue status shared
+        # by all of them
+        self._client_states: Dict[str, dict] = {}
+        self._queue_status_json: Optional[str] = None
+
+        self.stats = {"broadcasts": 0, "messages_sent": 0, "messages_skipped": 0}
+
+    def _ensure_worker(self):
+        """Start the broadcast worker once an event loop is running."""
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = asyncio.create_task(self._broadcast_worker())
+
+    async def connect(self, websocket, session_id: str):
+        """Accept a new WebSocket connection."""
+        self._ensure_worker()
+        await websocket.accept()
+        self.connections[session_id] = websocket
+        self._client_states.pop(session_id, None)
+        logger.info(
+            f"WebSocket connected for session {session_id}. Total connections: {len(self.connections)}"
+        )
+        # The new client gets its state with the next broadcast
+        self._changed.set()
+
+    def disconnect(self, session_id: str):
+        """Remove a WebSocket connection."""
+        self._client_states.pop(session_id, None)
+        if session_id in self.connections:
+            del self.connections[session_id]
+            logger.info(
+                f"WebSocket disconnected for session {session_id}. Total connections: {len(self.connections)}"
+            )
+
+    async def send_text(self, session_id: str, text: str) -> bool:
+        """Send an encoded message to a specific session."""
+        websocket = self.connections.get(session_id)
+        if websocket is None:
+            return False
+
+        try:
+            await asyncio.wait_for(websocket.send_text(text), timeout=SEND_TIMEOUT)
+            return True
+        except (Exception, asyncio.TimeoutError) as e:
+            logger.warning(f"Failed to send message to session {session_id}: {e}")
+            self.disconnect(session_id)
+            return False
+
+    async def send_message(self, session_id: str, message: dict) -> bool:
+        """Send a message to a specific session."""
+        return await self.send_text(session_id, json.dumps(message))
+
+    async def _broadcast_worker(self):
+        """Background worker that sends coalesced queue updates."""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait(), timeout=QUEUE_VERSION_POLL_INTERVAL
+                    )
+                    # Let a burst of changes settle into one broadcast
+                    await asyncio.sleep(BROADCAST_COALESCE_WINDOW)
+                except asyncio.TimeoutError:
+                    if not self.connections:
+                        continue
+                    version = self.session_manager.backend.get(QUEUE_VERSION_KEY)
+                    refresh_due = (
+                        time.monotonic() - self._last_refresh >= QUEUE_REFRESH_INTERVAL
+                    )
+                    if version == self._queue_version and not refresh_due:
+                        continue
+                    self._queue_version = version
+
+                self._changed.clear()
+                await self._do_broadcast_queue_update()
+
+            except Exception as e:
+                logger.error(f"Broadcast worker error: {e}")
+                await asyncio.sleep(1)  # Prevent tight loop on persistent errors
+
+    async def _do_broadcast_queue_update(self):
+        """Send every connected client whose state changed its new state."""
+        self._last_refresh = time.monotonic()
+        if not self.connections:
+            return
+
+        try:
+            snapshot = await self.session_manager.get_queue_snapshot()
+            self._queue_status_json = json.dumps(snapshot["queue_status"])
+            sessions = snapshot["sessions"]
+            self.stats["broadcasts"] += 1
+
+            sends = []
+            for session_id in list(self.connections):
+                state = sessions.get(session_id)
+                if state is None or state == self._client_states.get(session_id):
+                    self.stats["messages_skipped"] += 1
+                    continue
+                self._client_states[session_id] = state
+                text = MESSAGE_TEMPLATE % (
+                    "queue_update",
+                    json.dumps(state),
+                    self._queue_status_json,
+                )
+                sends.append(self.send_text(session_id, text))
+
+            if sends:
+                self.stats["messages_sent"] += len(sends)
+                await asyncio.wait_for(
+                    asyncio.gather(*sends, return_exceptions=True),
+                    timeout=BROADCAST_TIMEOUT,
+                )
+
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Broadcast queue update timed out after {BROADCAST_TIMEOUT} seconds"
+            )
+        except Exception as e:
+            logger.error(f"Error during broadcast queue update: {e}")
+
+    async def heartbeat_reply(self, session_id: str) -> Optional[str]:
+        """
+        Record a heartbeat and build the status reply for it.
+
+        The reply repeats the state last broadcast to the client, which is
+        kept current by the broadcast worker; the session status is only
+        computed for clients that have not received a broadcast yet.
+
+        Returns:
+            Encoded status_update message, or None if the session is unknown
+        """
+        if not await self.session_manager.update_session_activity(session_id):
+            return None
+
+        state = self._client_states.get(session_id)
+        if state is None or self._queue_status_json is None:
+            session_status = await self.session_manager.get_session_status(session_id)
+            if not session_status:
+                return None
+            state = {
+                field: session_status[field]
+                for field in CLIENT_STATE_FIELDS
+                if field in session_status
+            }
+            self._client_states[session_id] = state
+            self._queue_status_json = json.dumps(
+                await self.session_manager.get_queue_status()
+            )
+
+        return MESSAGE_TEMPLATE % (
+            "status_update",
+            json.dumps(state),
+            self._queue_status_json,
+        )
+
+    async def broadcast_queue_update(self):
+        """Request a broadcast (non-blocking); changes are coalesced."""
+        self._queue_version = str(self.session_manager.backend.incr(QUEUE_VERSION_KEY))
+        self._ensure_worker()
+        self._changed.set()
@@ -4,34 +4,119 @@ Handles user concurrency limits and waiting queue management with better perform
 """
 
 import asyncio
+import heapq
+import json
 import time
 import uuid
-from typing import Dict, Set, Optional, List
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 import logging
-from collections import deque
+
+from app.config import MARCUS_MAX_CONCURRENT_USERS, MARCUS_SESSION_IDLE_TIMEOUT
+from app.modules.duration_stats import DurationStats
+from app.modules.expiry_scheduler import ExpiryScheduler
+from app.modules.state_backend import (
+    MemoryStateBackend,
+    StateBackend,
+    get_state_backend,
+)
 
 logger = logging.getLogger(__name__)
 
+# State backend keys shared by every worker
+ACTIVE_KEY = "marcus:sessions:active"  # session_id -> session info JSON
+WAITING_KEY = "marcus:sessions:waiting"  # session_id -> session info JSON
+QUEUE_KEY = "marcus:sessions:queue"  # waiting session ids in arrival order
+LAST_ACTIVITY_KEY = "marcus:sessions:last_activity"  # session_id -> timestamp
+LAST_REQUEST_KEY = "marcus:sessions:last_request"  # active session_id -> timestamp
+IN_FLIGHT_KEY = "marcus:sessions:in_flight"  # active session_id -> request count
+LOCK_KEY = "marcus:sessions:lock"
+SESSION_DURATION_KEY = "marcus:stats:session_duration"  # DurationStats JSON
+JOB_TIME_KEY_PREFIX = "marcus:stats:job_time:"  # + request class -> DurationStats JSON
+# Time a session is assumed to keep its slot until durations have been observed
+DEFAULT_SESSION_DURATION = 900
+# Activity timestamps are written to the backend in batches at most this often
+ACTIVITY_FLUSH_INTERVAL = 1.0
+# Per-position wait estimates are recomputed at most this often between changes
+WAIT_ESTIMATE_REFRESH_INTERVAL = 5.0
+
+SESSION_KEYS = (
+    ACTIVE_KEY,
+    WAITING_KEY,
+    QUEUE_KEY,
+    LAST_ACTIVITY_KEY,
+    LAST_REQUEST_KEY,
+    IN_FLIGHT_KEY,
+)
 
-class SessionManager:
-    """Manages user sessions and enforces concurrency limits."""
 
-    def __init__(self, max_concurrent_users: int = 3):
+class SessionManager:
+    """
+    Manages user sessions and enforces concurrency limits.
+
+    Only busy sessions, those with a request in flight or one finished within
+    the idle timeout, occupy one of the max_concurrent_users slots. Idle
+    sessions stay active, but waiting users are promoted past them; the heavy
+    work itself is bounded by the admission controller.
+
+    All state lives in a state backend, so every worker sharing the backend
+    sees the same sessions and queue. Changes that move sessions between the
+    queue and the active set hold the backend lock.
+
+    Inactivity deadlines of the sessions this worker creates or sees activity
+    for are kept in an ExpiryScheduler, so cleanup only visits sessions that
+    are due. A due session is checked against the shared last activity, since
+    its activity may have been recorded by another worker.
+
+    Activity timestamps recorded for API requests and heartbeats are kept in
+    memory and written in one batch per ACTIVITY_FLUSH_INTERVAL; reads in this
+    worker flush them first. In-flight request counts are written at once.
+
+    How long sessions keep their slot and how long heavy jobs run is tracked
+    in shared DurationStats; wait estimates replay the queue against the
+    expected end of every busy session using them. The replay yields the
+    wait of every queue position at once and is kept, so status requests
+    index into it; it is redone for broadcasts, when this worker changes the
+    active sessions, or once WAIT_ESTIMATE_REFRESH_INTERVAL has passed.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_users: int = 3,
+        idle_timeout: float = 60,
+        backend: Optional[StateBackend] = None,
+    ):
         self.max_concurrent_users = max_concurrent_users
-        self.active_sessions: Dict[str, dict] = {}  # session_id -> session_info
-        self.waiting_queue: deque = deque()  # Deque for better performance
+        self.idle_timeout = idle_timeout
+        self.backend = backend or MemoryStateBackend()
         self.session_timeout = 300  # 5 minutes timeout instead of 1 minute
         self._session_lock = asyncio.Lock()  # For session operations
         self._cleanup_lock = asyncio.Lock()  # Separate lock for cleanup
-        self._last_cleanup = time.time()
         self._cleanup_interval = 60  # Run cleanup every 60 seconds (increased from 30)
-
-        # Start background cleanup task
-        asyncio.create_task(self._background_cleanup())
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._expiry = ExpiryScheduler()
+        # session_id -> (latest activity, whether it was an API request)
+        self._pending_activity: Dict[str, Tuple[float, bool]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Backend key -> (serialised value, decoded statistics)
+        self._stats_cache: Dict[str, Tuple[Optional[str], DurationStats]] = {}
+        # (time computed, estimated wait of each queue position)
+        self._wait_estimates: Tuple[float, List[int]] = (0.0, [])
+
+    def _ensure_background_cleanup(self):
+        """Start the background cleanup task once an event loop is running."""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._background_cleanup())
 
     async def _background_cleanup(self):
         """Background task to periodically clean up expired sessions."""
+        # Pick up sessions left behind by workers that have since restarted
+        for session_id, last_activity in self.backend.hgetall(
+            LAST_ACTIVITY_KEY
+        ).items():
+            if session_id not in self._expiry:
+                self._schedule_expiry(session_id, float(last_activity))
+
         while True:
             try:
                 await asyncio.sleep(self._cleanup_interval)
@@ -42,40 +127,67 @@ class SessionManager:
     async def _cleanup_expired_sessions_background(self):
         """Background cleanup that doesn't block session operations."""
         async with self._cleanup_lock:
-            current_time = time.time()
-            expired_sessions = []
-
-            # Find expired active sessions
-            for session_id, session_info in list(self.active_sessions.items()):
-                if current_time - session_info["last_activity"] > self.session_timeout:
-                    expired_sessions.append(session_id)
+            async with self._session_lock:
+                with self.backend.lock(LOCK_KEY):
+                    for session_id in self._take_expired_sessions():
+                        logger.info(
+                            f"Background cleanup: Session {session_id} expired due to inactivity"
+                        )
+                        self._delete_session(session_id)
+
+                    # Promote waiting users into slots freed by expired or idle sessions
+                    self._promote_waiting_users()
+
+    def _schedule_expiry(self, session_id: str, last_activity: float):
+        self._expiry.schedule(session_id, last_activity + self.session_timeout)
+
+    def _record_activity(self, session_id: str, current_time: float, request: bool):
+        """Queue an activity timestamp for the next batched write."""
+        previous = self._pending_activity.get(session_id)
+        self._pending_activity[session_id] = (
+            current_time,
+            request or (previous is not None and previous[1]),
+        )
+        loop = asyncio.get_running_loop()
+        if self._flush_handle is None or self._flush_loop is not loop:
+            self._flush_loop = loop
+            self._flush_handle = loop.call_later(
+                ACTIVITY_FLUSH_INTERVAL, self._flush_activity
+            )
 
-            # Remove expired sessions and promote waiting users
-            for session_id in expired_sessions:
-                logger.info(
-                    f"Background cleanup: Session {session_id} expired due to inactivity"
-                )
-                async with self._session_lock:
-                    if session_id in self.active_sessions:
-                        del self.active_sessions[session_id]
-                        # Promote waiting user if available
-                        if (
-                            self.waiting_queue
-                            and len(self.active_sessions) < self.max_concurrent_users
-                        ):
-                            await self._promote_next_user()
-
-            # Clean up expired waiting sessions
-            waiting_queue_list = list(self.waiting_queue)
-            self.waiting_queue.clear()
-
-            for session in waiting_queue_list:
-                if current_time - session["last_activity"] <= self.session_timeout:
-                    self.waiting_queue.append(session)
-
-            # Update queue positions
-            for i, session in enumerate(self.waiting_queue):
-                session["queue_position"] = i + 1
+    def _flush_activity(self):
+        """Write pending activity timestamps to the backend."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending_activity:
+            return
+
+        pending, self._pending_activity = self._pending_activity, {}
+        for session_id, (timestamp, request) in pending.items():
+            # Sessions removed since the activity are not brought back
+            if self.backend.hget(LAST_ACTIVITY_KEY, session_id) is None:
+                continue
+            self.backend.hset(LAST_ACTIVITY_KEY, session_id, str(timestamp))
+            if request and self.backend.hget(ACTIVE_KEY, session_id) is not None:
+                self.backend.hset(LAST_REQUEST_KEY, session_id, str(timestamp))
+            self._schedule_expiry(session_id, timestamp)
+
+    def _take_expired_sessions(self) -> List[str]:
+        """Return the sessions whose inactivity deadline has passed."""
+        self._flush_activity()
+        current_time = time.time()
+        expired = []
+        for session_id in self._expiry.pop_expired(current_time):
+            last_activity = self.backend.hget(LAST_ACTIVITY_KEY, session_id)
+            if last_activity is None:
+                continue  # Already removed, possibly by another worker
+            if float(last_activity) + self.session_timeout > current_time:
+                # Kept alive through another worker
+                self._schedule_expiry(session_id, float(last_activity))
+            else:
+                expired.append(session_id)
+        return expired
 
     async def create_session(self, user_id: Optional[str] = None) -> dict:
         """Create a new session for a user with improved error handling."""
@@ -92,6 +204,7 @@ class SessionManager:
 
     async def _create_session_internal(self, user_id: Optional[str] = None) -> dict:
         """Internal session creation with optimized locking."""
+        self._ensure_background_cleanup()
         session_id = str(uuid.uuid4())
         current_time = time.time()
 
@@ -104,165 +217,410 @@ class SessionManager:
         }
 
         async with self._session_lock:
-            # Light cleanup only if needed (not full cleanup)
-            if current_time - self._last_cleanup > self._cleanup_interval:
-                await self._light_cleanup()
-                self._last_cleanup = current_time
-
-            # Check if we can activate immediately
-            if len(self.active_sessions) < self.max_concurrent_users:
-                session_info["status"] = "active"
-                self.active_sessions[session_id] = session_info
+            with self.backend.lock(LOCK_KEY, timeout=5.0):
+                # Drop sessions that are due, so their slots can be reused
+                for expired_id in self._take_expired_sessions():
+                    logger.info(f"Session {expired_id} expired due to inactivity")
+                    self._delete_session(expired_id)
+
+                # Users already waiting get free slots first
+                self._promote_waiting_users()
+
+                self.backend.hset(LAST_ACTIVITY_KEY, session_id, str(current_time))
+                self._schedule_expiry(session_id, current_time)
+
+                # Check if we can activate immediately
+                if not self.backend.queue_len(QUEUE_KEY) and self._has_free_slot():
+                    self._activate(session_info, current_time)
+                    logger.info(
+                        f"Session {session_id} activated immediately. Active sessions: {self.backend.hlen(ACTIVE_KEY)}"
+                    )
+                    return session_info.copy()
+
+                # Add to waiting queue; positions are derived on read, not stored
+                self.backend.hset(WAITING_KEY, session_id, json.dumps(session_info))
+                queue_position = self.backend.queue_push(QUEUE_KEY, session_id)
                 logger.info(
-                    f"Session {session_id} activated immediately. Active sessions: {len(self.active_sessions)}"
-                )
-            else:
-                # Add to waiting queue
-                self.waiting_queue.append(session_info)
-                session_info["queue_position"] = len(self.waiting_queue)
-                logger.info(
-                    f"Session {session_id} added to queue at position {session_info['queue_position']}"
+                    f"Session {session_id} added to queue at position {queue_position}"
                 )
 
-            return session_info.copy()  # Return a copy to avoid external modifications
+                session_copy = session_info.copy()  # Avoid external modifications
+                session_copy["queue_position"] = queue_position
+                return session_copy
 
-    async def _light_cleanup(self):
-        """Quick cleanup that only removes obviously expired sessions."""
+    def _delete_session(self, session_id: str) -> bool:
+        """Remove every trace of a session (must be called with session lock)."""
+        self._expiry.cancel(session_id)
+        self._wait_estimates = (0.0, [])
+        info = self.backend.hget(ACTIVE_KEY, session_id)
+        if info is not None:
+            self._record_session_duration(session_id, json.loads(info))
+        removed = self.backend.hdel(ACTIVE_KEY, session_id) > 0
+        if self.backend.queue_remove(QUEUE_KEY, session_id):
+            removed = True
+        self.backend.hdel(WAITING_KEY, session_id)
+        for key in (LAST_ACTIVITY_KEY, LAST_REQUEST_KEY, IN_FLIGHT_KEY):
+            self.backend.hdel(key, session_id)
+        return removed
+
+    def _busy_session_count(self) -> int:
+        """Count the active sessions that occupy a concurrency slot."""
+        self._flush_activity()
         current_time = time.time()
-        expired_count = 0
-
-        # Quick check for very old sessions only
-        very_old_threshold = self.session_timeout * 2  # Only remove very old sessions
-
-        for session_id in list(self.active_sessions.keys()):
-            if (
-                current_time - self.active_sessions[session_id]["last_activity"]
-                > very_old_threshold
-            ):
-                del self.active_sessions[session_id]
-                expired_count += 1
-
-        if expired_count > 0:
-            logger.info(f"Light cleanup removed {expired_count} very old sessions")
-
-    async def _promote_next_user(self):
-        """Promote the next user from waiting queue to active (must be called with session lock)."""
-        if self.waiting_queue and len(self.active_sessions) < self.max_concurrent_users:
-            next_session = self.waiting_queue.popleft()
-            next_session["status"] = "active"
-            next_session["activated_at"] = time.time()
-            self.active_sessions[next_session["session_id"]] = next_session
-            logger.info(
-                f"Session {next_session['session_id']} promoted from queue to active"
-            )
-
-            # Update queue positions for remaining waiting users
-            for i, session in enumerate(self.waiting_queue):
-                session["queue_position"] = i + 1
-
-            return next_session
+        in_flight = self.backend.hgetall(IN_FLIGHT_KEY)
+        return sum(
+            1
+            for session_id, last_request in self.backend.hgetall(
+                LAST_REQUEST_KEY
+            ).items()
+            if int(in_flight.get(session_id, 0)) > 0
+            or current_time - float(last_request) < self.idle_timeout
+        )
+
+    def _has_free_slot(self) -> bool:
+        return self._busy_session_count() < self.max_concurrent_users
+
+    def _activate(self, session_info: dict, current_time: float):
+        """Store a session as active (must be called with session lock)."""
+        session_info["status"] = "active"
+        session_id = session_info["session_id"]
+        self._wait_estimates = (0.0, [])
+        self.backend.hset(ACTIVE_KEY, session_id, json.dumps(session_info))
+        self.backend.hset(LAST_REQUEST_KEY, session_id, str(current_time))
+        self.backend.hset(IN_FLIGHT_KEY, session_id, "0")
+
+    def _promote_waiting_users(self) -> int:
+        """Promote waiting users while slots are free (must be called with session lock)."""
+        free_slots = self.max_concurrent_users - self._busy_session_count()
+        promoted = 0
+        while promoted < free_slots:
+            session_id = self.backend.queue_pop(QUEUE_KEY)
+            if session_id is None:
+                break
+            info = self.backend.hget(WAITING_KEY, session_id)
+            self.backend.hdel(WAITING_KEY, session_id)
+            if info is None:
+                continue
+
+            session_info = json.loads(info)
+            current_time = time.time()
+            session_info["activated_at"] = current_time
+            self._activate(session_info, current_time)
+            logger.info(f"Session {session_id} promoted from queue to active")
+            promoted += 1
+        return promoted
+
+    def session_state(self, session_id: str) -> Optional[str]:
+        """
+        Return "active", "waiting" or None for a session.
+
+        A cheap check for per-request validation: nothing is decoded or
+        copied, and waiting sessions are not promoted.
+        """
+        if self.backend.hget(ACTIVE_KEY, session_id) is not None:
+            return "active"
+        if self.backend.hget(WAITING_KEY, session_id) is not None:
+            return "waiting"
         return None
 
+    async def begin_request(self, session_id: str) -> bool:
+        """
+        Record the start of an API request for an active session.
+
+        Args:
+            session_id: Session making the request
+
+        Returns:
+            True if the session is active, False otherwise
+        """
+        if self.backend.hget(ACTIVE_KEY, session_id) is None:
+            return False
+        self.backend.hincrby(IN_FLIGHT_KEY, session_id, 1)
+        self._record_activity(session_id, time.time(), request=True)
+        return True
+
+    async def end_request(self, session_id: str):
+        """Record the end of an API request started with begin_request."""
+        if self.backend.hget(ACTIVE_KEY, session_id) is None:
+            return
+        if self.backend.hincrby(IN_FLIGHT_KEY, session_id, -1) < 0:
+            self.backend.hset(IN_FLIGHT_KEY, session_id, "0")
+        self._record_activity(session_id, time.time(), request=True)
+
     async def update_session_activity(self, session_id: str) -> bool:
         """Update the last activity timestamp for a session."""
-        current_time = time.time()
-
-        # Check active sessions first (most common case)
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]["last_activity"] = current_time
-            return True
-
-        # Check waiting queue (less common, so do it after)
-        for session in self.waiting_queue:
-            if session["session_id"] == session_id:
-                session["last_activity"] = current_time
-                return True
-
-        return False
+        if (
+            session_id not in self._pending_activity
+            and self.backend.hget(LAST_ACTIVITY_KEY, session_id) is None
+        ):
+            return False
+        self._record_activity(session_id, time.time(), request=False)
+        return True
 
     async def remove_session(self, session_id: str) -> bool:
         """Remove a session and promote waiting users if applicable."""
+        # The session's last request may not have been written yet
+        self._flush_activity()
         async with self._session_lock:
-            removed = False
-            promoted_session = None
-
-            # Remove from active sessions
-            if session_id in self.active_sessions:
-                del self.active_sessions[session_id]
-                removed = True
-                logger.info(
-                    f"Session {session_id} removed from active sessions. Active sessions: {len(self.active_sessions)}"
-                )
-
-                # Promote waiting user if we have space
-                if self.waiting_queue:
-                    promoted_session = await self._promote_next_user()
-
-            # Remove from waiting queue
-            original_queue = list(self.waiting_queue)
-            self.waiting_queue.clear()
-
-            for session in original_queue:
-                if session["session_id"] != session_id:
-                    self.waiting_queue.append(session)
-                else:
-                    removed = True
-
-            # Update queue positions
-            for i, session in enumerate(self.waiting_queue):
-                session["queue_position"] = i + 1
-
-            return removed
+            with self.backend.lock(LOCK_KEY):
+                was_active = self.backend.hget(ACTIVE_KEY, session_id) is not None
+                removed = self._delete_session(session_id)
+
+                if was_active:
+                    logger.info(
+                        f"Session {session_id} removed from active sessions. Active sessions: {self.backend.hlen(ACTIVE_KEY)}"
+                    )
+                    # Promote waiting users if we have space
+                    self._promote_waiting_users()
+
+                return removed
+
+    def _with_activity(self, info: str, session_id: str) -> dict:
+        session = json.loads(info)
+        last_activity = self.backend.hget(LAST_ACTIVITY_KEY, session_id)
+        if last_activity is not None:
+            session["last_activity"] = float(last_activity)
+        return session
 
     async def get_session_status(self, session_id: str) -> Optional[dict]:
         """Get current status of a session."""
         # Check active sessions first
-        if session_id in self.active_sessions:
-            session = self.active_sessions[session_id].copy()
-            session["active_users_count"] = len(self.active_sessions)
+        info = self.backend.hget(ACTIVE_KEY, session_id)
+        if info is not None:
+            session = self._with_activity(info, session_id)
+            session["active_users_count"] = self.backend.hlen(ACTIVE_KEY)
             return session
 
         # Check waiting queue
-        for i, session in enumerate(self.waiting_queue):
-            if session["session_id"] == session_id:
-                session_copy = session.copy()
-                session_copy["queue_position"] = i + 1
-                session_copy["active_users_count"] = len(self.active_sessions)
-                session_copy["estimated_wait_time"] = self._estimate_wait_time(i + 1)
-                return session_copy
-
-        return None
+        queue_position = self.backend.queue_position(QUEUE_KEY, session_id)
+        if queue_position is None:
+            return None
+
+        # Slots also free up when active sessions go idle, without any event
+        if self._has_free_slot():
+            async with self._session_lock:
+                with self.backend.lock(LOCK_KEY):
+                    self._promote_waiting_users()
+            return await self.get_session_status(session_id)
+
+        info = self.backend.hget(WAITING_KEY, session_id)
+        if info is None:
+            return None
+        session_copy = self._with_activity(info, session_id)
+        session_copy["queue_position"] = queue_position
+        session_copy["active_users_count"] = self.backend.hlen(ACTIVE_KEY)
+        session_copy["estimated_wait_time"] = self._estimate_wait_time(queue_position)
+        return session_copy
+
+    async def get_queue_snapshot(self) -> dict:
+        """
+        Get the queue status and the state of every session in one pass.
+
+        Used for broadcasts, so the queue is read once per change instead of
+        once per connected client.
+
+        Returns:
+            Dictionary with "queue_status" and "sessions", mapping each
+            session_id to its status, queue position and estimated wait
+        """
+        if self.backend.queue_len(QUEUE_KEY) and self._has_free_slot():
+            async with self._session_lock:
+                with self.backend.lock(LOCK_KEY):
+                    self._promote_waiting_users()
+
+        active = self.backend.hgetall(ACTIVE_KEY)
+        waiting = self.backend.queue_members(QUEUE_KEY)
+        queue_status = await self.get_queue_status()
+        active_count = queue_status["active_sessions"]
+        wait_times = self._refresh_wait_times(len(waiting))
+
+        sessions = {
+            session_id: {
+                "session_id": session_id,
+                "status": "active",
+                "active_users_count": active_count,
+            }
+            for session_id in active
+        }
+        for queue_position, session_id in enumerate(waiting, start=1):
+            sessions[session_id] = {
+                "session_id": session_id,
+                "status": "waiting",
+                "queue_position": queue_position,
+                "estimated_wait_time": wait_times[queue_position - 1],
+                "active_users_count": active_count,
+            }
+        return {"queue_status": queue_status, "sessions": sessions}
 
     async def get_queue_status(self) -> dict:
         """Get overall queue and session status."""
+        busy_sessions = self._busy_session_count()
         return {
-            "active_sessions": len(self.active_sessions),
+            "active_sessions": self.backend.hlen(ACTIVE_KEY),
+            "busy_sessions": busy_sessions,
             "max_concurrent_users": self.max_concurrent_users,
-            "waiting_queue_length": len(self.waiting_queue),
-            "available_slots": max(
-                0, self.max_concurrent_users - len(self.active_sessions)
-            ),
+            "waiting_queue_length": self.backend.queue_len(QUEUE_KEY),
+            "available_slots": max(0, self.max_concurrent_users - busy_sessions),
         }
 
+    def _load_stats(self, key: str, default: Optional[float] = None) -> DurationStats:
+        """Return shared statistics, decoding them only when they changed."""
+        value = self.backend.get(key)
+        cached = self._stats_cache.get(key)
+        if cached is None or cached[0] != value:
+            cached = (value, DurationStats.loads(value, default=default))
+            self._stats_cache[key] = cached
+        return cached[1]
+
+    def _record_duration(self, key: str, duration: float):
+        def add(value: Optional[str]):
+            stats = DurationStats.loads(value)
+            stats.add(duration)
+            return stats.dumps(), None
+
+        self.backend.update(key, add)
+
+    def _record_session_duration(self, session_id: str, session_info: dict):
+        """Record how long an active session kept its slot."""
+        activated_at = session_info.get("activated_at", session_info["created_at"])
+        last_request = self.backend.hget(LAST_REQUEST_KEY, session_id)
+        if last_request is None:
+            return
+        # The slot is freed an idle timeout after the last request, or on removal
+        released_at = min(time.time(), float(last_request) + self.idle_timeout)
+        self._record_duration(SESSION_DURATION_KEY, released_at - activated_at)
+
+    def record_job_time(self, request_class: str, service_time: float):
+        """
+        Record how long a heavy request ran.
+
+        Args:
+            request_class: Request class from the admission controller
+            service_time: Seconds between admission and completion
+        """
+        self._record_duration(JOB_TIME_KEY_PREFIX + request_class, service_time)
+
+    def _job_time_stats(self) -> Dict[str, DurationStats]:
+        return {
+            key[len(JOB_TIME_KEY_PREFIX) :]: self._load_stats(key)
+            for key in self.backend.scan_keys(JOB_TIME_KEY_PREFIX)
+        }
+
+    def _estimate_wait_times(self, count: int) -> List[int]:
+        """
+        Estimate the wait in seconds of the first count queue positions.
+
+        Every busy session is expected to keep its slot for the remaining
+        time observed for sessions of its age, and at least until its running
+        jobs and the idle timeout after them are over. Waiting sessions then
+        take the earliest freed slot in queue order and hold it for the
+        average session duration.
+        """
+        if count <= 0:
+            return []
+        self._flush_activity()
+        current_time = time.time()
+        sessions = self._load_stats(SESSION_DURATION_KEY, DEFAULT_SESSION_DURATION)
+        job_stats = [stats for stats in self._job_time_stats().values() if stats.count]
+        job_time = (
+            sum(stats.mean * stats.count for stats in job_stats)
+            / sum(stats.count for stats in job_stats)
+            if job_stats
+            else 0.0
+        )
+
+        active = self.backend.hgetall(ACTIVE_KEY)
+        in_flight = self.backend.hgetall(IN_FLIGHT_KEY)
+        slot_free_at = []
+        for session_id, last_request in self.backend.hgetall(LAST_REQUEST_KEY).items():
+            idle_left = float(last_request) + self.idle_timeout - current_time
+            running = int(in_flight.get(session_id, 0)) > 0
+            info = active.get(session_id)
+            if info is None or not (running or idle_left > 0):
+                continue
+            session_info = json.loads(info)
+            age = current_time - session_info.get(
+                "activated_at", session_info["created_at"]
+            )
+            at_least = job_time + self.idle_timeout if running else idle_left
+            slot_free_at.append(max(sessions.expected_remaining(age), at_least))
+
+        # Only the sessions that free up last hold the configured slots
+        slot_free_at.sort()
+        slot_free_at = slot_free_at[
+            max(0, len(slot_free_at) - self.max_concurrent_users) :
+        ]
+        slot_free_at += [0.0] * (self.max_concurrent_users - len(slot_free_at))
+        heapq.heapify(slot_free_at)
+
+        waits = []
+        for _ in range(count):
+            free_at = heapq.heappop(slot_free_at)
+            waits.append(round(free_at))
+            heapq.heappush(slot_free_at, free_at + sessions.mean)
+        return waits
+
+    def _refresh_wait_times(self, count: int) -> List[int]:
+        """Recompute and keep the waits of the first count queue positions."""
+        waits = self._estimate_wait_times(count)
+        self._wait_estimates = (time.time(), waits)
+        return waits
+
     def _estimate_wait_time(self, queue_position: int) -> int:
-        """Estimate wait time in seconds based on queue position."""
-        # More conservative estimate: assume average session length of 15 minutes
-        avg_session_duration = 900  # 15 minutes in seconds
-        return queue_position * (avg_session_duration // self.max_concurrent_users)
+        """
+        Estimate wait time in seconds based on queue position.
+
+        Reads the kept per-position estimates, less the time since they were
+        computed, and recomputes them for the whole queue only when they are
+        stale or do not reach the position.
+        """
+        computed_at, waits = self._wait_estimates
+        elapsed = time.time() - computed_at
+        if elapsed >= WAIT_ESTIMATE_REFRESH_INTERVAL or queue_position > len(waits):
+            waits = self._refresh_wait_times(
+                max(queue_position, self.backend.queue_len(QUEUE_KEY))
+            )
+            elapsed = 0.0
+        return max(0, round(waits[queue_position - 1] - elapsed))
+
+    def get_statistics(self) -> dict:
+        """
+        Get the observed session durations and job service times.
+
+        Returns:
+            Dictionary with count, moving average and quantiles of session
+            durations and of the service time of each heavy request class,
+            and the estimated wait of a session joining the queue now
+        """
+        return {
+            "session_duration": self._load_stats(
+                SESSION_DURATION_KEY, DEFAULT_SESSION_DURATION
+            ).to_dict(),
+            "job_service_time": {
+                request_class: stats.to_dict()
+                for request_class, stats in sorted(self._job_time_stats().items())
+            },
+            "estimated_wait_for_new_session": self._estimate_wait_time(
+                self.backend.queue_len(QUEUE_KEY) + 1
+            ),
+        }
 
     async def reset_all_sessions(self):
         """Reset all sessions - clear active sessions and waiting queue."""
         async with self._session_lock:
-            logger.info(
-                f"Resetting all sessions. Active: {len(self.active_sessions)}, Waiting: {len(self.waiting_queue)}"
-            )
+            with self.backend.lock(LOCK_KEY):
+                logger.info(
+                    f"Resetting all sessions. Active: {self.backend.hlen(ACTIVE_KEY)}, Waiting: {self.backend.queue_len(QUEUE_KEY)}"
+                )
 
-            self.active_sessions.clear()
-            self.waiting_queue.clear()
+                self.backend.delete(*SESSION_KEYS)
+                self._expiry.clear()
+                self._pending_activity.clear()
 
             logger.info("All sessions have been reset")
             return {
                 "active_sessions": 0,
+                "busy_sessions": 0,
                 "waiting_queue_length": 0,
                 "max_concurrent_users": self.max_concurrent_users,
                 "available_slots": self.max_concurrent_users,
@@ -275,4 +633,8 @@ class SessionManager:
 
 
 # Global session manager instance
-session_manager = SessionManager(max_concurrent_users=3)
+session_manager = SessionManager(
+    max_concurrent_users=MARCUS_MAX_CONCURRENT_USERS,
+    idle_timeout=MARCUS_SESSION_IDLE_TIMEOUT,
+    backend=get_state_backend(),
+)
@@ -0,0 +1,568 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import rdFMCS
+
+from app.modules.molecule_cache import (
+    FINGERPRINT_BITS,
+    CanonicalStructure,
+    get_structure_from_smiles,
+)
+
+# Similarity above which two engine outputs are considered to agree
+AGREEMENT_THRESHOLD = 0.99
+
+# MCS worker pool, result cache and size-adaptive timeout (seconds)
+MCS_WORKERS = 2
+MCS_CACHE_SIZE = 512
+MCS_MIN_TIMEOUT = 2
+MCS_MAX_TIMEOUT = 15
+MCS_TIMEOUT_PER_ATOM = 0.05
+
+# How often a running MCS checks whether the client is still connected
+MCS_DISCONNECT_POLL_INTERVAL = 0.1
+
+# Most neighbour pairs kept while clustering, which bounds its memory use
+CLUSTER_MAX_NEIGHBOUR_PAIRS = 5_000_000
+
+_mcs_executor = ThreadPoolExecutor(max_workers=MCS_WORKERS, thread_name_prefix="mcs")
+_mcs_cache: "OrderedDict[Tuple[str, ...], Dict[str, Any]]" = OrderedDict()
+_mcs_cache_lock = threading.Lock()
+_mcs_cache_stats = {"hits": 0, "misses": 0}
+
+
+class MCSCancelledError(Exception):
+    """Raised when an MCS computation is abandoned because the client left."""
+
+
+class TooManyNeighboursError(ValueError):
+    """Raised when clustering would keep more neighbour pairs than allowed."""
+
+
+def stack_fingerprints(structures: Sequence[CanonicalStructure]) -> np.ndarray:
+    """
+    Stack the cached packed ECFP4 fingerprints of structures into one matrix.
+
+    Args:
+        structures: Canonical structures from the molecule cache
+
+    Returns:
+        Array of shape (n, FINGERPRINT_BITS // 8) with dtype uint8
+    """
+    packed = b"".join(structure.morgan_fp for structure in structures)
+    return np.frombuffer(packed, dtype=np.uint8).reshape(
+        len(structures), FINGERPRINT_BITS // 8
+    )
+
+
+def unpack_fingerprints(structures: Sequence[CanonicalStructure]) -> np.ndarray:
+    """
+    Unpack the cached ECFP4 fingerprints of structures into a dense 0/1 matrix.
+
+    Args:
+        structures: Canonical structures from the molecule cache
+
+    Returns:
+        Array of shape (n, FINGERPRINT_BITS) with dtype float32
+    """
+    return np.unpackbits(stack_fingerprints(structures), axis=1).astype(np.float32)
+
+
+def tanimoto_matrix(
+    bits_a: np.ndarray, bits_b: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Compute all-pairs Tanimoto similarity between two fingerprint matrices.
+
+    The intersection counts of every pair come from a single matrix product,
+    so no per-pair Python work is done.
+
+    Args:
+        bits_a: 0/1 fingerprint matrix of shape (n, bits)
+        bits_b: 0/1 fingerprint matrix of shape (m, bits); defaults to bits_a
+
+    Returns:
+        Similarity matrix of shape (n, m); pairs of empty fingerprints score 0.0
+    """
+    if bits_b is None:
+        bits_b = bits_a
+    intersection = (bits_a @ bits_b.T).astype(np.float64)
+    union = bits_a.sum(axis=1)[:, None] + bits_b.sum(axis=1)[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
+
+
+def compare_smiles_list(
+    smiles_list: List[str], engine_names: List[str]
+) -> Dict[str, Any]:
+    """
+    Build the similarity matrix and agreement summary for engine outputs.
+
+    Args:
+        smiles_list: SMILES strings, one per engine
+        engine_names: Names of the engines that produced each SMILES
+
+    Returns:
+        Dictionary with matrix, engine_names, identical and agreement_summary
+    """
+    # Check if all SMILES are identical
+    identical = len(set(smiles_list)) == 1
+
+    n = len(smiles_list)
+    valid = np.zeros(n, dtype=bool)
+    structures = []
+    invalid_smiles = []
+
+    for i, smiles in enumerate(smiles_list):
+        structure = get_structure_from_smiles(smiles)
+        if structure is not None:
+            valid[i] = True
+            structures.append(structure)
+        else:
+            invalid_smiles.append({"engine": engine_names[i], "smiles": smiles})
+
+    # Self-similarity on the diagonal, zero for any pair involving an invalid SMILES
+    similarity_matrix = np.eye(n)
+    valid_count = int(valid.sum())
+    if valid_count > 1:
+        valid_indices = np.flatnonzero(valid)
+        similarity_matrix[np.ix_(valid_indices, valid_indices)] = tanimoto_matrix(
+            unpack_fingerprints(structures)
+        )
+        np.fill_diagonal(similarity_matrix, 1.0)
+
+    # Agreement over the upper triangle of valid pairs in one pass
+    agreement_counts = {}
+    total_comparisons = 0
+    total_agreements = 0
+    if valid_count >= 2:
+        rows, cols = np.triu_indices(n, k=1)
+        pair_mask = valid[rows] & valid[cols]
+        rows, cols = rows[pair_mask], cols[pair_mask]
+        agreements = similarity_matrix[rows, cols] > AGREEMENT_THRESHOLD
+        total_comparisons = int(rows.size)
+        total_agreements = int(agreements.sum())
+        agreement_counts = {
+            f"{engine_names[i]}-{engine_names[j]}": bool(agreed)
+            for i, j, agreed in zip(rows.tolist(), cols.tolist(), agreements.tolist())
+        }
+
+    agreement_percentage = 0
+    if total_comparisons > 0:
+        agreement_percentage = (total_agreements / total_comparisons) * 100
+
+    return {
+        "matrix": similarity_matrix.tolist(),
+        "engine_names": engine_names,
+        "identical": identical,
+        "agreement_summary": {
+            "identical": identical,
+            "agreement_percentage": agreement_percentage,
+            "total_comparisons": total_comparisons,
+            "total_agreements": total_agreements,
+            "pair_agreements": agreement_counts,
+            "invalid_smiles": invalid_smiles,
+        },
+    }
+
+
+def iter_similar_pairs(
+    packed: np.ndarray, threshold: float, block_size: int = 2048
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Find all pairs with Tanimoto similarity at or above a threshold.
+
+    The upper triangle of the all-pairs matrix is computed in square blocks.
+    Only one pair of unpacked blocks and one block of similarities exist at a
+    time, so the similarity computation itself needs memory independent of
+    the number of structures; the pairs yielded may still number O(n^2).
+
+    Args:
+        packed: Packed fingerprints from stack_fingerprints
+        threshold: Minimum Tanimoto similarity of reported pairs
+        block_size: Number of fingerprints per block
+
+    Yields:
+        Tuples (rows, cols, similarities) with rows < cols, one per block
+    """
+    n = packed.shape[0]
+    for i0 in range(0, n, block_size):
+        block_a = np.unpackbits(packed[i0 : i0 + block_size], axis=1).astype(np.float32)
+        for j0 in range(i0, n, block_size):
+            block_b = np.unpackbits(packed[j0 : j0 + block_size], axis=1).astype(
+                np.float32
+            )
+            similarity = tanimoto_matrix(block_a, block_b)
+            rows, cols = np.nonzero(similarity >= threshold)
+            values = similarity[rows, cols]
+            rows, cols = rows + i0, cols + j0
+            upper = rows < cols
+            yield rows[upper], cols[upper], values[upper]
+
+
+def _neighbour_lists(
+    packed: np.ndarray,
+    threshold: float,
+    block_size: int,
+    max_pairs: int = CLUSTER_MAX_NEIGHBOUR_PAIRS,
+) -> List[List[int]]:
+    """
+    Build neighbour lists of every fingerprint at the given threshold.
+
+    Raises:
+        TooManyNeighboursError: If more than max_pairs pairs are neighbours
+    """
+    neighbours = [[] for _ in range(packed.shape[0])]
+    pair_count = 0
+    for rows, cols, _ in iter_similar_pairs(packed, threshold, block_size):
+        pair_count += len(rows)
+        if pair_count > max_pairs:
+            raise TooManyNeighboursError(
+                f"More than {max_pairs} pairs of structures are similar at "
+                f"threshold {threshold}; use a higher threshold or fewer structures"
+            )
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            neighbours[i].append(j)
+            neighbours[j].append(i)
+    return neighbours
+
+
+def _butina_clusters(neighbours: List[List[int]]) -> List[List[int]]:
+    """Taylor-Butina clustering: centroids are picked by neighbour count."""
+    order = sorted(range(len(neighbours)), key=lambda i: (-len(neighbours[i]), i))
+    assigned = [False] * len(neighbours)
+    clusters = []
+    for centroid in order:
+        if assigned[centroid]:
+            continue
+        assigned[centroid] = True
+        members = [centroid]
+        for neighbour in neighbours[centroid]:
+            if not assigned[neighbour]:
+                assigned[neighbour] = True
+                members.append(neighbour)
+        clusters.append(members)
+    return clusters
+
+
+def _threshold_clusters(neighbours: List[List[int]]) -> List[List[int]]:
+    """Single-linkage clusters: connected components of the neighbour graph."""
+    parent = list(range(len(neighbours)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, adjacent in enumerate(neighbours):
+        for j in adjacent:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    components: Dict[int, List[int]] = {}
+    for i in range(len(neighbours)):
+        components.setdefault(find(i), []).append(i)
+    # Centroid of a component is its most connected member
+    return [
+        sorted(members, key=lambda i: (-len(neighbours[i]), i))
+        for members in sorted(components.values(), key=len, reverse=True)
+    ]
+
+
+def cluster_structures(
+    structures: List[Dict[str, Any]],
+    threshold: float = 0.7,
+    method: str = "butina",
+    include_singletons: bool = False,
+    block_size: int = 2048,
+) -> Dict[str, Any]:
+    """
+    Deduplicate and cluster a collection of structures by ECFP4 similarity.
+
+    Structures with the same canonical SMILES form exact duplicate groups and
+    are fingerprinted once. The unique structures are then clustered on the
+    blocked all-pairs Tanimoto matrix.
+
+    Args:
+        structures: Dicts with ``id`` and ``smiles`` plus optional metadata
+            such as ``source`` and ``segment_id``, returned with every member
+        threshold: Tanimoto similarity at which structures are neighbours
+        method: "butina" (Taylor-Butina) or "threshold" (connected components)
+        include_singletons: Whether to return clusters with a single structure
+        block_size: Number of fingerprints compared per block
+
+    Returns:
+        Dictionary with duplicate groups, clusters and invalid structures
+
+    Raises:
+        TooManyNeighboursError: If more than CLUSTER_MAX_NEIGHBOUR_PAIRS
+            pairs of unique structures are similar at the threshold
+    """
+    by_canonical: Dict[str, List[Dict[str, Any]]] = {}
+    canonical_structures: Dict[str, CanonicalStructure] = {}
+    invalid = []
+    for structure in structures:
+        parsed = get_structure_from_smiles(structure["smiles"])
+        if parsed is None:
+            invalid.append(structure)
+        else:
+            by_canonical.setdefault(parsed.canonical_smiles, []).append(structure)
+            canonical_structures.setdefault(parsed.canonical_smiles, parsed)
+
+    unique_smiles = list(by_canonical)
+    packed = stack_fingerprints(list(canonical_structures.values()))
+    neighbours = _neighbour_lists(packed, threshold, block_size)
+
+    if method == "threshold":
+        groups = _threshold_clusters(neighbours)
+    else:
+        groups = _butina_clusters(neighbours)
+
+    clusters = []
+    for members in groups:
+        member_structures = [
+            structure for i in members for structure in by_canonical[unique_smiles[i]]
+        ]
+        if len(member_structures) < 2 and not include_singletons:
+            continue
+        clusters.append(
+            {
+                "cluster_id": len(clusters),
+                "centroid": unique_smiles[members[0]],
+                "size": len(member_structures),
+                "unique_structures": len(members),
+                "members": member_structures,
+            }
+        )
+
+    duplicate_groups = [
+        {"canonical_smiles": canonical, "size": len(group), "members": group}
+        for canonical, group in by_canonical.items()
+        if len(group) > 1
+    ]
+
+    return {
+        "method": method,
+        "threshold": threshold,
+        "total_structures": len(structures),
+        "unique_structures": len(unique_smiles),
+        "duplicate_groups": duplicate_groups,
+        "clusters": clusters,
+        "invalid_structures": invalid,
+    }
+
+
+class _CancellableProgress(rdFMCS.MCSProgress):
+    """FMCS progress callback that aborts the search once an event is set."""
+
+    def __init__(self, cancel_event: threading.Event):
+        super().__init__()
+        self.cancel_event = cancel_event
+
+    def __call__(self, stat, params) -> bool:
+        return not self.cancel_event.is_set()
+
+
+def mcs_timeout(structures: Sequence[CanonicalStructure]) -> int:
+    """
+    Pick an FMCS timeout that grows with the size of the largest molecule.
+
+    Args:
+        structures: Canonical structures passed to FMCS
+
+    Returns:
+        Timeout in whole seconds between MCS_MIN_TIMEOUT and MCS_MAX_TIMEOUT
+    """
+    largest = max((structure.num_atoms for structure in structures), default=0)
+    timeout = math.ceil(MCS_MIN_TIMEOUT + largest * MCS_TIMEOUT_PER_ATOM)
+    return max(MCS_MIN_TIMEOUT, min(MCS_MAX_TIMEOUT, timeout))
+
+
+def _find_mcs_blocking(
+    structures: Sequence[CanonicalStructure],
+    timeout: int,
+    cancel_event: threading.Event,
+) -> Dict[str, Any]:
+    """Run FMCS with the MARCUS comparison settings (runs on the MCS pool)."""
+    mols = [structure.to_mol() for structure in structures]
+    params = rdFMCS.MCSParameters()
+    params.AtomTyper = rdFMCS.AtomCompare.CompareElements
+    params.BondTyper = rdFMCS.BondCompare.CompareOrder
+    params.AtomCompareParameters.MatchValences = False
+    params.BondCompareParameters.CompleteRingsOnly = True
+    params.Timeout = timeout
+    params.ProgressCallback = _CancellableProgress(cancel_event)
+
+    result = rdFMCS.FindMCS(mols, params)
+    return {
+        "mcs_smarts": result.smartsString,
+        "atom_count": result.numAtoms,
+        "bond_count": result.numBonds,
+        "timed_out": bool(result.canceled) and not cancel_event.is_set(),
+        "cancelled": cancel_event.is_set(),
+    }
+
+
+# SMARTS bond primitives for the bond orders FMCS compares
+_BOND_ORDER_SMARTS = {
+    Chem.BondType.SINGLE: "-",
+    Chem.BondType.DOUBLE: "=",
+    Chem.BondType.TRIPLE: "#",
+    Chem.BondType.AROMATIC: ":",
+}
+
+
+def _fmcs_style_smarts(mol: Chem.Mol) -> str:
+    """
+    Write a whole molecule as SMARTS typed the way FMCS types its results.
+
+    Atoms are matched on element only and bonds on order plus ring
+    membership, so chirality, hydrogen counts and charges are left out just
+    as they are from ``rdFMCS.FindMCS`` with the MARCUS settings.
+    """
+    atom_symbols = [f"[#{atom.GetAtomicNum()}]" for atom in mol.GetAtoms()]
+    bond_symbols = [
+        _BOND_ORDER_SMARTS.get(bond.GetBondType(), "~")
+        + ("&@" if bond.IsInRing() else "&!@")
+        for bond in mol.GetBonds()
+    ]
+    return Chem.MolFragmentToSmiles(
+        mol,
+        atomsToUse=list(range(mol.GetNumAtoms())),
+        atomSymbols=atom_symbols,
+        bondSymbols=bond_symbols,
+        isomericSmiles=False,
+        allBondsExplicit=True,
+    )
+
+
+def _identical_mcs(structure: CanonicalStructure) -> Optional[Dict[str, Any]]:
+    """MCS of identical single-fragment molecules is the molecule itself."""
+    if structure.num_fragments != 1:
+        return None
+    return {
+        "mcs_smarts": _fmcs_style_smarts(structure.to_mol()),
+        "atom_count": structure.num_atoms,
+        "bond_count": structure.num_bonds,
+        "timed_out": False,
+    }
+
+
+def _store_mcs_result(key: Tuple[str, ...], result: Dict[str, Any]):
+    """Insert a result into the bounded MCS cache."""
+    with _mcs_cache_lock:
+        _mcs_cache[key] = result
+        _mcs_cache.move_to_end(key)
+        while len(_mcs_cache) > MCS_CACHE_SIZE:
+            _mcs_cache.popitem(last=False)
+
+
+async def find_mcs_cancellable(
+    structures: Sequence[CanonicalStructure],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+) -> Dict[str, Any]:
+    """
+    Find the MCS of several molecules without blocking the event loop.
+
+    Results are cached on the sorted set of canonical SMILES, except for
+    calculations that timed out, which are retried next time. Identical inputs
+    skip FMCS entirely. Otherwise molecules are rebuilt from their canonical
+    SMILES and FMCS runs on a worker thread with a
+    size-adaptive timeout and is aborted as soon as ``is_disconnected`` reports
+    that the client has gone away.
+
+    Args:
+        structures: Canonical structures from the molecule cache
+        is_disconnected: Coroutine function returning True once the client left
+
+    Returns:
+        Dictionary with mcs_smarts, atom_count, bond_count, timed_out and cached
+
+    Raises:
+        MCSCancelledError: If the client disconnected before FMCS finished
+    """
+    key = tuple(sorted(structure.canonical_smiles for structure in structures))
+
+    with _mcs_cache_lock:
+        cached = _mcs_cache.get(key)
+        if cached is not None:
+            _mcs_cache.move_to_end(key)
+            _mcs_cache_stats["hits"] += 1
+            return {**cached, "cached": True}
+        _mcs_cache_stats["misses"] += 1
+
+    if len(set(key)) == 1:
+        result = _identical_mcs(structures[0])
+        if result is not None:
+            _store_mcs_result(key, result)
+            return {**result, "cached": False}
+
+    cancel_event = threading.Event()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _mcs_executor,
+        _find_mcs_blocking,
+        structures,
+        mcs_timeout(structures),
+        cancel_event,
+    )
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=MCS_DISCONNECT_POLL_INTERVAL)
+            if done:
+                break
+            if is_disconnected is not None and await is_disconnected():
+                cancel_event.set()
+                raise MCSCancelledError("Client disconnected during MCS calculation")
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+
+    result = future.result()
+    if result.pop("cancelled"):
+        raise MCSCancelledError("MCS calculation was cancelled")
+
+    # A timeout may not recur once the server is less busy, so it is not cached
+    if not result["timed_out"]:
+        _store_mcs_result(key, result)
+    return {**result, "cached": False}
+
+
+def get_mcs_cache_info() -> Dict[str, Any]:
+    """
+    Return hit/miss statistics of the MCS result cache.
+
+    Returns:
+        Dictionary with hits, misses, hit rate, current size and max size
+    """
+    with _mcs_cache_lock:
+        hits, misses = _mcs_cache_stats["hits"], _mcs_cache_stats["misses"]
+        size = len(_mcs_cache)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "size": size,
+        "max_size": MCS_CACHE_SIZE,
+    }
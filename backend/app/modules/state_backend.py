@@ -0,0 +1,870 @@
+"""
+Shared state backends for MARCUS.
+Session queues, rate-limit records and caches are kept behind one small
+interface, so several uvicorn workers or nodes can share them. The in-memory
+backend serves a single process, the SQLite backend workers on one host, and
+the Redis backend speaks the Redis protocol to any compatible server.
+
+Select the backend with STATE_BACKEND_URL:
+
+    memory://                        (default)
+    sqlite:///path/to/state.sqlite3
+    redis://[:password@]host:6379/0
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from app.modules.expiry_scheduler import ExpiryScheduler
+
+logger = logging.getLogger(__name__)
+
+# Read-modify-write callback: old value -> (new value or None to delete, result)
+UpdateFunction = Callable[[Optional[str]], Tuple[Optional[str], Any]]
+
+
+class StateBackendError(Exception):
+    """Raised when the state backend cannot complete an operation."""
+
+
+class StateBackend:
+    """
+    Interface shared by all state backends.
+
+    Values are strings; callers serialise structured data themselves. Keys of
+    different types (values, hashes, queues) share one namespace.
+    """
+
+    # True when the state is only visible to the current process, so callers
+    # may store process-local values such as time.monotonic() readings
+    process_local = False
+
+    # Values
+    def get(self, key: str) -> Optional[str]:
+        """Return the value of a key, or None if missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Set a value, expiring after ttl seconds if given."""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Atomically add to an integer value and return the result."""
+        raise NotImplementedError
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None):
+        """
+        Atomically read, transform and write a value.
+
+        Args:
+            key: Key to update
+            fn: Called with the current value; returns (new value or None to
+                delete the key, result). May be called more than once.
+            ttl: Expiry of the written value in seconds
+
+        Returns:
+            The result returned by fn
+        """
+        raise NotImplementedError
+
+    def scan_keys(self, prefix: str) -> List[str]:
+        """Return the keys of plain values starting with prefix."""
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        """Delete values, hashes or queues."""
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Remove expired values and return how many were removed."""
+        return 0
+
+    # Hashes
+    def hget(self, name: str, field: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def hset(self, name: str, field: str, value: str):
+        raise NotImplementedError
+
+    def hdel(self, name: str, *fields: str) -> int:
+        raise NotImplementedError
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def hlen(self, name: str) -> int:
+        raise NotImplementedError
+
+    def hincrby(self, name: str, field: str, amount: int = 1) -> int:
+        raise NotImplementedError
+
+    # FIFO queues with position lookups
+    def queue_push(self, name: str, member: str) -> int:
+        """Append a member and return its 1-based position."""
+        raise NotImplementedError
+
+    def queue_pop(self, name: str) -> Optional[str]:
+        """Remove and return the member at the head of the queue."""
+        raise NotImplementedError
+
+    def queue_remove(self, name: str, member: str) -> bool:
+        raise NotImplementedError
+
+    def queue_position(self, name: str, member: str) -> Optional[int]:
+        """Return the 1-based position of a member, or None if not queued."""
+        raise NotImplementedError
+
+    def queue_len(self, name: str) -> int:
+        raise NotImplementedError
+
+    def queue_members(self, name: str) -> List[str]:
+        """Return all members in queue order."""
+        raise NotImplementedError
+
+    # Locks
+    @contextmanager
+    def lock(self, name: str, timeout: float = 10.0) -> Iterator[None]:
+        """Hold a lock shared by every user of the backend."""
+        raise NotImplementedError
+        yield
+
+
+class IndexedQueue:
+    """
+    FIFO queue of members with indexed lookups.
+
+    Members are kept in insertion order in an OrderedDict, so lookups,
+    removals and popping the head are O(1). Each member also gets an
+    increasing sequence number, and a Fenwick tree over the sequence numbers
+    counts the members still queued, which makes a position an O(log n)
+    prefix sum instead of a scan.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._capacity = capacity
+        self._tree = [0] * (capacity + 1)
+        self._next_seq = 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, member: str) -> bool:
+        return member in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over members in queue order."""
+        return iter(self._entries)
+
+    def _add(self, seq: int, delta: int):
+        while seq <= self._capacity:
+            self._tree[seq] += delta
+            seq += seq & -seq
+
+    def _prefix_count(self, seq: int) -> int:
+        count = 0
+        while seq > 0:
+            count += self._tree[seq]
+            seq -= seq & -seq
+        return count
+
+    def _renumber(self):
+        """Renumber queued members from 1 once the sequence numbers run out."""
+        self._capacity = max(self._capacity, 2 * (len(self._entries) + 1))
+        self._tree = [0] * (self._capacity + 1)
+        for seq, member in enumerate(self._entries, start=1):
+            self._entries[member] = seq
+            self._tree[seq] = 1
+        # Build the tree in place in O(n) by pushing each node into its parent
+        for seq in range(1, self._capacity + 1):
+            parent = seq + (seq & -seq)
+            if parent <= self._capacity:
+                self._tree[parent] += self._tree[seq]
+        self._next_seq = len(self._entries) + 1
+
+    def append(self, member: str) -> int:
+        """Add a member to the back of the queue and return its position."""
+        if member in self._entries:
+            return self.position(member)
+        if self._next_seq > self._capacity:
+            self._renumber()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._entries[member] = seq
+        self._add(seq, 1)
+        return len(self._entries)
+
+    def position(self, member: str) -> Optional[int]:
+        """Return the 1-based position of a member, if it is queued."""
+        seq = self._entries.get(member)
+        if seq is None:
+            return None
+        return self._prefix_count(seq)
+
+    def remove(self, member: str) -> bool:
+        """Remove a member from the queue."""
+        seq = self._entries.pop(member, None)
+        if seq is None:
+            return False
+        self._add(seq, -1)
+        return True
+
+    def popleft(self) -> Optional[str]:
+        """Remove and return the member at the head of the queue."""
+        if not self._entries:
+            return None
+        member, seq = self._entries.popitem(last=False)
+        self._add(seq, -1)
+        return member
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend; correct for a single worker only."""
+
+    process_local = True
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._queues: Dict[str, IndexedQueue] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._mutex = threading.RLock()
+        self._expiry = ExpiryScheduler()
+
+    def _store(self, key: str, value: str, ttl: Optional[float]):
+        expires_at = time.time() + ttl if ttl else None
+        self._values[key] = (value, expires_at)
+        if expires_at is None:
+            self._expiry.cancel(key)
+        else:
+            self._expiry.schedule(key, expires_at)
+
+    def _get_live(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._values[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        with self._mutex:
+            return self._get_live(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._mutex:
+            self._store(key, value, ttl)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._mutex:
+            value = int(self._get_live(key) or 0) + amount
+            entry = self._values.get(key)
+            self._values[key] = (str(value), entry[1] if entry else None)
+            return value
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None):
+        with self._mutex:
+            new_value, result = fn(self._get_live(key))
+            if new_value is None:
+                self._values.pop(key, None)
+                self._expiry.cancel(key)
+            else:
+                self._store(key, new_value, ttl)
+            return result
+
+    def scan_keys(self, prefix: str) -> List[str]:
+        with self._mutex:
+            return [
+                key
+                for key in list(self._values)
+                if key.startswith(prefix) and self._get_live(key) is not None
+            ]
+
+    def delete(self, *keys: str):
+        with self._mutex:
+            for key in keys:
+                self._values.pop(key, None)
+                self._hashes.pop(key, None)
+                self._queues.pop(key, None)
+                self._expiry.cancel(key)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._mutex:
+            # Only keys that are due are visited, however many values exist
+            for key in self._expiry.pop_expired(now):
+                entry = self._values.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self._values[key]
+                    removed += 1
+        return removed
+
+    def hget(self, name: str, field: str) -> Optional[str]:
+        with self._mutex:
+            return self._hashes.get(name, {}).get(field)
+
+    def hset(self, name: str, field: str, value: str):
+        with self._mutex:
+            self._hashes.setdefault(name, {})[field] = value
+
+    def hdel(self, name: str, *fields: str) -> int:
+        with self._mutex:
+            hash_ = self._hashes.get(name, {})
+            return sum(hash_.pop(field, None) is not None for field in fields)
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self._mutex:
+            return dict(self._hashes.get(name, {}))
+
+    def hlen(self, name: str) -> int:
+        with self._mutex:
+            return len(self._hashes.get(name, {}))
+
+    def hincrby(self, name: str, field: str, amount: int = 1) -> int:
+        with self._mutex:
+            hash_ = self._hashes.setdefault(name, {})
+            value = int(hash_.get(field, 0)) + amount
+            hash_[field] = str(value)
+            return value
+
+    def queue_push(self, name: str, member: str) -> int:
+        with self._mutex:
+            return self._queues.setdefault(name, IndexedQueue()).append(member)
+
+    def queue_pop(self, name: str) -> Optional[str]:
+        with self._mutex:
+            queue = self._queues.get(name)
+            return queue.popleft() if queue else None
+
+    def queue_remove(self, name: str, member: str) -> bool:
+        with self._mutex:
+            queue = self._queues.get(name)
+            return queue.remove(member) if queue else False
+
+    def queue_position(self, name: str, member: str) -> Optional[int]:
+        with self._mutex:
+            queue = self._queues.get(name)
+            return queue.position(member) if queue else None
+
+    def queue_len(self, name: str) -> int:
+        with self._mutex:
+            return len(self._queues.get(name, ()))
+
+    def queue_members(self, name: str) -> List[str]:
+        with self._mutex:
+            return list(self._queues.get(name, ()))
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 10.0) -> Iterator[None]:
+        with self._mutex:
+            lock = self._locks.setdefault(name, threading.Lock())
+        if not lock.acquire(timeout=timeout):
+            raise StateBackendError(f"Timed out waiting for lock {name}")
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_kv_expires_at ON kv (expires_at);
+CREATE TABLE IF NOT EXISTS hashes (
+    name TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, field)
+);
+CREATE TABLE IF NOT EXISTS queues (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    member TEXT NOT NULL,
+    UNIQUE (name, member)
+);
+CREATE INDEX IF NOT EXISTS idx_queues_name_seq ON queues (name, seq);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Seconds between attempts to take a lock held by another worker
+LOCK_RETRY_INTERVAL = 0.005
+
+
+class SQLiteStateBackend(StateBackend):
+    """Backend in a shared SQLite file, for several workers on one host."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in one write transaction across all processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get(self, key: str) -> Optional[str]:
+        rows = self._query(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        )
+        return rows[0][0] if rows else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._query(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl if ttl else None),
+        )
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+            value = int(row[0] if row else 0) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, str(value), row[1] if row else None),
+            )
+        return value
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            new_value, result = fn(row[0] if row else None)
+            if new_value is None:
+                conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, new_value, now + ttl if ttl else None),
+                )
+        return result
+
+    def scan_keys(self, prefix: str) -> List[str]:
+        rows = self._query(
+            "SELECT key FROM kv WHERE substr(key, 1, ?) = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (len(prefix), prefix, time.time()),
+        )
+        return [row[0] for row in rows]
+
+    def delete(self, *keys: str):
+        with self._transaction() as conn:
+            for key in keys:
+                conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                conn.execute("DELETE FROM hashes WHERE name = ?", (key,))
+                conn.execute("DELETE FROM queues WHERE name = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            ).rowcount
+
+    def hget(self, name: str, field: str) -> Optional[str]:
+        rows = self._query(
+            "SELECT value FROM hashes WHERE name = ? AND field = ?", (name, field)
+        )
+        return rows[0][0] if rows else None
+
+    def hset(self, name: str, field: str, value: str):
+        self._query(
+            "INSERT OR REPLACE INTO hashes (name, field, value) VALUES (?, ?, ?)",
+            (name, field, value),
+        )
+
+    def hdel(self, name: str, *fields: str) -> int:
+        with self._transaction() as conn:
+            return sum(
+                conn.execute(
+                    "DELETE FROM hashes WHERE name = ? AND field = ?", (name, field)
+                ).rowcount
+                for field in fields
+            )
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        return dict(
+            self._query("SELECT field, value FROM hashes WHERE name = ?", (name,))
+        )
+
+    def hlen(self, name: str) -> int:
+        return self._query("SELECT COUNT(*) FROM hashes WHERE name = ?", (name,))[0][0]
+
+    def hincrby(self, name: str, field: str, amount: int = 1) -> int:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM hashes WHERE name = ? AND field = ?", (name, field)
+            ).fetchone()
+            value = int(row[0] if row else 0) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO hashes (name, field, value) VALUES (?, ?, ?)",
+                (name, field, str(value)),
+            )
+        return value
+
+    def _position(self, conn: sqlite3.Connection, name: str, member: str):
+        count = conn.execute(
+            "SELECT COUNT(*) FROM queues WHERE name = ? AND seq <= "
+            "(SELECT seq FROM queues WHERE name = ? AND member = ?)",
+            (name, name, member),
+        ).fetchone()[0]
+        return count or None
+
+    def queue_push(self, name: str, member: str) -> int:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO queues (name, member) VALUES (?, ?)",
+                (name, member),
+            )
+            return self._position(conn, name, member)
+
+    def queue_pop(self, name: str) -> Optional[str]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT seq, member FROM queues WHERE name = ? ORDER BY seq LIMIT 1",
+                (name,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM queues WHERE seq = ?", (row[0],))
+            return row[1]
+
+    def queue_remove(self, name: str, member: str) -> bool:
+        with self._lock:
+            return (
+                self._conn.execute(
+                    "DELETE FROM queues WHERE name = ? AND member = ?", (name, member)
+                ).rowcount
+                > 0
+            )
+
+    def queue_position(self, name: str, member: str) -> Optional[int]:
+        with self._lock:
+            return self._position(self._conn, name, member)
+
+    def queue_len(self, name: str) -> int:
+        return self._query("SELECT COUNT(*) FROM queues WHERE name = ?", (name,))[0][0]
+
+    def queue_members(self, name: str) -> List[str]:
+        rows = self._query(
+            "SELECT member FROM queues WHERE name = ? ORDER BY seq", (name,)
+        )
+        return [row[0] for row in rows]
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 10.0) -> Iterator[None]:
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                conn.execute(
+                    "DELETE FROM locks WHERE name = ? AND expires_at <= ?", (name, now)
+                )
+                acquired = (
+                    conn.execute(
+                        "INSERT OR IGNORE INTO locks (name, token, expires_at) "
+                        "VALUES (?, ?, ?)",
+                        (name, token, now + timeout),
+                    ).rowcount
+                    > 0
+                )
+            if acquired:
+                break
+            if time.monotonic() > deadline:
+                raise StateBackendError(f"Timed out waiting for lock {name}")
+            time.sleep(LOCK_RETRY_INTERVAL)
+        try:
+            yield
+        finally:
+            self._query("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+
+class RedisStateBackend(StateBackend):
+    """Backend speaking the Redis protocol (RESP2) over one TCP connection."""
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = 5.0,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", self.db)
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by state backend")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise StateBackendError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise StateBackendError(f"Unexpected reply from state backend: {line!r}")
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _command(self, *args):
+        """Send one command, reconnecting once if the connection dropped."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(*args)
+                except (ConnectionError, OSError) as e:
+                    self._close()
+                    if attempt:
+                        raise StateBackendError(f"State backend unavailable: {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        return self._command("GET", key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if ttl:
+            self._command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self._command("SET", key, value)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return self._command("INCRBY", key, amount)
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None):
+        # Optimistic transaction: retried whenever another client wrote the key
+        with self._lock:
+            while True:
+                self._command("WATCH", key)
+                try:
+                    new_value, result = fn(self._command("GET", key))
+                except BaseException:
+                    self._command("UNWATCH")
+                    raise
+                self._command("MULTI")
+                if new_value is None:
+                    self._command("DEL", key)
+                elif ttl:
+                    self._command("SET", key, new_value, "PX", int(ttl * 1000))
+                else:
+                    self._command("SET", key, new_value)
+                if self._command("EXEC") is not None:
+                    return result
+
+    def scan_keys(self, prefix: str) -> List[str]:
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in prefix) + "*"
+        keys, cursor = [], "0"
+        while True:
+            cursor, batch = self._command(
+                "SCAN", cursor, "MATCH", pattern, "COUNT", 500
+            )
+            keys.extend(batch)
+            if cursor == "0":
+                return keys
+
+    def delete(self, *keys: str):
+        if keys:
+            self._command("DEL", *keys)
+
+    def hget(self, name: str, field: str) -> Optional[str]:
+        return self._command("HGET", name, field)
+
+    def hset(self, name: str, field: str, value: str):
+        self._command("HSET", name, field, value)
+
+    def hdel(self, name: str, *fields: str) -> int:
+        return self._command("HDEL", name, *fields) if fields else 0
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        flat = self._command("HGETALL", name)
+        return dict(zip(flat[::2], flat[1::2]))
+
+    def hlen(self, name: str) -> int:
+        return self._command("HLEN", name)
+
+    def hincrby(self, name: str, field: str, amount: int = 1) -> int:
+        return self._command("HINCRBY", name, field, amount)
+
+    def queue_push(self, name: str, member: str) -> int:
+        # Sorted set scored by a shared sequence, so rank is queue position
+        seq = self._command("INCR", f"{name}:seq")
+        self._command("ZADD", name, "NX", seq, member)
+        return self.queue_position(name, member)
+
+    def queue_pop(self, name: str) -> Optional[str]:
+        reply = self._command("ZPOPMIN", name)
+        return reply[0] if reply else None
+
+    def queue_remove(self, name: str, member: str) -> bool:
+        return self._command("ZREM", name, member) > 0
+
+    def queue_position(self, name: str, member: str) -> Optional[int]:
+        rank = self._command("ZRANK", name, member)
+        return None if rank is None else rank + 1
+
+    def queue_len(self, name: str) -> int:
+        return self._command("ZCARD", name)
+
+    def queue_members(self, name: str) -> List[str]:
+        return self._command("ZRANGE", name, 0, -1)
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 10.0) -> Iterator[None]:
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while (
+            self._command("SET", name, token, "NX", "PX", int(timeout * 1000)) is None
+        ):
+            if time.monotonic() > deadline:
+                raise StateBackendError(f"Timed out waiting for lock {name}")
+            time.sleep(LOCK_RETRY_INTERVAL)
+        try:
+            yield
+        finally:
+            self._release_lock(name, token)
+
+    def _release_lock(self, name: str, token: str):
+        """
+        Delete a lock only while it still holds our token.
+
+        If the lock expired and another client took it, the key is left
+        untouched, so that client's token and expiry survive.
+        """
+        with self._lock:
+            while True:
+                self._command("WATCH", name)
+                if self._command("GET", name) != token:
+                    self._command("UNWATCH")
+                    return
+                self._command("MULTI")
+                self._command("DEL", name)
+                if self._command("EXEC") is not None:
+                    return
+
+
+def create_state_backend(url: str) -> StateBackend:
+    """
+    Create a state backend from a URL.
+
+    Args:
+        url: ``memory://``, ``sqlite:///path`` or ``redis://[:password@]host:port/db``
+
+    Returns:
+        The configured backend
+
+    Raises:
+        ValueError: If the URL scheme is not supported
+    """
+    parsed = urlparse(url or "memory://")
+    if parsed.scheme == "memory":
+        return MemoryStateBackend()
+    if parsed.scheme == "sqlite":
+        return SQLiteStateBackend(unquote(parsed.path))
+    if parsed.scheme == "redis":
+        return RedisStateBackend(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=unquote(parsed.password) if parsed.password else None,
+        )
+    raise ValueError(f"Unsupported state backend URL: {url}")
+
+
+@lru_cache(maxsize=None)
+def get_state_backend() -> StateBackend:
+    """Return the process-wide backend selected by STATE_BACKEND_URL."""
+    url = os.getenv("STATE_BACKEND_URL", "") or "memory://"
+    backend = create_state_backend(url)
+    logger.info(f"Using {type(backend).__name__} for shared state")
+    return backend
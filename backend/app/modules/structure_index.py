@@ -0,0 +1,334 @@
+"""
+Persistent structure index for MARCUS.
+Stores every structure recognised by the OCSR engines in a local SQLite database
+so previously processed papers can be searched by similarity or substructure.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from rdkit import Chem
+
+from app.config import STRUCTURE_INDEX_PATH
+from app.modules.molecule_cache import (
+    FINGERPRINT_BITS,
+    get_canonical_structure,
+    get_structure_from_smiles,
+    pack_bitvect,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bits set in every possible byte value, used to popcount packed fingerprints
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Rows scored at a time during a search, bounding temporary memory
+SEARCH_CHUNK_SIZE = 65536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS structures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    canonical_smiles TEXT NOT NULL,
+    smiles TEXT,
+    engine TEXT NOT NULL DEFAULT '',
+    source_pdf TEXT NOT NULL DEFAULT '',
+    segment_id TEXT NOT NULL DEFAULT '',
+    morgan_fp BLOB NOT NULL,
+    pattern_fp BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (canonical_smiles, engine, source_pdf, segment_id)
+);
+CREATE INDEX IF NOT EXISTS idx_structures_canonical ON structures (canonical_smiles);
+CREATE INDEX IF NOT EXISTS idx_structures_source ON structures (source_pdf);
+"""
+
+
+def source_from_image_path(image_path: str) -> Dict[str, str]:
+    """
+    Derive the source PDF directory and segment id from a segment image path.
+
+    Segment images live in ``<SEGMENTS_DIR>/<pdf_directory>/all_segments/<segment>``;
+    uploaded images have no source PDF.
+
+    Args:
+        image_path: Path of the image that was recognised
+
+    Returns:
+        Dictionary with ``source_pdf`` and ``segment_id``
+    """
+    path = Path(image_path)
+    source_pdf = ""
+    if path.parent.name == "all_segments":
+        source_pdf = path.parent.parent.name
+    return {"source_pdf": source_pdf, "segment_id": path.stem}
+
+
+class StructureIndex:
+    """On-disk index of recognised structures with fingerprint search."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        # In-memory copy of the fingerprint columns, appended incrementally
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._morgan = np.zeros((0, 0), dtype=np.uint8)
+        self._pattern = np.zeros((0, 0), dtype=np.uint8)
+        self._morgan_counts = np.zeros(0, dtype=np.int32)
+        self._loaded_max_id = 0
+
+    def add_structure(
+        self,
+        smiles: Optional[str] = None,
+        molfile: Optional[str] = None,
+        engine: str = "",
+        source_pdf: str = "",
+        segment_id: str = "",
+    ) -> Optional[int]:
+        """
+        Add a recognised structure to the index.
+
+        The same structure from the same engine, PDF and segment is stored once.
+
+        Args:
+            smiles: SMILES of the structure (preferred)
+            molfile: Molfile of the structure, used when no SMILES is given
+            engine: OCSR engine that produced the structure
+            source_pdf: PDF directory the segment was extracted from
+            segment_id: Segment identifier within the PDF
+
+        Returns:
+            Row id of the structure, or None if it could not be parsed
+        """
+        structure = get_canonical_structure(smiles=smiles, molfile=molfile)
+        if structure is None:
+            return None
+        canonical = structure.canonical_smiles
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO structures (canonical_smiles, smiles, engine, "
+                "source_pdf, segment_id, morgan_fp, pattern_fp, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    canonical,
+                    smiles or canonical,
+                    engine,
+                    source_pdf,
+                    segment_id,
+                    structure.morgan_fp,
+                    structure.pattern_fp,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT id FROM structures WHERE canonical_smiles = ? AND engine = ? "
+                "AND source_pdf = ? AND segment_id = ?",
+                (canonical, engine, source_pdf, segment_id),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def add_ocsr_result(
+        self, result: Dict[str, Any], engine: str, image_path: str
+    ) -> Optional[int]:
+        """
+        Index the output of an OCSR call, never raising.
+
+        Args:
+            result: Result dictionary returned by process_chemical_structure
+            engine: OCSR engine used
+            image_path: Path of the recognised image
+
+        Returns:
+            Row id of the structure, or None if nothing was indexed
+        """
+        try:
+            return self.add_structure(
+                smiles=result.get("smiles"),
+                molfile=result.get("molfile"),
+                engine=engine,
+                **source_from_image_path(image_path),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to index OCSR result for {image_path}: {e}")
+            return None
+
+    def _refresh(self):
+        """Append fingerprints of rows added since the last search (needs lock)."""
+        rows = self._conn.execute(
+            "SELECT id, morgan_fp, pattern_fp FROM structures WHERE id > ? ORDER BY id",
+            (self._loaded_max_id,),
+        ).fetchall()
+        if not rows:
+            return
+
+        ids = np.array([row["id"] for row in rows], dtype=np.int64)
+        morgan = np.frombuffer(
+            b"".join(row["morgan_fp"] for row in rows), dtype=np.uint8
+        ).reshape(len(rows), -1)
+        pattern = np.frombuffer(
+            b"".join(row["pattern_fp"] for row in rows), dtype=np.uint8
+        ).reshape(len(rows), -1)
+
+        counts = POPCOUNT_TABLE[morgan].sum(axis=1, dtype=np.int32)
+
+        if self._ids.size:
+            self._ids = np.concatenate([self._ids, ids])
+            self._morgan = np.concatenate([self._morgan, morgan])
+            self._pattern = np.concatenate([self._pattern, pattern])
+            self._morgan_counts = np.concatenate([self._morgan_counts, counts])
+        else:
+            self._ids, self._morgan, self._pattern = ids, morgan, pattern
+            self._morgan_counts = counts
+        self._loaded_max_id = int(ids[-1])
+
+    def _fetch_rows(self, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch metadata rows by id."""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" for _ in ids)
+        rows = self._conn.execute(
+            "SELECT id, canonical_smiles, smiles, engine, source_pdf, segment_id, "
+            f"created_at FROM structures WHERE id IN ({placeholders})",
+            ids,
+        ).fetchall()
+        return {row["id"]: dict(row) for row in rows}
+
+    def search_similar(
+        self, smiles: str, k: int = 10, min_similarity: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the k most similar indexed structures by ECFP4 Tanimoto.
+
+        Args:
+            smiles: Query SMILES
+            k: Maximum number of hits
+            min_similarity: Minimum Tanimoto similarity of returned hits
+
+        Returns:
+            Hits sorted by decreasing similarity
+
+        Raises:
+            ValueError: If the query SMILES cannot be parsed
+        """
+        structure = get_structure_from_smiles(smiles)
+        if structure is None:
+            raise ValueError(f"Invalid query SMILES: {smiles}")
+        query = np.frombuffer(structure.morgan_fp, dtype=np.uint8)
+        query_count = int(POPCOUNT_TABLE[query].sum())
+
+        with self._lock:
+            self._refresh()
+            n = self._ids.size
+            if n == 0:
+                return []
+            similarity = np.zeros(n, dtype=np.float64)
+            for start in range(0, n, SEARCH_CHUNK_SIZE):
+                block = self._morgan[start : start + SEARCH_CHUNK_SIZE]
+                intersection = POPCOUNT_TABLE[block & query].sum(axis=1, dtype=np.int32)
+                union = (
+                    self._morgan_counts[start : start + SEARCH_CHUNK_SIZE]
+                    + query_count
+                    - intersection
+                )
+                similarity[start : start + block.shape[0]] = np.where(
+                    union > 0, intersection / np.maximum(union, 1), 0.0
+                )
+
+            k = min(k, n)
+            top = np.argpartition(-similarity, k - 1)[:k]
+            top = top[np.argsort(-similarity[top], kind="stable")]
+            top = top[similarity[top] >= min_similarity]
+            hit_ids = self._ids[top].tolist()
+            rows = self._fetch_rows(hit_ids)
+
+        return [
+            {**rows[row_id], "similarity": float(similarity[i])}
+            for row_id, i in zip(hit_ids, top.tolist())
+            if row_id in rows
+        ]
+
+    def search_substructure(
+        self, query: str, query_type: str = "smiles", limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Return indexed structures containing a substructure.
+
+        Candidates are screened with pattern fingerprints and only the survivors
+        are verified with an RDKit substructure match.
+
+        Args:
+            query: Query SMILES or SMARTS
+            query_type: "smiles" or "smarts"
+            limit: Maximum number of hits
+
+        Returns:
+            Matching structures in index order
+
+        Raises:
+            ValueError: If the query cannot be parsed
+        """
+        if query_type == "smarts":
+            query_mol = Chem.MolFromSmarts(query)
+            if query_mol is None:
+                raise ValueError(f"Invalid query SMARTS: {query}")
+            query_fp = np.frombuffer(
+                pack_bitvect(
+                    Chem.PatternFingerprint(query_mol, fpSize=FINGERPRINT_BITS)
+                ),
+                dtype=np.uint8,
+            )
+        else:
+            structure = get_structure_from_smiles(query)
+            if structure is None:
+                raise ValueError(f"Invalid query SMILES: {query}")
+            query_mol = structure.to_mol()
+            query_fp = np.frombuffer(structure.pattern_fp, dtype=np.uint8)
+
+        with self._lock:
+            self._refresh()
+            candidates = []
+            for start in range(0, self._ids.size, SEARCH_CHUNK_SIZE):
+                block = self._pattern[start : start + SEARCH_CHUNK_SIZE]
+                screened = np.all((block & query_fp) == query_fp, axis=1)
+                candidates.extend(
+                    self._ids[start : start + block.shape[0]][screened].tolist()
+                )
+
+            hits = []
+            for offset in range(0, len(candidates), 500):
+                rows = self._fetch_rows(candidates[offset : offset + 500])
+                for row_id in candidates[offset : offset + 500]:
+                    row = rows.get(row_id)
+                    mol = Chem.MolFromSmiles(row["canonical_smiles"]) if row else None
+                    if mol is not None and mol.HasSubstructMatch(query_mol):
+                        hits.append(row)
+                        if len(hits) >= limit:
+                            return hits
+        return hits
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the number of indexed structures, unique structures and PDFs."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS structures, "
+                "COUNT(DISTINCT canonical_smiles) AS unique_structures, "
+                "COUNT(DISTINCT NULLIF(source_pdf, '')) AS source_pdfs "
+                "FROM structures"
+            ).fetchone()
+        return {**dict(row), "db_path": self.db_path}
+
+
+# Global structure index instance
+structure_index = StructureIndex(STRUCTURE_INDEX_PATH)
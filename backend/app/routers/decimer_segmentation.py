@@ -15,6 +15,7 @@ from fastapi.responses import FileResponse
 from app.schemas.healthcheck import HealthCheck
 from app.schemas.error import BadRequestModel, ErrorResponse, NotFoundModel
 from app.config import PDF_DIR, SEGMENTS_DIR
+from app.security.file_validator import stream_upload
 from app.modules.decimer_segmentation_wrapper import (
     get_doi_from_file,
     get_complete_segments,
@@ -111,9 +112,7 @@ async def extract_doi(
         file_path = os.path.join(PDF_DIR, safe_filename)
 
         # Save the uploaded file
-        with open(file_path, "wb") as buffer:
-            content = await pdf_file.read()
-            buffer.write(content)
+        await stream_upload(pdf_file, file_path)
 
         # Process the PDF file to extract DOI
         doi_result = get_doi_from_file(file_path)
@@ -190,9 +189,7 @@ async def extract_segments(
 
         # Only save the file if it doesn't already exist
         if not file_exists:
-            with open(file_path, "wb") as buffer:
-                content = await pdf_file.read()
-                buffer.write(content)
+            await stream_upload(pdf_file, file_path)
         else:
             # If the file exists but we need the content for processing
             # We don't need to read the file here as get_complete_segments will handle it
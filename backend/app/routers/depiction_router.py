@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import json
 from typing import Optional, Literal, List
 from fastapi import APIRouter, Body, Form, HTTPException, Response, status
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
-from app.modules.cdk_wrapper import get_CDK_IAtomContainer, get_CDK_SDG_mol
+from app.modules.cdk_wrapper import (
+    get_CDK_IAtomContainer,
+    get_CDK_SDG_mol,
+    get_cdk_parse_cache_info,
+    get_jvm_metrics,
+    iter_smiles_to_molfiles,
+)
 from app.schemas.healthcheck import HealthCheck
 from app.schemas.error import BadRequestModel, ErrorResponse, NotFoundModel
-from app.modules.depiction import generate_depiction
+from app.modules.depiction import (
+    generate_depiction,
+    generate_grid_depiction,
+    get_smarts_cache_info,
+)
 
 # Create the router
 router = APIRouter(
@@ -63,6 +74,64 @@ class DepictionRequest(BaseModel):
         populate_by_name = True
 
 
+class GridStructure(BaseModel):
+    """Model for a single structure in a grid depiction request."""
+
+    smiles: Optional[str] = Field(None, description="SMILES string to depict")
+    molfile: Optional[str] = Field(None, description="Molfile string to depict")
+    use_molfile_directly: Optional[bool] = Field(
+        False,
+        alias="useMolfileDirectly",
+        description="Whether to use molfile directly with CDK without generating coordinates",
+    )
+
+    class Config:
+        populate_by_name = True
+
+
+class GridDepictionRequest(BaseModel):
+    """Model for grid depiction request parameters."""
+
+    structures: List[GridStructure] = Field(
+        ...,
+        description="Structures to render, in cell order",
+        min_length=1,
+        max_length=200,
+    )
+    columns: int = Field(4, description="Maximum number of grid columns", ge=1, le=20)
+    cell_width: int = Field(
+        256,
+        alias="cellWidth",
+        description="Width of each cell in pixels",
+        ge=50,
+        le=1000,
+    )
+    cell_height: int = Field(
+        256,
+        alias="cellHeight",
+        description="Height of each cell in pixels",
+        ge=50,
+        le=1000,
+    )
+    kekulize: bool = Field(True, description="Whether to kekulize the molecules")
+    cip: bool = Field(
+        True, description="Whether to display CIP stereochemistry annotations"
+    )
+    unicolor: bool = Field(
+        False, description="Whether to use a single color for all atoms"
+    )
+    highlight: str = Field("", description="SMARTS pattern to highlight")
+    transparent: bool = Field(
+        False, description="Whether to use transparent background"
+    )
+    format: Literal["svg", "png", "base64"] = Field(
+        "svg", description="Output format (PNG grids are returned base64-encoded)"
+    )
+
+    class Config:
+        populate_by_name = True
+
+
 class SmilesToMolfileRequest(BaseModel):
     """Model for SMILES to molfile conversion request."""
 
@@ -80,6 +149,22 @@ class SmilesToMolfileResponse(BaseModel):
     success: bool = Field(True, description="Whether the conversion was successful")
 
 
+class BulkSmilesToMolfileRequest(BaseModel):
+    """Model for bulk SMILES to molfile conversion request."""
+
+    smiles: List[str] = Field(
+        ...,
+        description="SMILES strings to convert, in output order",
+        min_length=1,
+        max_length=10000,
+    )
+    outputFormat: Literal["sdf", "ndjson"] = Field(
+        "ndjson",
+        description="Stream format: an SDF file or one JSON object per line",
+    )
+    v3000: bool = Field(False, description="Whether to write V3000 molfiles")
+
+
 # Health check endpoint
 @router.get("/", include_in_schema=False)
 @router.get(
@@ -100,6 +185,30 @@ def get_health() -> HealthCheck:
     return HealthCheck(status="OK")
 
 
+# Depiction metrics endpoint
+@router.get(
+    "/metrics",
+    summary="Get depiction subsystem metrics",
+    response_description="Return depiction cache statistics",
+    status_code=status.HTTP_200_OK,
+)
+async def get_depiction_metrics():
+    """
+    Return runtime statistics of the depiction subsystem.
+
+    Reports hit/miss counts of the compiled SMARTS highlight pattern cache and
+    the parsed molecule caches, and heap, garbage collector and thread statistics of this worker's CDK JVM.
+
+    Returns:
+        JSON: Depiction metrics
+    """
+    return {
+        "smarts_pattern_cache": get_smarts_cache_info(),
+        "parse_cache": get_cdk_parse_cache_info(),
+        "jvm": get_jvm_metrics(),
+    }
+
+
 # Depiction endpoint (JSON body)
 @router.post(
     "/generate",
@@ -420,6 +529,57 @@ async def batch_depiction(
     return {"results": results}
 
 
+# Grid depiction endpoint
+@router.post(
+    "/grid",
+    summary="Generate a grid depiction of multiple structures",
+    response_description="Return a single grid depiction with a per-cell index",
+    status_code=status.HTTP_200_OK,
+)
+async def grid_depiction(request: GridDepictionRequest = Body(...)):
+    """
+    Render many structures into one SVG or PNG grid in a single CDK call.
+
+    This replaces one /generate call per molecule for galleries and comparison
+    tables. The response contains the grid image and a ``cells`` index giving the
+    pixel rectangle of each structure, in input order, so the client can crop or
+    overlay individual cells.
+
+    The cell rectangles are approximate. They split the image evenly into
+    ``cell_width`` x ``cell_height`` tiles, but CDK also leaves a margin around
+    the grid and padding between cells. A drawing can therefore sit a few
+    pixels off its rectangle, most visibly in the last row and column. Pad
+    crops slightly rather than relying on exact edges.
+
+    Args:
+        request: Grid depiction request parameters
+
+    Returns:
+        JSON: Grid depiction, its dimensions and the cell index
+    """
+    try:
+        return generate_grid_depiction(
+            structures=[structure.model_dump() for structure in request.structures],
+            columns=request.columns,
+            cell_size=(request.cell_width, request.cell_height),
+            kekulize=request.kekulize,
+            cip=request.cip,
+            unicolor=request.unicolor,
+            highlight=request.highlight,
+            transparent=request.transparent,
+            format=request.format,
+        )
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating grid depiction: {str(e)}",
+        )
+
+
 # SMILES to molfile conversion endpoint
 @router.post(
     "/smiles_to_molfile",
@@ -475,3 +635,50 @@ async def convert_smiles_to_molfile(request: SmilesToMolfileRequest = Body(...))
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing request: {str(e)}",
         )
+
+
+def _stream_bulk_molfiles(smiles_list: List[str], output_format: str, v3000: bool):
+    """Serialise bulk conversion results as SDF records or NDJSON lines."""
+    records = iter_smiles_to_molfiles(
+        smiles_list, V3000=v3000, sdf_properties=output_format == "sdf"
+    )
+    for record in records:
+        if output_format == "sdf":
+            yield record["molfile"]
+        else:
+            yield json.dumps(record) + "\n"
+
+
+# Bulk SMILES to molfile conversion endpoint
+@router.post(
+    "/smiles_to_molfile/bulk",
+    summary="Convert many SMILES to molfiles as a stream",
+    response_description="Stream of molfiles as SDF or NDJSON",
+    status_code=status.HTTP_200_OK,
+)
+async def convert_smiles_to_molfile_bulk(
+    request: BulkSmilesToMolfileRequest = Body(...),
+):
+    """
+    Convert a batch of SMILES strings to molfiles in a single streamed response.
+
+    Structure layout runs on a worker pool and results are streamed in input
+    order. Failed conversions do not abort the stream: NDJSON lines carry
+    ``success: false`` and an ``error`` message, and SDF output contains an
+    empty record with an ``error`` data item in the failed position.
+
+    Args:
+        request: Bulk SMILES to molfile conversion request
+
+    Returns:
+        StreamingResponse: SDF file or newline-delimited JSON records
+    """
+    media_type = (
+        "chemical/x-mdl-sdfile"
+        if request.outputFormat == "sdf"
+        else "application/x-ndjson"
+    )
+    return StreamingResponse(
+        _stream_bulk_molfiles(request.smiles, request.outputFormat, request.v3000),
+        media_type=media_type,
+    )
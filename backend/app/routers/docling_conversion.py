@@ -19,7 +19,7 @@ from app.modules.dockling_wrapper import (
     extract_from_docling_document,
     combine_to_paragraph,
 )
-from app.security.file_validator import validate_pdf_upload
+from app.security.file_validator import stream_upload, validate_pdf_upload
 
 logger = logging.getLogger(__name__)
 
@@ -79,9 +79,18 @@ async def extract_pdf_json(
     Returns:
         JSON: The extracted document structure
     """
-    # Comprehensive file validation
+    # Generate unique filename to prevent collisions
+    unique_id = str(uuid.uuid4())[:8]
+    original_filename = pdf_file.filename
+    filename_parts = os.path.splitext(original_filename)
+    safe_filename = f"{filename_parts[0]}_{unique_id}{filename_parts[1]}"
+
+    # Create the full file path
+    file_path = os.path.join(PDF_DIR, safe_filename)
+
+    # Comprehensive file validation, saving the file as it is read
     try:
-        validation_result = await validate_pdf_upload(pdf_file)
+        validation_result = await validate_pdf_upload(pdf_file, file_path)
         logger.info(
             f"File validation successful: {validation_result['filename']} "
             f"({validation_result['size']} bytes, hash: {validation_result['hash'][:16]}...)"
@@ -96,23 +105,9 @@ async def extract_pdf_json(
             detail="File validation failed due to server error",
         )
 
-    try:
-        # Generate unique filename to prevent collisions
-        unique_id = str(uuid.uuid4())[:8]
-        original_filename = pdf_file.filename
-        filename_parts = os.path.splitext(original_filename)
-        safe_filename = f"{filename_parts[0]}_{unique_id}{filename_parts[1]}"
-
-        # Create the full file path
-        file_path = os.path.join(PDF_DIR, safe_filename)
-
-        # Save the uploaded file
-        with open(file_path, "wb") as buffer:
-            content = await pdf_file.read()
-            buffer.write(content)
-
-        logger.info(f"File saved successfully: {safe_filename}")
+    logger.info(f"File saved successfully: {safe_filename}")
 
+    try:
         # Process the PDF file
         json_data = get_converted_document(file_path, number_of_pages=pages)
 
@@ -168,9 +163,7 @@ async def extract_pdf_text(
             pass
         else:
             # Save the uploaded file with original name
-            with open(file_path, "wb") as buffer:
-                content = await pdf_file.read()
-                buffer.write(content)
+            await stream_upload(pdf_file, file_path)
 
         # Process the PDF file
         json_data = get_converted_document(file_path, number_of_pages=pages)
@@ -9,13 +9,16 @@ from fastapi import (
     UploadFile,
     status,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
 from app.schemas.healthcheck import HealthCheck
 from app.schemas.error import BadRequestModel, ErrorResponse, NotFoundModel
-from app.modules.ocsr_wrapper import process_chemical_structure, save_uploaded_image
+from app.modules.ocsr_wrapper import process_chemical_structure, uploaded_image_path
 from app.modules.depiction import generate_depiction
+from app.modules.structure_index import structure_index
 from app.config import SEGMENTS_DIR, IMAGES_DIR
+from app.security.file_validator import stream_upload
 
 # Create a router for the OCSR endpoints
 router = APIRouter(
@@ -190,9 +193,9 @@ async def generate_smiles(
                     detail="Uploaded file must be an image (PNG, JPG, TIFF, or BMP)",
                 )
 
-            # Read and save the uploaded file
-            content = await image_file.read()
-            file_path = save_uploaded_image(content, image_file.filename)
+            # Save the uploaded file
+            file_path = uploaded_image_path(image_file.filename)
+            await stream_upload(image_file, file_path)
         else:
             # Use the provided path and try to find the actual file
             try:
@@ -211,6 +214,11 @@ async def generate_smiles(
             hand_drawn=hand_drawn,
         )
 
+        # Keep the recognised structure searchable across papers
+        await run_in_threadpool(
+            structure_index.add_ocsr_result, result, engine, file_path
+        )
+
         # Add file path to result
         result["file_path"] = os.path.basename(file_path)
 
@@ -285,9 +293,9 @@ async def generate_molfile(
                     detail="Uploaded file must be an image (PNG, JPG, TIFF, or BMP)",
                 )
 
-            # Read and save the uploaded file
-            content = await image_file.read()
-            file_path = save_uploaded_image(content, image_file.filename)
+            # Save the uploaded file
+            file_path = uploaded_image_path(image_file.filename)
+            await stream_upload(image_file, file_path)
         else:
             # Use the provided path and try to find the actual file
             try:
@@ -303,6 +311,11 @@ async def generate_molfile(
             file_path=file_path, engine=engine, output_type="molfile"
         )
 
+        # Keep the recognised structure searchable across papers
+        await run_in_threadpool(
+            structure_index.add_ocsr_result, result, engine, file_path
+        )
+
         # Add file path to result
         result["file_path"] = os.path.basename(file_path)
 
@@ -383,9 +396,9 @@ async def generate_both(
                     detail="Uploaded file must be an image (PNG, JPG, TIFF, or BMP)",
                 )
 
-            # Read and save the uploaded file
-            content = await image_file.read()
-            file_path = save_uploaded_image(content, image_file.filename)
+            # Save the uploaded file
+            file_path = uploaded_image_path(image_file.filename)
+            await stream_upload(image_file, file_path)
         else:
             # Use the provided path and try to find the actual file
             try:
@@ -404,6 +417,11 @@ async def generate_both(
             hand_drawn=hand_drawn,
         )
 
+        # Keep the recognised structure searchable across papers
+        await run_in_threadpool(
+            structure_index.add_ocsr_result, result, engine, file_path
+        )
+
         # Add file path to result
         result["file_path"] = os.path.basename(file_path)
 
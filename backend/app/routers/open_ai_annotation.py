@@ -1,21 +1,13 @@
 from __future__ import annotations
 import json
-import os
-import datetime
-import hashlib
-from typing import List, Dict, Any
-from fastapi import APIRouter, Body, HTTPException, status
+from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Body, Header, HTTPException, Query, status
+from app.config import ADMIN_API_KEY
 from app.schemas.healthcheck import HealthCheck
-from app.modules.openai_wrapper import (
-    get_extracted_json,
-    get_extracted_positions,
-    get_spans,
-)
-from app.config import UPLOAD_DIR
-
-# Create a directory for OpenAI annotation results
-OPENAI_RESULTS_DIR = os.path.join(UPLOAD_DIR, "openai_results")
-os.makedirs(OPENAI_RESULTS_DIR, exist_ok=True)
+from app.modules.extraction_store import extraction_store
+from app.modules.llm_cache import llm_cache
+from app.modules.openai_wrapper import get_spans, spans_to_json
+from app.security.validators import verify_admin_key
 
 router = APIRouter(
     prefix="/openai",
@@ -52,7 +44,7 @@ def save_extraction_result(
     input_text: str, extracted_json: Any, positions: List[Dict[str, Any]]
 ) -> str:
     """
-    Save the extraction results to a local JSON file with consistent naming.
+    Save the extraction results to the extraction store with consistent naming.
 
     Args:
         input_text: The original text input
@@ -62,37 +54,7 @@ def save_extraction_result(
     Returns:
         str: The filename of the saved result
     """
-    text_hash = hashlib.md5(input_text.encode()).hexdigest()[:8]
-
-    # Create a filename based on content hash rather than timestamp
-    filename = f"extraction_{text_hash}.json"
-    file_path = os.path.join(OPENAI_RESULTS_DIR, filename)
-
-    # Check if file already exists
-    if os.path.exists(file_path):
-        # Read existing file to check if it contains the same input text
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                existing_data = json.load(f)
-                if existing_data.get("input_text") == input_text:
-                    # Return existing filename if data matches
-                    return filename
-        except:
-            pass  # If reading fails, overwrite file
-
-    # Create a data structure to save
-    result_data = {
-        "timestamp": datetime.datetime.now().isoformat(),
-        "input_text": input_text,
-        "extracted_json": extracted_json,
-        "positions": positions,
-    }
-
-    # Save to file
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(result_data, f, ensure_ascii=False, indent=2)
-
-    return filename
+    return extraction_store.save(input_text, extracted_json, positions)
 
 
 @router.post(
@@ -103,21 +65,24 @@ def save_extraction_result(
 )
 async def extract_json(
     text: str = Body(..., description="Text to process", embed=True),
+    use_cache: bool = Body(
+        True, description="Set to false to bypass the LLM response cache", embed=True
+    ),
 ):
     """
     Extract structured JSON data from text using OpenAI.
 
     Args:
         text: The text to process
+        use_cache: Whether cached LLM responses may be used
 
     Returns:
         JSON: The extracted structured data
     """
     try:
-        result = get_extracted_json(text)
-
-        # Get positions to save alongside the JSON
-        positions = get_extracted_positions(text)
+        # One extraction provides both the JSON and the positions to save
+        extracted_text, positions = await get_spans(text, use_cache=use_cache)
+        result = spans_to_json(extracted_text)
 
         # Save results locally
         saved_filename = save_extraction_result(text, result, positions)
@@ -142,21 +107,24 @@ async def extract_json(
 )
 async def extract_positions(
     text: str = Body(..., description="Text to process", embed=True),
+    use_cache: bool = Body(
+        True, description="Set to false to bypass the LLM response cache", embed=True
+    ),
 ):
     """
     Extract entity positions from text using OpenAI.
 
     Args:
         text: The text to process
+        use_cache: Whether cached LLM responses may be used
 
     Returns:
         JSON: A list of entity positions with start and end offsets
     """
     try:
-        positions = get_extracted_positions(text)
-
-        # Get JSON to save alongside the positions
-        extracted_json = get_extracted_json(text)
+        # One extraction provides both the positions and the JSON to save
+        extracted_text, positions = await get_spans(text, use_cache=use_cache)
+        extracted_json = spans_to_json(extracted_text)
 
         # Save results locally
         saved_filename = save_extraction_result(text, extracted_json, positions)
@@ -181,18 +149,22 @@ async def extract_positions(
 )
 async def extract_all(
     text: str = Body(..., description="Text to process", embed=True),
+    use_cache: bool = Body(
+        True, description="Set to false to bypass the LLM response cache", embed=True
+    ),
 ):
     """
     Extract both JSON data and entity positions from text using OpenAI.
 
     Args:
         text: The text to process
+        use_cache: Whether cached LLM responses may be used
 
     Returns:
         JSON: Both the extracted JSON and positions
     """
     try:
-        extracted_text, positions = get_spans(text)
+        extracted_text, positions = await get_spans(text, use_cache=use_cache)
 
         # Try to parse extracted_text as JSON
         try:
@@ -221,53 +193,62 @@ async def extract_all(
 
 @router.get(
     "/list_extractions",
-    summary="List all saved extractions",
-    response_description="Return a list of saved extraction results",
+    summary="List saved extractions",
+    response_description="Return a page of saved extraction results",
     status_code=status.HTTP_200_OK,
 )
-async def list_extractions():
+async def list_extractions(
+    limit: Optional[int] = Query(
+        None, ge=1, description="Maximum number of results; all of them if omitted"
+    ),
+    offset: int = Query(0, ge=0, description="Number of results to skip"),
+    since: Optional[float] = Query(
+        None, description="Only results created at or after this Unix time"
+    ),
+    until: Optional[float] = Query(
+        None, description="Only results created before this Unix time"
+    ),
+    label: Optional[str] = Query(
+        None, description="Only results with entities of this label"
+    ),
+    min_entities: Optional[int] = Query(
+        None, ge=0, description="Only results with at least this many entities"
+    ),
+    search: Optional[str] = Query(
+        None, description="Only results whose input text contains this string"
+    ),
+):
     """
-    List all saved extraction results.
+    List saved extraction results, newest first.
+
+    Args:
+        limit: Maximum number of results; all matching results if omitted
+        offset: Number of results to skip
+        since: Only results created at or after this Unix time
+        until: Only results created before this Unix time
+        label: Only results with at least one entity of this label
+        min_entities: Only results with at least this many located entities
+        search: Only results whose input text contains this string
 
     Returns:
-        JSON: A list of extraction result filenames and metadata
+        JSON: A page of extraction result filenames and metadata, and the total
     """
     try:
-        extraction_files = []
-        for filename in os.listdir(OPENAI_RESULTS_DIR):
-            if filename.startswith("extraction_") and filename.endswith(".json"):
-                file_path = os.path.join(OPENAI_RESULTS_DIR, filename)
-                file_stats = os.stat(file_path)
-
-                # Try to read some minimal metadata
-                metadata = {}
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        metadata = {
-                            "timestamp": data.get("timestamp", ""),
-                            "input_text_preview": (
-                                data.get("input_text", "")[:100] + "..."
-                                if len(data.get("input_text", "")) > 100
-                                else data.get("input_text", "")
-                            ),
-                        }
-                except:
-                    pass
-
-                extraction_files.append(
-                    {
-                        "filename": filename,
-                        "size_bytes": file_stats.st_size,
-                        "created_time": file_stats.st_ctime,
-                        **metadata,
-                    }
-                )
-
-        # Sort by creation time (newest first)
-        extraction_files.sort(key=lambda x: x["created_time"], reverse=True)
-
-        return {"extraction_files": extraction_files}
+        extraction_files, total = extraction_store.list(
+            limit=limit,
+            offset=offset,
+            since=since,
+            until=until,
+            label=label,
+            min_entities=min_entities,
+            search=search,
+        )
+        return {
+            "extraction_files": extraction_files,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+        }
 
     except Exception as e:
         raise HTTPException(
@@ -293,7 +274,7 @@ async def get_extraction(filename: str):
         JSON: The complete extraction result
     """
     try:
-        # Validate the filename to prevent directory traversal
+        # Validate the filename format
         if (
             ".." in filename
             or not filename.startswith("extraction_")
@@ -303,19 +284,13 @@ async def get_extraction(filename: str):
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filename"
             )
 
-        file_path = os.path.join(OPENAI_RESULTS_DIR, filename)
-
-        # Check if the file exists
-        if not os.path.exists(file_path) or not os.path.isfile(file_path):
+        data = extraction_store.get(filename)
+        if data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Extraction result not found: {filename}",
             )
 
-        # Read and return the file
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
         return data
 
     except HTTPException:
@@ -326,3 +301,50 @@ async def get_extraction(filename: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving extraction result: {str(e)}",
         )
+
+
+@router.get(
+    "/metrics",
+    summary="Get OpenAI annotation metrics",
+    response_description="Return LLM response cache statistics",
+    status_code=status.HTTP_200_OK,
+)
+async def get_annotation_metrics():
+    """
+    Return hit/miss counts and size of the persistent LLM response cache.
+
+    Returns:
+        JSON: Annotation metrics
+    """
+    return {"llm_cache": llm_cache.get_stats()}
+
+
+@router.delete(
+    "/cache",
+    summary="Clear the LLM response cache",
+    response_description="Return the number of removed cache entries",
+    status_code=status.HTTP_200_OK,
+)
+async def clear_llm_cache(x_admin_key: Optional[str] = Header(None)):
+    """
+    Remove all cached LLM responses, e.g. after changing the prompt or model.
+
+    Args:
+        x_admin_key: Admin key from the X-Admin-Key header, matching ADMIN_API_KEY
+
+    Returns:
+        JSON: Number of removed entries
+    """
+    if not verify_admin_key(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="A valid X-Admin-Key header is required",
+        )
+
+    try:
+        return {"removed": llm_cache.clear()}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error clearing LLM cache: {str(e)}",
+        )
@@ -5,132 +5,19 @@ Improved WebSocket router for real-time session management and user queue update
 import asyncio
 import json
 import logging
-from typing import Dict, Set
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query
 from fastapi.responses import JSONResponse
 
+from app.modules.admission_control import admission_controller
+from app.modules.session_broadcast import SessionWebSocketManager
 from app.modules.session_manager import session_manager
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/session", tags=["session"])
 
-
-class SessionWebSocketManager:
-    """Manages WebSocket connections for session updates with improved performance."""
-
-    def __init__(self):
-        self.connections: Dict[str, WebSocket] = {}
-        self._broadcast_lock = asyncio.Lock()
-        self._broadcast_queue = asyncio.Queue()
-        self._is_broadcasting = False
-
-        # Start background broadcast worker
-        asyncio.create_task(self._broadcast_worker())
-
-    async def connect(self, websocket: WebSocket, session_id: str):
-        """Accept a new WebSocket connection."""
-        await websocket.accept()
-        self.connections[session_id] = websocket
-        logger.info(
-            f"WebSocket connected for session {session_id}. Total connections: {len(self.connections)}"
-        )
-
-    def disconnect(self, session_id: str):
-        """Remove a WebSocket connection."""
-        if session_id in self.connections:
-            del self.connections[session_id]
-            logger.info(
-                f"WebSocket disconnected for session {session_id}. Total connections: {len(self.connections)}"
-            )
-
-    async def send_message(self, session_id: str, message: dict) -> bool:
-        """Send a message to a specific session."""
-        if session_id not in self.connections:
-            return False
-
-        try:
-            websocket = self.connections[session_id]
-            await asyncio.wait_for(
-                websocket.send_text(json.dumps(message)),
-                timeout=2.0,  # Shorter timeout to prevent blocking
-            )
-            return True
-        except (Exception, asyncio.TimeoutError) as e:
-            logger.warning(f"Failed to send message to session {session_id}: {e}")
-            self.disconnect(session_id)
-            return False
-
-    async def _broadcast_worker(self):
-        """Background worker that processes broadcast requests."""
-        while True:
-            try:
-                # Wait for broadcast request
-                await self._broadcast_queue.get()
-
-                # Process the broadcast
-                await self._do_broadcast_queue_update()
-
-            except Exception as e:
-                logger.error(f"Broadcast worker error: {e}")
-                await asyncio.sleep(1)  # Prevent tight loop on persistent errors
-
-    async def _do_broadcast_queue_update(self):
-        """Actually perform the broadcast to all connected sessions."""
-        if not self.connections:
-            return
-
-        try:
-            queue_status = await session_manager.get_queue_status()
-            session_ids = list(
-                self.connections.keys()
-            )  # Snapshot to avoid modification during iteration
-
-            # Create all tasks first
-            tasks = []
-            for session_id in session_ids:
-                if session_id in self.connections:  # Double-check session still exists
-                    task = asyncio.create_task(
-                        self._send_queue_update(session_id, queue_status)
-                    )
-                    tasks.append(task)
-
-            # Execute all sends concurrently with shorter timeout
-            if tasks:
-                await asyncio.wait_for(
-                    asyncio.gather(*tasks, return_exceptions=True), timeout=3.0
-                )
-
-        except asyncio.TimeoutError:
-            logger.warning("Broadcast queue update timed out after 3 seconds")
-        except Exception as e:
-            logger.error(f"Error during broadcast queue update: {e}")
-
-    async def _send_queue_update(self, session_id: str, queue_status: dict):
-        """Send queue update to a specific session."""
-        try:
-            session_status = await session_manager.get_session_status(session_id)
-            if session_status:
-                message = {
-                    "type": "queue_update",
-                    "session_status": session_status,
-                    "queue_status": queue_status,
-                }
-                await self.send_message(session_id, message)
-        except Exception as e:
-            logger.error(f"Error sending queue update to {session_id}: {e}")
-
-    async def broadcast_queue_update(self):
-        """Queue a broadcast request (non-blocking)."""
-        try:
-            # Add to queue without blocking
-            self._broadcast_queue.put_nowait("broadcast_request")
-        except asyncio.QueueFull:
-            logger.warning("Broadcast queue is full, skipping broadcast")
-
-
 # Global WebSocket manager
-ws_manager = SessionWebSocketManager()
+ws_manager = SessionWebSocketManager(session_manager)
 
 
 @router.websocket("/ws/{session_id}")
@@ -150,19 +37,10 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                 continue
 
             if message.get("type") == "heartbeat":
-                # Update session activity (non-blocking)
-                asyncio.create_task(session_manager.update_session_activity(session_id))
-
-                # Send current status back
-                session_status = await session_manager.get_session_status(session_id)
-                if session_status:
-                    queue_status = await session_manager.get_queue_status()
-                    response = {
-                        "type": "status_update",
-                        "session_status": session_status,
-                        "queue_status": queue_status,
-                    }
-                    await websocket.send_text(json.dumps(response))
+                # Acknowledge with the state last broadcast to this client
+                reply = await ws_manager.heartbeat_reply(session_id)
+                if reply:
+                    await websocket.send_text(reply)
 
             elif message.get("type") == "disconnect":
                 # User wants to disconnect
@@ -265,7 +143,12 @@ async def get_queue_status():
     """Get overall queue status."""
     try:
         queue_status = await session_manager.get_queue_status()
-        return {"success": True, "queue_status": queue_status}
+        return {
+            "success": True,
+            "queue_status": queue_status,
+            "admission": admission_controller.get_stats(),
+            "statistics": session_manager.get_statistics(),
+        }
     except Exception as e:
         logger.error(f"Failed to get queue status: {e}")
         raise HTTPException(status_code=500, detail="Failed to get queue status")
@@ -1,11 +1,27 @@
 from __future__ import annotations
-from fastapi import APIRouter, Body, HTTPException, status
+from fastapi import APIRouter, Body, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 
-from rdkit import Chem
-from rdkit.Chem import AllChem
-from rdkit import DataStructs
-from rdkit.Chem import rdFMCS
+from app.modules.molecule_cache import (
+    get_molecule_cache_info,
+    get_structure_from_molfile,
+)
+from app.modules.similarity import (
+    MCSCancelledError,
+    TooManyNeighboursError,
+    cluster_structures,
+    compare_smiles_list,
+    find_mcs_cancellable,
+    get_mcs_cache_info,
+)
+from app.modules.structure_index import structure_index
 from app.schemas.rdkit_schema import (
+    ClusterRequest,
+    ClusterResponse,
+    IndexStructureRequest,
+    SimilaritySearchRequest,
+    StructureSearchResponse,
+    SubstructureSearchRequest,
     SmilesComparisonRequest,
     MolfilesMCSRequest,
     MCSResponse,
@@ -35,11 +51,16 @@ router = APIRouter(
     status_code=status.HTTP_200_OK,
     response_model=MCSResponse,
 )
-async def find_mcs(request: MolfilesMCSRequest = Body(...)):
+async def find_mcs(raw_request: Request, request: MolfilesMCSRequest = Body(...)):
     """
     Find the Maximum Common Substructure (MCS) between a list of molfiles.
 
+    The MCS runs on a worker thread so it never blocks other requests, results
+    are cached on the set of canonical structures, and the calculation is
+    abandoned if the client disconnects.
+
     Args:
+        raw_request: The incoming HTTP request, used to detect disconnects
         request: Object containing list of molfiles and engine names
 
     Returns:
@@ -68,45 +89,25 @@ async def find_mcs(request: MolfilesMCSRequest = Body(...)):
                 detail="At least 2 molfiles are required to find MCS",
             )
 
-        # Create molecules from molfiles
+        # Parse molfiles through the shared molecule cache
         molecules = []
-        valid_mols = []
-        engine_to_mol = {}
-
-        for i, molfile in enumerate(molfiles):
-            engine = engine_names[i]
-            mol = Chem.MolFromMolBlock(molfile, sanitize=True)
-
-            if mol is not None:
-                molecules.append(
-                    {
-                        "engine": engine,
-                        "molecule": mol,
-                        "atom_count": mol.GetNumAtoms(),
-                        "bond_count": mol.GetNumBonds(),
-                    }
-                )
-                valid_mols.append(mol)
-                engine_to_mol[engine] = mol
-            else:
-                # Try to sanitize separately to catch errors
-                try:
-                    mol = Chem.MolFromMolBlock(molfile, sanitize=False)
-                    Chem.SanitizeMol(mol)
-                    molecules.append(
-                        {
-                            "engine": engine,
-                            "molecule": mol,
-                            "atom_count": mol.GetNumAtoms(),
-                            "bond_count": mol.GetNumBonds(),
-                        }
-                    )
-                    valid_mols.append(mol)
-                    engine_to_mol[engine] = mol
-                except Exception as e:
-                    print(f"Error parsing molfile from {engine}: {str(e)}")
-
-        if len(valid_mols) < 2:
+        valid_structures = []
+
+        for engine, molfile in zip(engine_names, molfiles):
+            structure = get_structure_from_molfile(molfile)
+            if structure is None:
+                print(f"Error parsing molfile from {engine}")
+                continue
+            molecules.append(
+                {
+                    "engine": engine,
+                    "atom_count": structure.num_atoms,
+                    "bond_count": structure.num_bonds,
+                }
+            )
+            valid_structures.append(structure)
+
+        if len(valid_structures) < 2:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="At least 2 valid molecules are required to find MCS",
@@ -114,43 +115,28 @@ async def find_mcs(request: MolfilesMCSRequest = Body(...)):
 
         # Find MCS with proper parameters
         try:
-            # Find the MCS using rdFMCS (correct module name)
-            mcs_result = rdFMCS.FindMCS(
-                valid_mols,
-                # Parameters for MCS finding
-                atomCompare=rdFMCS.AtomCompare.CompareElements,
-                bondCompare=rdFMCS.BondCompare.CompareOrder,
-                completeRingsOnly=True,
-                timeout=5,  # 5 second timeout
-                matchValences=False,
+            mcs_result = await find_mcs_cancellable(
+                valid_structures, is_disconnected=raw_request.is_disconnected
             )
 
-            if mcs_result.canceled:
+            if mcs_result["timed_out"]:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="MCS calculation timed out",
                 )
 
             # Get the MCS SMARTS pattern
-            mcs_smarts = mcs_result.smartsString
-
-            # Convert molecule data to serializable format
-            mol_data = []
-            for mol_info in molecules:
-                mol_data.append(
-                    {
-                        "engine": mol_info["engine"],
-                        "atom_count": mol_info["atom_count"],
-                        "bond_count": mol_info["bond_count"],
-                    }
-                )
+            mcs_smarts = mcs_result["mcs_smarts"]
 
             return MCSResponse(
                 mcs_smarts=mcs_smarts,
-                atom_count=mcs_result.numAtoms,
-                bond_count=mcs_result.numBonds,
-                original_molecules=mol_data,
+                atom_count=mcs_result["atom_count"],
+                bond_count=mcs_result["bond_count"],
+                original_molecules=molecules,
             )
+        except MCSCancelledError as e:
+            # Status 499: client closed request, nobody reads this response
+            raise HTTPException(status_code=499, detail=str(e))
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -201,98 +187,196 @@ async def compare_smiles(request: SmilesComparisonRequest = Body(...)):
                 detail="Number of SMILES strings must match number of engine names",
             )
 
-        # Check if all SMILES are identical
-        identical = len(set(smiles_list)) == 1
+        return SimilarityMatrix(**compare_smiles_list(smiles_list, engine_names))
 
-        # Create molecules from SMILES
-        molecules = []
-        valid_indices = []
-        invalid_smiles = []
-
-        for i, smiles in enumerate(smiles_list):
-            mol = Chem.MolFromSmiles(smiles)
-            if mol is not None:
-                molecules.append(mol)
-                valid_indices.append(i)
-            else:
-                invalid_smiles.append({"engine": engine_names[i], "smiles": smiles})
-
-        # Initialize similarity matrix with zeros
-        n = len(engine_names)
-        similarity_matrix = [[0.0 for _ in range(n)] for _ in range(n)]
-
-        # Fill diagonal with 1.0 (self-similarity)
-        for i in range(n):
-            similarity_matrix[i][i] = 1.0
-
-        # Calculate similarity matrix for valid molecules
-        if len(molecules) > 1:
-            # Generate ECFP4 fingerprints
-            fingerprints = []
-            for mol in molecules:
-                fp = AllChem.GetMorganFingerprintAsBitVect(mol, 2, nBits=2048)
-                fingerprints.append(fp)
-
-            # Calculate Tanimoto similarities
-            for i in range(len(valid_indices)):
-                for j in range(i + 1, len(valid_indices)):
-                    idx1 = valid_indices[i]
-                    idx2 = valid_indices[j]
-                    similarity = DataStructs.TanimotoSimilarity(
-                        fingerprints[i], fingerprints[j]
-                    )
-                    similarity_matrix[idx1][idx2] = similarity
-                    similarity_matrix[idx2][idx1] = similarity
-
-        # Calculate agreement summary
-        agreement_counts = {}
-        total_comparisons = 0
-        total_agreements = 0
-
-        # Only perform agreement analysis if there are at least 2 valid molecules
-        if len(molecules) >= 2:
-            # Count agreements (similarity > 0.99) between pairs
-            for i in range(n):
-                for j in range(i + 1, n):
-                    if i in valid_indices and j in valid_indices:
-                        total_comparisons += 1
-
-                        # Consider high similarity (>0.99) as agreement
-                        if similarity_matrix[i][j] > 0.99:
-                            total_agreements += 1
-                            pair_key = f"{engine_names[i]}-{engine_names[j]}"
-                            agreement_counts[pair_key] = True
-                        else:
-                            pair_key = f"{engine_names[i]}-{engine_names[j]}"
-                            agreement_counts[pair_key] = False
-
-        # Calculate agreement percentage
-        agreement_percentage = 0
-        if total_comparisons > 0:
-            agreement_percentage = (total_agreements / total_comparisons) * 100
-
-        # Create agreement summary
-        agreement_summary = {
-            "identical": identical,
-            "agreement_percentage": agreement_percentage,
-            "total_comparisons": total_comparisons,
-            "total_agreements": total_agreements,
-            "pair_agreements": agreement_counts,
-            "invalid_smiles": invalid_smiles,
-        }
-
-        return SimilarityMatrix(
-            matrix=similarity_matrix,
-            engine_names=engine_names,
-            identical=identical,
-            agreement_summary=agreement_summary,
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error calculating similarity: {str(e)}",
+        )
+
+
+@router.post(
+    "/cluster",
+    summary="Cluster and deduplicate a collection of structures",
+    response_description="Return duplicate groups and similarity clusters",
+    status_code=status.HTTP_200_OK,
+    response_model=ClusterResponse,
+)
+def cluster(request: ClusterRequest = Body(...)):
+    """
+    Find duplicates and near-duplicates across all structures of a paper or session.
+
+    Exact duplicates are grouped by canonical SMILES. Unique structures are then
+    clustered on all-pairs ECFP4 Tanimoto similarity, computed in blocks, using
+    Taylor-Butina or threshold (connected component) clustering. Requests whose
+    threshold makes too many pairs of structures neighbours are rejected.
+
+    Args:
+        request: Structures with ids and optional source/segment metadata
+
+    Returns:
+        ClusterResponse: Duplicate groups, clusters and unparsable structures
+    """
+    try:
+        if not RDKIT_AVAILABLE:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="RDKit is not available on the server",
+            )
+
+        return ClusterResponse(
+            **cluster_structures(
+                [structure.model_dump() for structure in request.structures],
+                threshold=request.threshold,
+                method=request.method,
+                include_singletons=request.include_singletons,
+            )
         )
 
     except HTTPException:
         raise
 
+    except TooManyNeighboursError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error calculating similarity: {str(e)}",
+            detail=f"Error clustering structures: {str(e)}",
+        )
+
+
+def _search_response(hits: list) -> StructureSearchResponse:
+    """Wrap index hits together with the distinct PDFs they come from."""
+    source_pdfs = sorted({hit["source_pdf"] for hit in hits if hit["source_pdf"]})
+    return StructureSearchResponse(hits=hits, source_pdfs=source_pdfs)
+
+
+@router.post(
+    "/index",
+    summary="Add a structure to the persistent structure index",
+    response_description="Return the id of the indexed structure",
+    status_code=status.HTTP_200_OK,
+)
+def index_structure(request: IndexStructureRequest = Body(...)):
+    """
+    Add a structure to the local structure index.
+
+    OCSR results are indexed automatically; this endpoint is for structures that
+    were edited or curated after recognition.
+
+    Args:
+        request: SMILES or molfile plus engine, source PDF and segment id
+
+    Returns:
+        JSON: Row id of the indexed structure
+    """
+    if not request.smiles and not request.molfile:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either SMILES or molfile must be provided",
+        )
+
+    structure_id = structure_index.add_structure(
+        smiles=request.smiles,
+        molfile=request.molfile,
+        engine=request.engine,
+        source_pdf=request.source_pdf,
+        segment_id=request.segment_id,
+    )
+    if structure_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Structure could not be parsed",
+        )
+    return {"id": structure_id}
+
+
+@router.post(
+    "/search",
+    summary="Find the most similar previously extracted structures",
+    response_description="Return the k nearest neighbours from the structure index",
+    status_code=status.HTTP_200_OK,
+    response_model=StructureSearchResponse,
+)
+def search_similar(request: SimilaritySearchRequest = Body(...)):
+    """
+    k-nearest-neighbour ECFP4 similarity search over all indexed structures.
+
+    Args:
+        request: Query SMILES, number of hits and minimum similarity
+
+    Returns:
+        StructureSearchResponse: Hits with similarity and the PDFs they come from
+    """
+    try:
+        return _search_response(
+            structure_index.search_similar(
+                request.smiles, k=request.k, min_similarity=request.min_similarity
+            )
         )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching structure index: {str(e)}",
+        )
+
+
+@router.post(
+    "/substructure_search",
+    summary="Find previously extracted structures containing a substructure",
+    response_description="Return indexed structures matching the query",
+    status_code=status.HTTP_200_OK,
+    response_model=StructureSearchResponse,
+)
+def search_substructure(request: SubstructureSearchRequest = Body(...)):
+    """
+    Fingerprint-screened substructure search over all indexed structures.
+
+    Answers questions such as "which processed papers contain this scaffold".
+
+    Args:
+        request: Query SMILES or SMARTS and maximum number of hits
+
+    Returns:
+        StructureSearchResponse: Matching structures and the PDFs they come from
+    """
+    try:
+        return _search_response(
+            structure_index.search_substructure(
+                request.query, query_type=request.query_type, limit=request.limit
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching structure index: {str(e)}",
+        )
+
+
+@router.get(
+    "/metrics",
+    summary="Get similarity subsystem metrics",
+    response_description="Return molecule, MCS and structure index statistics",
+    status_code=status.HTTP_200_OK,
+)
+async def get_similarity_metrics():
+    """
+    Return molecule and MCS cache statistics and the size of the structure index.
+
+    Returns:
+        JSON: Similarity metrics
+    """
+    return {
+        "molecule_cache": get_molecule_cache_info(),
+        "mcs_cache": get_mcs_cache_info(),
+        "structure_index": await run_in_threadpool(structure_index.get_stats),
+    }
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any
-from pydantic import BaseModel
+from typing import List, Dict, Any, Literal, Optional
+from pydantic import BaseModel, Field
 
 
 # Define request and response models
@@ -27,3 +27,53 @@ class SimilarityMatrix(BaseModel):
     engine_names: List[str]
     identical: bool
     agreement_summary: Dict[str, Any]
+
+
+class StructureRecord(BaseModel):
+    id: str
+    smiles: str
+    source: Optional[str] = None
+    segment_id: Optional[str] = None
+
+
+class ClusterRequest(BaseModel):
+    structures: List[StructureRecord] = Field(..., min_length=1, max_length=50000)
+    method: Literal["butina", "threshold"] = "butina"
+    # Below about 0.3, unrelated ECFP4 fingerprints start to count as similar
+    threshold: float = Field(0.7, ge=0.3, le=1.0)
+    include_singletons: bool = False
+
+
+class ClusterResponse(BaseModel):
+    method: str
+    threshold: float
+    total_structures: int
+    unique_structures: int
+    duplicate_groups: List[Dict[str, Any]]
+    clusters: List[Dict[str, Any]]
+    invalid_structures: List[Dict[str, Any]]
+
+
+class IndexStructureRequest(BaseModel):
+    smiles: Optional[str] = None
+    molfile: Optional[str] = None
+    engine: str = ""
+    source_pdf: str = ""
+    segment_id: str = ""
+
+
+class SimilaritySearchRequest(BaseModel):
+    smiles: str
+    k: int = Field(10, ge=1, le=1000)
+    min_similarity: float = Field(0.0, ge=0.0, le=1.0)
+
+
+class SubstructureSearchRequest(BaseModel):
+    query: str
+    query_type: Literal["smiles", "smarts"] = "smiles"
+    limit: int = Field(100, ge=1, le=10000)
+
+
+class StructureSearchResponse(BaseModel):
+    hits: List[Dict[str, Any]]
+    source_pdfs: List[str]
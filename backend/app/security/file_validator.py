@@ -1,11 +1,19 @@
 """
 File upload validation utilities for MARCUS application.
 Implements comprehensive file validation.
+
+Uploads are read in chunks: the magic bytes are checked on the first chunk,
+the SHA-256 is computed and the size limit enforced as the data arrives, and
+the data can be written to its destination in the same pass, so memory use
+per upload does not grow with the file size. Disk writes run on the
+threadpool so a slow disk does not stall the event loop.
 """
 
+import asyncio
 import os
 import logging
-from typing import Optional, List, Dict, Any
+import uuid
+from typing import Callable, Optional, List, Dict, Any, Tuple
 from pathlib import Path
 import hashlib
 
@@ -23,6 +31,7 @@ except ImportError:
 # Import FastAPI with fallback for type hints
 try:
     from fastapi import UploadFile, HTTPException, status
+    from starlette.concurrency import run_in_threadpool
 except ImportError:
     # Define basic types for development/testing
     class UploadFile:
@@ -34,9 +43,92 @@ except ImportError:
     class status:
         HTTP_400_BAD_REQUEST = 400
 
+    async def run_in_threadpool(func, *args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
 
 logger = logging.getLogger(__name__)
 
+# Uploads are read, hashed and written in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload grows past the size limit while it is read."""
+
+
+async def stream_upload(
+    file: UploadFile,
+    destination: Optional[str] = None,
+    check_head: Optional[Callable[[bytes], None]] = None,
+    max_size: Optional[int] = None,
+) -> Tuple[int, str]:
+    """
+    Read an upload in chunks, hashing it and optionally writing it to disk.
+
+    The data is written to a temporary file beside destination that is
+    renamed into place once complete, so a rejected or interrupted upload
+    never appears under the final name.
+
+    Args:
+        file: The uploaded file
+        destination: Path to write the upload to, or None to only read it
+        check_head: Called with the first chunk (empty for an empty file)
+            before anything is written; raises to reject the upload
+        max_size: Largest accepted size in bytes
+
+    Returns:
+        tuple: (size in bytes, SHA-256 hex digest)
+
+    Raises:
+        UploadTooLargeError: If the upload is larger than max_size
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    temp_path = None
+    output = None
+    try:
+        await file.seek(0)
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if check_head is not None:
+            check_head(chunk)
+        if destination is not None:
+            temp_path = f"{destination}.{uuid.uuid4().hex[:8]}.part"
+            output = await run_in_threadpool(open, temp_path, "wb")
+
+        while chunk:
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise UploadTooLargeError(
+                    f"Upload larger than {max_size} bytes: {file.filename}"
+                )
+            hasher.update(chunk)
+            if output is not None:
+                await run_in_threadpool(output.write, chunk)
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+
+        if output is not None:
+            await run_in_threadpool(_finish_upload, output, temp_path, destination)
+            temp_path = None
+        await file.seek(0)
+    finally:
+        if output is not None and temp_path is not None:
+            await run_in_threadpool(_discard_upload, output, temp_path)
+    return size, hasher.hexdigest()
+
+
+def _finish_upload(output, temp_path: str, destination: str):
+    """Close a completed upload and rename it into place."""
+    output.close()
+    os.replace(temp_path, destination)
+
+
+def _discard_upload(output, temp_path: str):
+    """Close and remove a rejected or interrupted upload."""
+    output.close()
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
 
 class FileUploadValidator:
     """Comprehensive file upload validation."""
@@ -73,14 +165,21 @@ class FileUploadValidator:
         }
 
     async def validate_file(
-        self, file: UploadFile, allowed_types: Optional[List[str]] = None
+        self,
+        file: UploadFile,
+        allowed_types: Optional[List[str]] = None,
+        destination: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Comprehensive file validation including size, type, and content verification.
 
+        The content is streamed in chunks, and written to destination in the
+        same pass if one is given; nothing is written for rejected files.
+
         Args:
             file: The uploaded file to validate
             allowed_types: Optional list of specific content types to allow
+            destination: Optional path to save the validated file to
 
         Returns:
             dict: Validation result with file info
@@ -105,18 +204,22 @@ class FileUploadValidator:
             content_types = allowed_types or list(self.ALLOWED_CONTENT_TYPES)
             self._validate_content_type(file.content_type, content_types)
 
-            # 5. Read file content for further validation
-            content = await file.read()
-            await file.seek(0)  # Reset file pointer
-
-            # 6. Content verification (magic number check)
-            self._verify_file_content(content, file.filename)
-
-            # 7. Security checks
-            self._security_checks(file.filename, content)
+            # 5. Content verification (magic number check) and security
+            # checks on the first chunk, then hash (for deduplication/tracking)
+            # and size check the rest as it is read
+            def check_head(head: bytes):
+                self._verify_file_content(head, file.filename)
+                self._security_checks(file.filename, head)
 
-            # 8. Generate file hash for deduplication/tracking
-            file_hash = hashlib.sha256(content).hexdigest()
+            try:
+                size, file_hash = await stream_upload(
+                    file, destination, check_head, self.MAX_FILE_SIZE
+                )
+            except UploadTooLargeError:
+                self._reject(
+                    "rejected_size",
+                    f"File too large: more than {self.MAX_FILE_SIZE} bytes",
+                )
 
             # Validation successful
             self.stats["accepted"] += 1
@@ -125,15 +228,13 @@ class FileUploadValidator:
                 "valid": True,
                 "filename": file.filename,
                 "content_type": file.content_type,
-                "size": len(content),
+                "size": size,
                 "hash": file_hash,
                 "extension": Path(file.filename).suffix.lower(),
                 "validated_at": self._get_timestamp(),
             }
 
-            logger.info(
-                f"File validation successful: {file.filename} ({len(content)} bytes)"
-            )
+            logger.info(f"File validation successful: {file.filename} ({size} bytes)")
             return validation_result
 
         except HTTPException:
@@ -143,30 +244,14 @@ class FileUploadValidator:
             self._reject("rejected_content", f"Validation error: {str(e)}")
 
     async def _validate_file_size(self, file: UploadFile):
-        """Validate file size without reading entire content into memory."""
-        try:
-            # Try to get size from the file object
-            current_pos = await file.seek(0, 2)  # Seek to end
-            file_size = await file.tell()
-            await file.seek(current_pos)  # Restore position
-
-            if file_size > self.MAX_FILE_SIZE:
-                self._reject(
-                    "rejected_size",
-                    f"File too large: {file_size} bytes (max: {self.MAX_FILE_SIZE} bytes)",
-                )
-
-        except Exception as e:
-            # Fallback to reading content if seek/tell not supported
-            logger.warning(f"Could not determine file size efficiently: {e}")
-            content = await file.read()
-            await file.seek(0)
-
-            if len(content) > self.MAX_FILE_SIZE:
-                self._reject(
-                    "rejected_size",
-                    f"File too large: {len(content)} bytes (max: {self.MAX_FILE_SIZE} bytes)",
-                )
+        """Reject files whose declared size is over the limit, without reading them."""
+        # Uploads without a declared size are still limited while streamed
+        file_size = getattr(file, "size", None)
+        if isinstance(file_size, int) and file_size > self.MAX_FILE_SIZE:
+            self._reject(
+                "rejected_size",
+                f"File too large: {file_size} bytes (max: {self.MAX_FILE_SIZE} bytes)",
+            )
 
     def _validate_file_extension(self, filename: str):
         """Validate file extension."""
@@ -250,7 +335,7 @@ class FileUploadValidator:
             )
 
     def _security_checks(self, filename: str, content: bytes):
-        """Additional security checks."""
+        """Additional security checks on the start of the content."""
         # 1. Check for suspicious filename patterns
         suspicious_patterns = [
             r"\.\./",  # Path traversal
@@ -327,17 +412,23 @@ file_validator = FileUploadValidator()
 
 
 # Utility functions for easy integration
-async def validate_pdf_upload(file: UploadFile) -> Dict[str, Any]:
-    """Validate PDF file upload."""
-    return await file_validator.validate_file(file, ["application/pdf"])
+async def validate_pdf_upload(
+    file: UploadFile, destination: Optional[str] = None
+) -> Dict[str, Any]:
+    """Validate PDF file upload, saving it to destination if given."""
+    return await file_validator.validate_file(file, ["application/pdf"], destination)
 
 
-async def validate_image_upload(file: UploadFile) -> Dict[str, Any]:
-    """Validate image file upload."""
+async def validate_image_upload(
+    file: UploadFile, destination: Optional[str] = None
+) -> Dict[str, Any]:
+    """Validate image file upload, saving it to destination if given."""
     image_types = ["image/png", "image/jpeg", "image/jpg", "image/gif", "image/webp"]
-    return await file_validator.validate_file(file, image_types)
+    return await file_validator.validate_file(file, image_types, destination)
 
 
-async def validate_any_upload(file: UploadFile) -> Dict[str, Any]:
-    """Validate any allowed file type upload."""
-    return await file_validator.validate_file(file)
+async def validate_any_upload(
+    file: UploadFile, destination: Optional[str] = None
+) -> Dict[str, Any]:
+    """Validate any allowed file type upload, saving it to destination if given."""
+    return await file_validator.validate_file(file, destination=destination)
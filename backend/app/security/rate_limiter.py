@@ -1,20 +1,49 @@
 """
 Rate limiting implementation for MARCUS application.
-Implements comprehensive rate limiting.
+Implements GCRA (token bucket) rate limiting with progressive penalties.
 """
 
 import time
 import asyncio
 import logging
-from typing import Dict, Any, Optional, Callable
-from collections import defaultdict, deque
+import math
+import re
+from typing import Dict, Any, Optional, Callable, List, Tuple
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
+from datetime import datetime
+from urllib.parse import parse_qs
 import json
 import os
 
+from app.modules.state_backend import (
+    MemoryStateBackend,
+    StateBackend,
+    get_state_backend,
+)
+
 logger = logging.getLogger(__name__)
 
+# State backend key prefix of per-client records
+CLIENT_KEY_PREFIX = "marcus:ratelimit:"
+
+# Client records are dropped after this many seconds without requests
+CLIENT_RECORD_TTL = 3600
+
+# Allowance for float rounding when comparing arrival times
+TIME_SLACK = 1e-3
+
+# Endpoint types are cached per path; the cache is cleared when it fills up
+ENDPOINT_CACHE_SIZE = 4096
+
+# Client records are encoded on every check; reuse one encoder and decoder
+_RECORD_ENCODER = json.JSONEncoder(separators=(",", ":"))
+_RECORD_DECODER = json.JSONDecoder()
+
+# Path keywords that decide the endpoint type, see classify_endpoint
+ENDPOINT_KEYWORDS = re.compile(
+    r"upload|file|pdf|process|ocsr|depict|session|heartbeat", re.IGNORECASE
+)
+
 
 @dataclass
 class RateLimitRule:
@@ -26,20 +55,91 @@ class RateLimitRule:
     penalty: int = 0  # Penalty seconds for violations
 
 
+@dataclass(frozen=True)
+class CompiledRule:
+    """
+    A RateLimitRule in GCRA terms.
+
+    Requests are spaced `interval` seconds apart at the sustained rate, and up
+    to `capacity` requests (requests + burst) may arrive at once.
+    """
+
+    rule: RateLimitRule
+    interval: float
+    capacity: int
+    tolerance: float
+
+    @classmethod
+    def compile(cls, rule: RateLimitRule) -> "CompiledRule":
+        interval = rule.window / max(rule.requests, 1)
+        capacity = max(rule.requests + rule.burst, 1)
+        return cls(rule, interval, capacity, interval * capacity)
+
+
 @dataclass
 class ClientRecord:
-    """Track rate limit state for a client."""
+    """
+    Rate limit state for a client, constant in size.
+
+    Keeps one theoretical arrival time (TAT) per endpoint type instead of a
+    log of request times. Times come from the limiter's clock.
+    """
 
-    requests: deque = field(default_factory=deque)
+    tat: Dict[str, float] = field(default_factory=dict)
     violations: int = 0
-    penalty_until: Optional[datetime] = None
-    first_request: Optional[datetime] = None
-    last_request: Optional[datetime] = None
+    penalty_until: Optional[float] = None
+    first_request: Optional[float] = None
+    last_request: Optional[float] = None
+
+    @classmethod
+    def from_json(cls, value: Optional[str]) -> "ClientRecord":
+        if not value:
+            return cls()
+        data = _RECORD_DECODER.decode(value)
+        # Records written by older versions hold request logs; start afresh
+        return cls(*data) if isinstance(data, list) else cls()
+
+    def to_json(self) -> str:
+        return _RECORD_ENCODER.encode(
+            [
+                self.tat,
+                self.violations,
+                self.penalty_until,
+                self.first_request,
+                self.last_request,
+            ]
+        )
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+def classify_endpoint(path: str) -> str:
+    """Determine the endpoint type of a path from the keywords it contains."""
+    keywords = {keyword.lower() for keyword in ENDPOINT_KEYWORDS.findall(path)}
+
+    if "upload" in keywords or "file" in keywords:
+        return "pdf" if "pdf" in keywords else "upload"
+    if "process" in keywords:
+        return "process"
+    if "ocsr" in keywords:
+        return "ocsr"
+    if "depict" in keywords:
+        return "depiction"
+    if "session" in keywords:
+        return "heartbeat" if "heartbeat" in keywords else "session"
+    return "default"
 
 
 class RateLimiter:
     """
-    Advanced rate limiter with multiple strategies and progressive penalties.
+    Rate limiter using the generic cell rate algorithm with progressive penalties.
+
+    Each check is O(1): the client's arrival time for the endpoint type is
+    compared with the current time, with no per-request history. Times come
+    from time.monotonic() when the state backend is process-local, and from
+    time.time() when records are shared with other processes.
     """
 
     # Default rate limit rules by endpoint pattern
@@ -58,10 +158,16 @@ class RateLimiter:
         "default": RateLimitRule(requests=15, window=60, burst=5, penalty=20),
     }
 
-    def __init__(self, enabled: bool = True):
+    def __init__(self, enabled: bool = True, backend: Optional[StateBackend] = None):
         self.enabled = enabled
-        self.clients: Dict[str, ClientRecord] = defaultdict(ClientRecord)
+        # Client records live in the state backend so limits hold across workers
+        self.backend = backend or MemoryStateBackend()
+        self.clock: Callable[[], float] = (
+            time.monotonic if self.backend.process_local else time.time
+        )
         self.rules = self.DEFAULT_RULES.copy()
+        self._compiled_rules: Dict[str, CompiledRule] = {}
+        self._endpoint_cache: Dict[str, str] = {}
         self.stats = {
             "total_requests": 0,
             "blocked_requests": 0,
@@ -109,60 +215,14 @@ class RateLimiter:
             pass
 
     async def _cleanup_old_records(self):
-        """Cleanup old client records periodically."""
-        while True:
-            try:
-                await asyncio.sleep(300)  # Cleanup every 5 minutes
-                current_time = datetime.now()
-
-                # Remove old client records
-                clients_to_remove = []
-                for client_id, record in self.clients.items():
-                    if (
-                        record.last_request
-                        and current_time - record.last_request > timedelta(hours=1)
-                    ):
-                        clients_to_remove.append(client_id)
-
-                for client_id in clients_to_remove:
-                    del self.clients[client_id]
-
-                # Update stats
-                self.stats["clients_tracking"] = len(self.clients)
-
-                if clients_to_remove:
-                    logger.debug(
-                        f"Cleaned up {len(clients_to_remove)} old client records"
-                    )
-
-            except Exception as e:
-                logger.error(f"Error in rate limit cleanup: {e}")
+        """Remove expired client records periodically."""
         try:
             while True:
                 try:
                     await asyncio.sleep(300)  # Cleanup every 5 minutes
-                    current_time = datetime.now()
-
-                    # Remove old client records
-                    clients_to_remove = []
-                    for client_id, record in self.clients.items():
-                        if (
-                            record.last_request
-                            and current_time - record.last_request > timedelta(hours=1)
-                        ):
-                            clients_to_remove.append(client_id)
-
-                    for client_id in clients_to_remove:
-                        del self.clients[client_id]
-
-                    # Update stats
-                    self.stats["clients_tracking"] = len(self.clients)
-
-                    if clients_to_remove:
-                        logger.debug(
-                            f"Cleaned up {len(clients_to_remove)} old client records"
-                        )
-
+                    removed = self.backend.purge_expired()
+                    if removed:
+                        logger.debug(f"Cleaned up {removed} old client records")
                 except Exception as e:
                     logger.error(f"Error in rate limit cleanup: {e}")
         except asyncio.CancelledError:
@@ -171,25 +231,23 @@ class RateLimiter:
 
     def get_endpoint_type(self, path: str) -> str:
         """Determine endpoint type from path for rule matching."""
-        path_lower = path.lower()
-
-        # Check specific patterns
-        if "upload" in path_lower or "file" in path_lower:
-            if "pdf" in path_lower:
-                return "pdf"
-            return "upload"
-        elif "process" in path_lower:
-            return "process"
-        elif "ocsr" in path_lower:
-            return "ocsr"
-        elif "depiction" in path_lower or "depict" in path_lower:
-            return "depiction"
-        elif "session" in path_lower:
-            if "heartbeat" in path_lower:
-                return "heartbeat"
-            return "session"
-
-        return "default"
+        endpoint_type = self._endpoint_cache.get(path)
+        if endpoint_type is None:
+            endpoint_type = classify_endpoint(path)
+            if len(self._endpoint_cache) >= ENDPOINT_CACHE_SIZE:
+                self._endpoint_cache.clear()
+            self._endpoint_cache[path] = endpoint_type
+        return endpoint_type
+
+    def get_rule(self, endpoint_type: str) -> CompiledRule:
+        """Return the compiled rule for an endpoint type."""
+        rule = self.rules.get(endpoint_type) or self.rules["default"]
+        compiled = self._compiled_rules.get(endpoint_type)
+        # Rules may be replaced in self.rules directly; recompile when they are
+        if compiled is None or compiled.rule is not rule:
+            compiled = CompiledRule.compile(rule)
+            self._compiled_rules[endpoint_type] = compiled
+        return compiled
 
     def is_allowed(self, client_id: str, endpoint_path: str) -> Dict[str, Any]:
         """
@@ -207,10 +265,25 @@ class RateLimiter:
 
         self.stats["total_requests"] += 1
 
-        current_time = datetime.now()
-        client_record = self.clients[client_id]
         endpoint_type = self.get_endpoint_type(endpoint_path)
-        rule = self.rules.get(endpoint_type, self.rules["default"])
+        rule = self.get_rule(endpoint_type)
+        return self.backend.update(
+            CLIENT_KEY_PREFIX + client_id,
+            lambda value: self._check_record(
+                ClientRecord.from_json(value), client_id, endpoint_type, rule
+            ),
+            ttl=CLIENT_RECORD_TTL,
+        )
+
+    def _check_record(
+        self,
+        client_record: ClientRecord,
+        client_id: str,
+        endpoint_type: str,
+        rule: CompiledRule,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Apply a rule to a client record; returns (updated record JSON, result)."""
+        current_time = self.clock()
 
         # Update client tracking
         if not client_record.first_request:
@@ -220,111 +293,112 @@ class RateLimiter:
         # Check if client is in penalty period
         if client_record.penalty_until and current_time < client_record.penalty_until:
             self.stats["blocked_requests"] += 1
-            remaining_penalty = (
-                client_record.penalty_until - current_time
-            ).total_seconds()
-            return {
+            remaining_penalty = client_record.penalty_until - current_time
+            return client_record.to_json(), {
                 "allowed": False,
                 "reason": "penalty_period",
                 "retry_after": int(remaining_penalty),
+                "limit": rule.capacity,
+                "window": rule.rule.window,
                 "endpoint_type": endpoint_type,
-                "rule": rule.__dict__,
             }
 
-        # Clean old requests outside the window
-        window_start = current_time - timedelta(seconds=rule.window)
-        while client_record.requests and client_record.requests[0] < window_start:
-            client_record.requests.popleft()
-
-        # Check if request count exceeds limit
-        current_requests = len(client_record.requests)
-
-        # Apply burst allowance
-        effective_limit = rule.requests + rule.burst
+        # The request conforms if it does not arrive too far ahead of schedule
+        tat = max(client_record.tat.get(endpoint_type, current_time), current_time)
+        new_tat = tat + rule.interval
+        backlog = new_tat - current_time
 
-        if current_requests >= effective_limit:
+        if backlog > rule.tolerance + TIME_SLACK:
             # Rate limit exceeded
             client_record.violations += 1
             self.stats["blocked_requests"] += 1
             self.stats["violations_count"] += 1
 
-            # Apply progressive penalty
-            penalty_seconds = rule.penalty * min(
+            # Apply progressive penalty, and never less than the time until
+            # the next request would conform
+            penalty_seconds = rule.rule.penalty * min(
                 client_record.violations, 5
             )  # Cap at 5x
-            client_record.penalty_until = current_time + timedelta(
-                seconds=penalty_seconds
+            client_record.penalty_until = current_time + penalty_seconds
+            retry_after = max(
+                penalty_seconds, math.ceil(backlog - rule.tolerance - TIME_SLACK)
             )
 
             logger.warning(
                 f"Rate limit exceeded for {client_id} on {endpoint_type}: "
-                f"{current_requests}/{effective_limit} requests. "
+                f"{rule.capacity}/{rule.capacity} requests. "
                 f"Penalty: {penalty_seconds}s (violation #{client_record.violations})"
             )
 
-            return {
+            return client_record.to_json(), {
                 "allowed": False,
                 "reason": "rate_limit_exceeded",
-                "retry_after": penalty_seconds,
-                "current_requests": current_requests,
-                "limit": effective_limit,
-                "window": rule.window,
+                "retry_after": retry_after,
+                "current_requests": rule.capacity,
+                "limit": rule.capacity,
+                "window": rule.rule.window,
                 "endpoint_type": endpoint_type,
                 "violations": client_record.violations,
-                "rule": rule.__dict__,
             }
 
         # Request allowed - record it
-        client_record.requests.append(current_time)
+        client_record.tat[endpoint_type] = new_tat
+        remaining = int((rule.tolerance - backlog + TIME_SLACK) / rule.interval)
 
-        return {
+        return client_record.to_json(), {
             "allowed": True,
             "reason": "within_limits",
-            "current_requests": current_requests + 1,
-            "limit": effective_limit,
-            "window": rule.window,
+            "current_requests": rule.capacity - remaining,
+            "limit": rule.capacity,
+            "window": rule.rule.window,
             "endpoint_type": endpoint_type,
-            "remaining": effective_limit - current_requests - 1,
-            "rule": rule.__dict__,
+            "remaining": remaining,
         }
 
+    def _wall_time(self, timestamp: Optional[float]) -> Optional[float]:
+        """Convert a time from the limiter's clock to a Unix timestamp."""
+        if timestamp is None or self.clock is time.time:
+            return timestamp
+        return timestamp + (time.time() - self.clock())
+
     def get_client_stats(self, client_id: str) -> Dict[str, Any]:
         """Get statistics for a specific client."""
-        client_record = self.clients.get(client_id)
-        if not client_record:
+        value = self.backend.get(CLIENT_KEY_PREFIX + client_id)
+        if not value:
             return {"exists": False}
 
-        current_time = datetime.now()
+        client_record = ClientRecord.from_json(value)
+        current_time = self.clock()
+
+        # Requests still counted against each endpoint type's burst capacity
+        endpoint_usage = {}
+        for endpoint_type, tat in client_record.tat.items():
+            used = math.ceil(
+                (tat - current_time - TIME_SLACK)
+                / self.get_rule(endpoint_type).interval
+            )
+            if used > 0:
+                endpoint_usage[endpoint_type] = used
 
         return {
             "exists": True,
-            "first_request": (
-                client_record.first_request.isoformat()
-                if client_record.first_request
-                else None
-            ),
-            "last_request": (
-                client_record.last_request.isoformat()
-                if client_record.last_request
-                else None
-            ),
+            "first_request": _isoformat(self._wall_time(client_record.first_request)),
+            "last_request": _isoformat(self._wall_time(client_record.last_request)),
             "violations": client_record.violations,
             "in_penalty": bool(
                 client_record.penalty_until
                 and current_time < client_record.penalty_until
             ),
-            "penalty_until": (
-                client_record.penalty_until.isoformat()
-                if client_record.penalty_until
-                else None
-            ),
-            "current_requests": len(client_record.requests),
+            "penalty_until": _isoformat(self._wall_time(client_record.penalty_until)),
+            "current_requests": sum(endpoint_usage.values()),
+            "endpoint_usage": endpoint_usage,
         }
 
     def reset_client(self, client_id: str) -> bool:
         """Reset rate limiting for a specific client."""
-        if client_id in self.clients:
-            del self.clients[client_id]
+        key = CLIENT_KEY_PREFIX + client_id
+        if self.backend.get(key) is not None:
+            self.backend.delete(key)
             logger.info(f"Reset rate limiting for client: {client_id}")
             return True
         return False
@@ -334,7 +408,7 @@ class RateLimiter:
         return {
             **self.stats,
             "enabled": self.enabled,
-            "clients_tracking": len(self.clients),
+            "clients_tracking": len(self.backend.scan_keys(CLIENT_KEY_PREFIX)),
             "rules_configured": len(self.rules),
             "rules": {name: rule.__dict__ for name, rule in self.rules.items()},
         }
@@ -361,7 +435,7 @@ class RateLimiter:
 
 
 # Global rate limiter instance
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(backend=get_state_backend())
 
 
 def get_client_identifier(request) -> str:
@@ -407,3 +481,47 @@ def get_client_identifier(request) -> str:
     except Exception as e:
         logger.error(f"Error extracting client identifier: {e}")
         return "ip:unknown"
+
+
+def get_scope_client_identifier(scope: Dict[str, Any]) -> str:
+    """
+    Extract client identifier from an ASGI scope, without building a Request.
+    Same priority as get_client_identifier.
+    """
+    try:
+        state = scope.get("state") or {}
+        headers = dict(scope.get("headers") or ())
+
+        session_id = state.get("session_id")
+        if session_id is None:
+            session_id = headers.get(b"x-session-id", b"").decode("latin-1")
+        if session_id:
+            return f"session:{session_id}"
+
+        user_id = state.get("user_id")
+        if user_id is None:
+            query_string = scope.get("query_string", b"")
+            if b"user_id=" in query_string:
+                user_id = parse_qs(query_string.decode("latin-1")).get(
+                    "user_id", [None]
+                )[0]
+        if user_id:
+            return f"user:{user_id}"
+
+        client = scope.get("client")
+        client_ip = client[0] if client else None
+        if not client_ip:
+            # Check for forwarded IP headers
+            forwarded = headers.get(b"x-forwarded-for", b"").split(b",")[0].strip()
+            client_ip = (
+                forwarded
+                or headers.get(b"x-real-ip")
+                or headers.get(b"cf-connecting-ip")
+                or b""
+            ).decode("latin-1")
+
+        return f"ip:{client_ip or 'unknown'}"
+
+    except Exception as e:
+        logger.error(f"Error extracting client identifier: {e}")
+        return "ip:unknown"
@@ -8,10 +8,13 @@ import json
 import logging
 import hashlib
 import secrets
+import time
 from typing import Dict, Any, Optional, Union
 from datetime import datetime, timedelta
 import base64
 
+from app.modules.expiry_scheduler import ExpiryScheduler
+
 # Import cryptography with fallback
 try:
     from cryptography.fernet import Fernet
@@ -196,6 +199,8 @@ class SessionSecurity:
     def __init__(self, encryption: SessionEncryption):
         self.encryption = encryption
         self.active_sessions: Dict[str, Dict[str, Any]] = {}
+        # Session ids by expiry deadline, so cleanup only visits expired sessions
+        self._expiry = ExpiryScheduler()
         self.session_stats = {
             "created": 0,
             "expired": 0,
@@ -242,6 +247,7 @@ class SessionSecurity:
 
             # Store session
             self.active_sessions[session_id] = session_data
+            self._expiry.schedule(session_id, time.time() + 24 * 3600)
 
             # Generate encrypted token
             encrypted_token = self.encryption.generate_session_token(
@@ -360,6 +366,7 @@ class SessionSecurity:
         try:
             if session_id in self.active_sessions:
                 del self.active_sessions[session_id]
+                self._expiry.cancel(session_id)
                 self.session_stats["invalidated"] += 1
                 logger.info(f"Session invalidated: {session_id} (reason: {reason})")
                 return True
@@ -371,13 +378,7 @@ class SessionSecurity:
 
     def cleanup_expired_sessions(self):
         """Clean up expired sessions."""
-        current_time = datetime.utcnow()
-        expired_sessions = []
-
-        for session_id, session_data in self.active_sessions.items():
-            created_at = datetime.fromisoformat(session_data["created_at"])
-            if current_time - created_at > timedelta(hours=24):
-                expired_sessions.append(session_id)
+        expired_sessions = self._expiry.pop_expired()
 
         for session_id in expired_sessions:
             self._expire_session(session_id)
@@ -389,6 +390,7 @@ class SessionSecurity:
         """Mark session as expired and remove it."""
         if session_id in self.active_sessions:
             del self.active_sessions[session_id]
+            self._expiry.cancel(session_id)
             self.session_stats["expired"] += 1
 
     def _generate_client_fingerprint(self, client_info: Dict[str, Any]) -> str:
@@ -3,6 +3,7 @@ Security utilities for MARCUS application.
 Implements comprehensive security validations and utilities.
 """
 
+import hmac
 import os
 import re
 import logging
@@ -181,6 +182,22 @@ class APIKeyManager:
         return True
 
 
+def verify_admin_key(provided: Optional[str], expected: Optional[str]) -> bool:
+    """
+    Check a key sent with an administrative request.
+
+    Args:
+        provided: Key sent by the client
+        expected: Configured admin key; administration is disabled when empty
+
+    Returns:
+        bool: True if an admin key is configured and the keys match
+    """
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(provided.encode(), expected.encode())
+
+
 def get_cors_origins() -> List[str]:
     """
     Get CORS origins from environment with validation.
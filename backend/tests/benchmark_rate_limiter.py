@@ -0,0 +1,107 @@
+"""
+Benchmark of the per-request cost of rate limiting.
+
+Times RateLimiter.is_allowed, endpoint classification and a request through
+RateLimitMiddleware against the same application without the middleware.
+Limits are raised so every request is allowed and does the full check.
+
+Run from the backend directory:
+
+    python -m tests.benchmark_rate_limiter --requests 100000 --clients 100
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
+from app.security.rate_limiter import RateLimiter, RateLimitRule
+
+PATHS = [
+    "/v1/ocsr/process_image",
+    "/latest/depiction/generate",
+    "/session/heartbeat/8b0e6a0c-2f3c-4c55-9d43-2a8f0f3b4c11",
+    "/v1/decimer/extract_segments_from_pdf",
+]
+
+
+def unlimited_limiter() -> RateLimiter:
+    limiter = RateLimiter(enabled=True)
+    limiter.enabled = True
+    for endpoint_type in limiter.rules:
+        limiter.rules[endpoint_type] = RateLimitRule(requests=10**9, window=60)
+    return limiter
+
+
+def time_per_call(function, count: int) -> float:
+    """Return the mean time of function(i) in microseconds."""
+    start = time.perf_counter()
+    for i in range(count):
+        function(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def time_per_request(asgi_app, count: int, clients: int) -> float:
+    """Return the mean time of one HTTP request through asgi_app in microseconds."""
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scopes = [
+        {
+            "type": "http",
+            "path": PATHS[i % len(PATHS)],
+            "headers": [(b"x-session-id", f"session-{i % clients}".encode())],
+            "query_string": b"",
+            "client": ("127.0.0.1", 50000),
+        }
+        for i in range(clients * len(PATHS))
+    ]
+    start = time.perf_counter()
+    for i in range(count):
+        await asgi_app(scopes[i % len(scopes)], receive, send)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=100)
+    args = parser.parse_args()
+
+    limiter = unlimited_limiter()
+    is_allowed = time_per_call(
+        lambda i: limiter.is_allowed(
+            f"session:{i % args.clients}", PATHS[i % len(PATHS)]
+        ),
+        args.requests,
+    )
+    classify = time_per_call(
+        lambda i: limiter.get_endpoint_type(PATHS[i % len(PATHS)]), args.requests
+    )
+
+    import app.middleware.rate_limit_middleware as middleware_module
+
+    middleware_module.rate_limiter = unlimited_limiter()
+    middleware = RateLimitMiddleware(app, exempt_paths=["/health"])
+    bare = asyncio.run(time_per_request(app, args.requests, args.clients))
+    wrapped = asyncio.run(time_per_request(middleware, args.requests, args.clients))
+
+    print(f"{args.requests} requests from {args.clients} clients")
+    print(f"  RateLimiter.is_allowed      {is_allowed:8.2f} us/call")
+    print(f"  get_endpoint_type           {classify:8.2f} us/call")
+    print(f"  app without middleware      {bare:8.2f} us/request")
+    print(f"  app with RateLimitMiddleware {wrapped:7.2f} us/request")
+    print(f"  middleware overhead         {wrapped - bare:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
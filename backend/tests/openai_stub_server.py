@@ -0,0 +1,155 @@
+"""
+Local stub of the OpenAI HTTP API for offline tests.
+
+Serves ``POST /v1/chat/completions`` with a canned completion and answers
+fine-tuning job lookups with 404, so the annotation module falls back to the
+configured model id. Failures can be injected to exercise retries.
+
+Run standalone and point the backend at it:
+
+    python -m tests.openai_stub_server --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+"""
+
+import argparse
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, List, Optional
+
+DEFAULT_CONTENT = json.dumps({"compound_name": "caffeine"})
+
+
+class OpenAIStubServer(ThreadingHTTPServer):
+    """Threaded HTTP server recording requests and injecting failures."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        content: Callable[[str], str] = lambda user_message: DEFAULT_CONTENT,
+        fail_first: int = 0,
+        fail_status: int = 429,
+        delay: float = 0.0,
+    ):
+        super().__init__(address, _StubHandler)
+        self.content = content
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.requests: List[dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: OpenAIStubServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_json(404, {"error": {"message": "Not found", "type": "stub"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        stub = self.server
+
+        with stub._lock:
+            stub.requests.append(request)
+            attempt = len(stub.requests)
+            stub.in_flight += 1
+            stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+        try:
+            if stub.delay:
+                time.sleep(stub.delay)
+            if attempt <= stub.fail_first:
+                self._send_json(
+                    stub.fail_status,
+                    {"error": {"message": "Injected failure", "type": "stub"}},
+                    headers={"Retry-After": "0"},
+                )
+                return
+
+            user_message = next(
+                (
+                    m["content"]
+                    for m in request.get("messages", [])
+                    if m["role"] == "user"
+                ),
+                "",
+            )
+            self._send_json(
+                200,
+                {
+                    "id": f"chatcmpl-stub-{attempt}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": stub.content(user_message),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "total_tokens": 0,
+                    },
+                },
+            )
+        finally:
+            with stub._lock:
+                stub.in_flight -= 1
+
+
+@contextmanager
+def run_stub_server(**kwargs) -> Iterator[OpenAIStubServer]:
+    """Run an OpenAIStubServer on a free local port for the duration of a block."""
+    server = OpenAIStubServer(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = OpenAIStubServer(
+        ("127.0.0.1", args.port), fail_first=args.fail_first, delay=args.delay
+    )
+    print(f"OpenAI stub listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,307 @@
+"""
+Local stand-in for a Redis server, for offline tests of the Redis state backend.
+
+Speaks RESP2 and implements the commands used by RedisStateBackend, including
+WATCH/MULTI/EXEC optimistic transactions and key expiry. All data lives in
+memory behind one lock, so it also serves several backend workers at once.
+
+Run standalone and point the backend at it:
+
+    python -m tests.redis_stub_server --port 6390
+    STATE_BACKEND_URL=redis://127.0.0.1:6390/0
+"""
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisStubServer(socketserver.ThreadingTCPServer):
+    """Threaded TCP server holding the shared key space."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, _RedisHandler)
+        self.data: Dict[str, object] = {}
+        self.expires: Dict[str, float] = {}
+        self.versions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _live(self, key: str) -> Optional[object]:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._delete(key)
+        return self.data.get(key)
+
+    def _delete(self, key: str) -> bool:
+        self.expires.pop(key, None)
+        self._touch(key)
+        return self.data.pop(key, None) is not None
+
+    def _touch(self, key: str):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _typed(self, key: str, kind: type):
+        value = self._live(key)
+        if value is None:
+            value = kind()
+            self.data[key] = value
+        elif not isinstance(value, kind):
+            raise RedisError(
+                "WRONGTYPE Operation against a key holding the wrong kind of value"
+            )
+        return value
+
+    def execute(self, args):
+        """Run one command; must be called with the lock held."""
+        self.commands += 1
+        name, args = args[0].upper(), args[1:]
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            raise RedisError(f"ERR unknown command '{name}'")
+        return handler(*args)
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_get(self, key):
+        value = self._live(key)
+        if value is not None and not isinstance(value, str):
+            raise RedisError(
+                "WRONGTYPE Operation against a key holding the wrong kind of value"
+            )
+        return value
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if "NX" in options and self._live(key) is not None:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if "PX" in options:
+            self.expires[key] = (
+                time.time() + int(options[options.index("PX") + 1]) / 1000
+            )
+        if "EX" in options:
+            self.expires[key] = time.time() + int(options[options.index("EX") + 1])
+        self._touch(key)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        return sum(self._delete(key) for key in keys)
+
+    def cmd_incrby(self, key, amount):
+        value = int(self.cmd_get(key) or 0) + int(amount)
+        self.data[key] = str(value)
+        self._touch(key)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_scan(self, cursor, *options):
+        pattern = options[list(map(str.upper, options)).index("MATCH") + 1]
+        keys = [key for key in list(self.data) if self._live(key) is not None]
+        return ["0", [key for key in keys if fnmatch.fnmatchcase(key, pattern)]]
+
+    def cmd_hget(self, name, field):
+        return self._typed(name, dict).get(field)
+
+    def cmd_hset(self, name, *pairs):
+        hash_ = self._typed(name, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in hash_
+            hash_[field] = value
+        self._touch(name)
+        return added
+
+    def cmd_hdel(self, name, *fields):
+        hash_ = self._typed(name, dict)
+        self._touch(name)
+        return sum(hash_.pop(field, None) is not None for field in fields)
+
+    def cmd_hgetall(self, name):
+        return [item for pair in self._typed(name, dict).items() for item in pair]
+
+    def cmd_hlen(self, name):
+        return len(self._typed(name, dict))
+
+    def cmd_hincrby(self, name, field, amount):
+        hash_ = self._typed(name, dict)
+        value = int(hash_.get(field, 0)) + int(amount)
+        hash_[field] = str(value)
+        self._touch(name)
+        return value
+
+    def _ranked(self, name):
+        zset = self._typed(name, _ZSet)
+        return sorted(zset, key=lambda member: (zset[member], member))
+
+    def cmd_zadd(self, name, *args):
+        nx = args[0].upper() == "NX"
+        if nx:
+            args = args[1:]
+        zset = self._typed(name, _ZSet)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if member in zset:
+                if nx:
+                    continue
+            else:
+                added += 1
+            zset[member] = float(score)
+        self._touch(name)
+        return added
+
+    def cmd_zrank(self, name, member):
+        ranked = self._ranked(name)
+        return ranked.index(member) if member in ranked else None
+
+    def cmd_zrem(self, name, *members):
+        zset = self._typed(name, _ZSet)
+        self._touch(name)
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def cmd_zpopmin(self, name):
+        ranked = self._ranked(name)
+        if not ranked:
+            return []
+        zset = self._typed(name, _ZSet)
+        score = zset.pop(ranked[0])
+        self._touch(name)
+        return [ranked[0], repr(score)]
+
+    def cmd_zcard(self, name):
+        return len(self._typed(name, _ZSet))
+
+    def cmd_zrange(self, name, start, stop):
+        ranked = self._ranked(name)
+        stop = int(stop)
+        return ranked[int(start) : None if stop == -1 else stop + 1]
+
+
+class _ZSet(dict):
+    """Sorted set as member -> score."""
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    server: RedisStubServer
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+    def _encode(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, RedisError):
+            return f"-{value}\r\n".encode()
+        if isinstance(value, bool) or isinstance(value, int):
+            return f":{int(value)}\r\n".encode()
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b"".join(map(self._encode, value))
+        if value in ("OK", "PONG", "QUEUED"):
+            return f"+{value}\r\n".encode()
+        data = str(value).encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def handle(self):
+        server = self.server
+        watched: Dict[str, int] = {}
+        queued = None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name = args[0].upper()
+            with server.lock:
+                try:
+                    if name == "WATCH":
+                        for key in args[1:]:
+                            watched[key] = server.versions.get(key, 0)
+                        reply = "OK"
+                    elif name == "UNWATCH":
+                        watched.clear()
+                        reply = "OK"
+                    elif name == "MULTI":
+                        queued = []
+                        reply = "OK"
+                    elif name == "EXEC":
+                        conflict = any(
+                            server.versions.get(key, 0) != version
+                            for key, version in watched.items()
+                        )
+                        commands, queued = queued or [], None
+                        watched.clear()
+                        if conflict:
+                            self.wfile.write(b"*-1\r\n")
+                            continue
+                        reply = []
+                        for command in commands:
+                            try:
+                                reply.append(server.execute(command))
+                            except RedisError as e:
+                                reply.append(e)
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = "QUEUED"
+                    else:
+                        reply = server.execute(args)
+                except RedisError as e:
+                    reply = e
+                except Exception as e:
+                    reply = RedisError(f"ERR {e}")
+            self.wfile.write(self._encode(reply))
+
+
+@contextmanager
+def run_stub_server(**kwargs) -> Iterator[RedisStubServer]:
+    """Run a RedisStubServer on a free local port for the duration of a block."""
+    server = RedisStubServer(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    server = RedisStubServer(("127.0.0.1", args.port))
+    print(f"Redis stand-in listening on {server.url}")
+    server.serve_forever()
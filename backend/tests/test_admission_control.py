@@ -0,0 +1,167 @@
+"""
+Tests for work-unit based admission control.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    from app.modules import admission_control
+    from app.modules.admission_control import (
+        AdmissionController,
+        AdmissionTimeoutError,
+        classify_request,
+    )
+
+    ADMISSION_CONTROL_AVAILABLE = True
+except ImportError as e:
+    print(f"Admission control not available for testing: {e}")
+    ADMISSION_CONTROL_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not ADMISSION_CONTROL_AVAILABLE, reason="Admission control not available"
+)
+
+COSTS = {"ocsr": 2, "segmentation": 4, "depiction": 1}
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    # Pretend the host is idle so only the work-unit budget applies
+    monkeypatch.setattr(admission_control, "_cpu_load", lambda: 0.0)
+    monkeypatch.setattr(admission_control, "_available_memory_mb", lambda: None)
+    monkeypatch.setattr(admission_control, "HEADROOM_POLL_INTERVAL", 0.01)
+    return AdmissionController(capacity=4, costs=COSTS, queue_timeout=1)
+
+
+def test_classify_request():
+    """Test heavy POST requests are classified by router prefix."""
+    assert classify_request("POST", "/v1/ocsr/generate_smiles") == "ocsr"
+    assert classify_request("POST", "/latest/decimer/extract") == "segmentation"
+    assert classify_request("GET", "/v1/ocsr/get_image") is None
+    assert classify_request("POST", "/v1/openai/extract") is None
+    assert classify_request("POST", "/") is None
+
+
+class TestAdmissionController:
+    """Test admission against the work-unit budget and host headroom."""
+
+    def test_admits_within_capacity_in_order(self, controller):
+        """Test requests wait for units and are admitted in arrival order."""
+
+        async def scenario():
+            order = []
+
+            async def job(request_class, name, duration):
+                async with controller.admit(request_class):
+                    order.append(name)
+                    await asyncio.sleep(duration)
+
+            await asyncio.gather(
+                job("ocsr", "a", 0.05),
+                job("ocsr", "b", 0.05),
+                job("segmentation", "c", 0.0),
+                job("depiction", "d", 0.0),
+            )
+            return order
+
+        order = asyncio.run(scenario())
+
+        # The depiction fits beside c's reservation only after c has started
+        assert order == ["a", "b", "c", "d"]
+        assert controller.in_flight_units == 0
+        assert controller.get_stats()["admitted"] == 4
+
+    def test_oversized_request_runs_alone(self, controller):
+        """Test a request costing more than the capacity is still admitted."""
+        controller.costs = {"docling": 10}
+
+        async def scenario():
+            async with controller.admit("docling") as cost:
+                return cost, controller.in_flight_units
+
+        assert asyncio.run(scenario()) == (4, 4)
+
+    def test_sessions_share_a_priority_class_fairly(self, controller):
+        """Test one session's backlog does not hold up another session."""
+        controller.capacity = 2
+
+        async def scenario():
+            order = []
+
+            async def job(session_id, name):
+                async with controller.admit("ocsr", session_id):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(
+                job("busy", "busy-1"),
+                job("busy", "busy-2"),
+                job("busy", "busy-3"),
+                job("other", "other-1"),
+            )
+            return order
+
+        assert asyncio.run(scenario()) == ["busy-1", "busy-2", "other-1", "busy-3"]
+
+    def test_priority_classes_share_by_weight(self, controller):
+        """Test interactive requests are not starved behind batch work."""
+        controller.capacity = 4
+        controller.costs = {"ocsr": 1, "segmentation": 4}
+        controller.priorities = {"ocsr": "interactive", "segmentation": "batch"}
+        controller.weights = {"interactive": 2, "batch": 1}
+
+        async def scenario():
+            order = []
+
+            async def job(request_class, name):
+                async with controller.admit(request_class, "session-" + name):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+            # Holds the capacity while the others queue up
+            blocker = asyncio.create_task(job("segmentation", "running"))
+            await asyncio.sleep(0)
+            await asyncio.gather(
+                job("segmentation", "pdf-1"),
+                job("segmentation", "pdf-2"),
+                job("ocsr", "image"),
+                blocker,
+            )
+            return order
+
+        order = asyncio.run(scenario())
+
+        assert order.index("image") < order.index("pdf-2")
+        stats = controller.get_stats()["classes"]
+        assert stats["ocsr"]["priority"] == "interactive"
+        assert stats["segmentation"]["completed"] == 3
+        assert stats["segmentation"]["max_wait_time"] > 0
+        assert stats["ocsr"]["average_service_time"] > 0
+
+    def test_no_headroom_times_out(self, controller, monkeypatch):
+        """Test extra work is not admitted while the host is overloaded."""
+        monkeypatch.setattr(admission_control, "_cpu_load", lambda: 1.0)
+        controller.queue_timeout = 0.05
+
+        async def scenario():
+            async with controller.admit("depiction"):
+                with pytest.raises(AdmissionTimeoutError):
+                    await controller.acquire("depiction")
+
+        asyncio.run(scenario())
+        stats = controller.get_stats()
+        assert stats["rejected"] == 1
+        assert stats["in_flight_units"] == 0
+        assert stats["waiting"] == 0
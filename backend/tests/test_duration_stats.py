@@ -0,0 +1,73 @@
+"""
+Tests for rolling duration statistics.
+"""
+
+import pytest
+
+try:
+    from app.modules.duration_stats import DurationStats
+
+    DURATION_STATS_AVAILABLE = True
+except ImportError as e:
+    print(f"Duration statistics not available for testing: {e}")
+    DURATION_STATS_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not DURATION_STATS_AVAILABLE, reason="Duration statistics not available"
+)
+
+
+class TestDurationStats:
+    """Test the moving average, quantiles and serialisation."""
+
+    def test_ewma_follows_recent_samples(self):
+        """Test the moving average starts at the first sample and moves by alpha."""
+        stats = DurationStats(alpha=0.5)
+        stats.add(10)
+        stats.add(20)
+
+        assert stats.mean == 15
+        assert stats.count == 2
+
+    def test_quantiles_over_window(self):
+        """Test quantiles cover only the most recent window of samples."""
+        stats = DurationStats(window=5)
+        for duration in [1000, 1, 2, 3, 4, 5]:
+            stats.add(duration)
+
+        assert stats.quantile(0.5) == 3
+        assert stats.quantile(1.0) == 5
+        assert stats.to_dict()["p90"] == pytest.approx(4.6)
+
+    def test_defaults_before_samples(self):
+        """Test the default duration is used until samples arrive."""
+        stats = DurationStats(default=900)
+
+        assert stats.mean == 900
+        assert stats.expected_remaining(300) == 600
+        assert stats.to_dict() == {
+            "count": 0,
+            "ewma": None,
+            "p50": None,
+            "p90": None,
+            "p95": None,
+        }
+
+    def test_expected_remaining_uses_longer_samples(self):
+        """Test items past the average are expected to run like longer samples."""
+        stats = DurationStats()
+        for duration in [10, 10, 10, 100, 200]:
+            stats.add(duration)
+
+        assert stats.expected_remaining(50) == pytest.approx(100)
+        assert stats.expected_remaining(500) == 0.0
+
+    def test_round_trip(self):
+        """Test statistics survive serialisation for a state backend."""
+        stats = DurationStats()
+        for duration in [3, 1, 2]:
+            stats.add(duration)
+        restored = DurationStats.loads(stats.dumps())
+
+        assert restored.to_dict() == stats.to_dict()
+        assert DurationStats.loads(None).count == 0
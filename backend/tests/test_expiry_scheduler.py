@@ -0,0 +1,104 @@
+"""
+Tests for the deadline-ordered expiry scheduler.
+"""
+
+import random
+import time
+
+import pytest
+
+try:
+    from app.modules import expiry_scheduler
+    from app.modules.expiry_scheduler import ExpiryScheduler
+    from app.modules.state_backend import MemoryStateBackend
+
+    EXPIRY_SCHEDULER_AVAILABLE = True
+except ImportError as e:
+    print(f"Expiry scheduler not available for testing: {e}")
+    EXPIRY_SCHEDULER_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not EXPIRY_SCHEDULER_AVAILABLE, reason="Expiry scheduler not available"
+)
+
+
+class TestExpiryScheduler:
+    """Test scheduling, rescheduling and cancelling deadlines."""
+
+    def test_pops_only_due_keys_in_deadline_order(self):
+        """Test keys come out once their deadline has passed."""
+        scheduler = ExpiryScheduler()
+        scheduler.schedule("c", 30)
+        scheduler.schedule("a", 10)
+        scheduler.schedule("b", 20)
+
+        assert scheduler.pop_expired(now=5) == []
+        assert scheduler.pop_expired(now=20) == ["a", "b"]
+        assert scheduler.pop_expired(now=25) == []
+        assert len(scheduler) == 1
+        assert "c" in scheduler
+
+    def test_reschedule_and_cancel(self):
+        """Test later and earlier deadlines and cancelled keys."""
+        scheduler = ExpiryScheduler()
+        scheduler.schedule("later", 10)
+        scheduler.schedule("later", 50)
+        scheduler.schedule("earlier", 40)
+        scheduler.schedule("earlier", 5)
+        scheduler.schedule("cancelled", 1)
+        scheduler.cancel("cancelled")
+
+        assert scheduler.pop_expired(now=20) == ["earlier"]
+        assert scheduler.deadline("later") == 50
+        assert scheduler.pop_expired(now=60) == ["later"]
+        assert len(scheduler) == 0
+
+    def test_matches_deadline_model(self):
+        """Test random operations against a plain dict of deadlines."""
+        scheduler = ExpiryScheduler()
+        model = {}
+        rng = random.Random(0)
+        now = 0.0
+
+        for _ in range(2000):
+            key = f"k{rng.randrange(50)}"
+            action = rng.random()
+            if action < 0.6:
+                deadline = now + rng.uniform(0, 20)
+                scheduler.schedule(key, deadline)
+                model[key] = deadline
+            elif action < 0.7:
+                assert scheduler.cancel(key) == (model.pop(key, None) is not None)
+            else:
+                now += rng.uniform(0, 5)
+                due = {k for k, deadline in model.items() if deadline <= now}
+                assert set(scheduler.pop_expired(now)) == due
+                for k in due:
+                    del model[k]
+            assert len(scheduler) == len(model)
+
+    def test_heap_is_compacted(self, monkeypatch):
+        """Test stale entries from rescheduling do not pile up."""
+        monkeypatch.setattr(expiry_scheduler, "COMPACT_MIN_ENTRIES", 8)
+        scheduler = ExpiryScheduler()
+        for deadline in range(1000, 0, -1):
+            scheduler.schedule("key", deadline)
+
+        assert len(scheduler._heap) <= 8
+        assert scheduler.pop_expired(now=1) == ["key"]
+
+
+def test_memory_backend_purges_only_due_keys():
+    """Test purge_expired removes expired values and leaves the others."""
+    backend = MemoryStateBackend()
+    backend.set("expired", "1", ttl=0.001)
+    backend.set("fresh", "2", ttl=60)
+    backend.set("permanent", "3")
+    backend.set("renewed", "4", ttl=0.001)
+    backend.set("renewed", "5")
+    time.sleep(0.01)
+
+    assert backend.purge_expired() == 1
+    assert backend.get("fresh") == "2"
+    assert backend.get("permanent") == "3"
+    assert backend.get("renewed") == "5"
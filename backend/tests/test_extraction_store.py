@@ -0,0 +1,138 @@
+"""
+Tests for the indexed extraction store.
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+os.environ.setdefault(
+    "EXTRACTION_STORE_PATH", os.path.join(tempfile.mkdtemp(), "extractions.sqlite3")
+)
+
+try:
+    from app.modules.extraction_store import ExtractionStore, extraction_filename
+
+    EXTRACTION_STORE_AVAILABLE = True
+except ImportError as e:
+    print(f"Extraction store not available for testing: {e}")
+    EXTRACTION_STORE_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not EXTRACTION_STORE_AVAILABLE, reason="Extraction store not available"
+)
+
+
+def _positions(*labels):
+    return [
+        {"label": label, "start_offset": i, "end_offset": i + 1}
+        for i, label in enumerate(labels)
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ExtractionStore(str(tmp_path / "extractions.sqlite3"))
+
+
+class TestExtractionStore:
+    """Test saving, retrieving and listing extractions."""
+
+    def test_save_and_get(self, store):
+        """Test results round-trip in the earlier JSON file format."""
+        filename = store.save("some text", {"name": "caffeine"}, _positions("name"))
+
+        assert filename == extraction_filename("some text")
+        data = store.get(filename)
+        assert data["input_text"] == "some text"
+        assert data["extracted_json"] == {"name": "caffeine"}
+        assert data["positions"] == _positions("name")
+        assert store.get("extraction_missing.json") is None
+
+    def test_same_text_keeps_first_result(self, store):
+        """Test saving the same text again does not overwrite the result."""
+        store.save("text", {"v": 1}, [])
+        filename = store.save("text", {"v": 2}, [])
+
+        assert store.get(filename)["extracted_json"] == {"v": 1}
+
+    def test_pagination_and_total(self, store):
+        """Test listings are paginated newest first with a total count."""
+        for i in range(5):
+            store._insert(f"extraction_{i}.json", f"text {i}", {}, [], created_time=i)
+
+        page, total = store.list(limit=2, offset=1)
+
+        assert total == 5
+        assert [row["filename"] for row in page] == [
+            "extraction_3.json",
+            "extraction_2.json",
+        ]
+
+    def test_listing_is_unbounded_by_default(self, store):
+        """Test listings without a limit return every saved extraction."""
+        for i in range(1200):
+            store._insert(
+                f"extraction_{i}.json", f"text {i}", {}, _positions("name"), None, i
+            )
+
+        page, total = store.list()
+
+        assert total == len(page) == 1200
+        assert page[-1]["filename"] == "extraction_0.json"
+        assert all(row["label_counts"] == {"name": 1} for row in page)
+
+    def test_filters(self, store):
+        """Test filtering by time, label, entity count and text."""
+        store._insert("extraction_a.json", "caffeine", {}, _positions("name"), None, 10)
+        store._insert(
+            "extraction_b.json", "aspirin", {}, _positions("name", "source"), None, 20
+        )
+        store._insert("extraction_c.json", "theine", {}, [], None, 30)
+
+        def names(**filters):
+            return [row["filename"] for row in store.list(**filters)[0]]
+
+        assert names(since=15) == ["extraction_c.json", "extraction_b.json"]
+        assert names(until=15) == ["extraction_a.json"]
+        assert names(label="source") == ["extraction_b.json"]
+        assert names(min_entities=1) == ["extraction_b.json", "extraction_a.json"]
+        assert names(search="aspi") == ["extraction_b.json"]
+        assert store.list(label="source")[0][0]["label_counts"] == {
+            "name": 1,
+            "source": 1,
+        }
+
+    def test_imports_legacy_files_once(self, tmp_path):
+        """Test JSON files from the earlier file storage are imported."""
+        legacy_dir = tmp_path / "openai_results"
+        legacy_dir.mkdir()
+        (legacy_dir / "extraction_old.json").write_text(
+            json.dumps(
+                {
+                    "timestamp": "2024-01-01T00:00:00",
+                    "input_text": "old text",
+                    "extracted_json": {"name": "caffeine"},
+                    "positions": _positions("name"),
+                }
+            )
+        )
+        (legacy_dir / "unrelated.json").write_text("{}")
+
+        db_path = str(tmp_path / "extractions.sqlite3")
+        store = ExtractionStore(db_path, legacy_dir=str(legacy_dir))
+
+        assert store.list()[1] == 1
+        assert store.get("extraction_old.json")["extracted_json"] == {
+            "name": "caffeine"
+        }
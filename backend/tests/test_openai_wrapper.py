@@ -0,0 +1,378 @@
+"""
+Tests for the async OpenAI wrapper, run offline against the local stub server.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import pytest
+from unittest.mock import patch
+
+from openai_stub_server import run_stub_server
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+os.environ.setdefault(
+    "LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite3")
+)
+
+try:
+    from openai import AsyncOpenAI
+    from app.modules import openai_wrapper
+    from app.modules.llm_cache import LLMResponseCache
+
+    OPENAI_WRAPPER_AVAILABLE = True
+except ImportError as e:
+    print(f"OpenAI wrapper not available for testing: {e}")
+    OPENAI_WRAPPER_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not OPENAI_WRAPPER_AVAILABLE, reason="OpenAI wrapper not available"
+)
+
+
+def _call(server, coroutine_factory, cache=None, **overrides):
+    """Run a wrapper coroutine against the stub with a fresh client and cache."""
+
+    async def run():
+        stub_client = AsyncOpenAI(
+            api_key=TEST_ENV_VARS["OPENAI_API_KEY"],
+            base_url=server.base_url,
+            max_retries=0,
+        )
+        settings = {
+            "client": stub_client,
+            "llm_cache": cache or LLMResponseCache(cache_dir.name + "/cache.sqlite3"),
+            "fine_tuned_model": "stub-model",
+            "OPENAI_RETRY_BASE_DELAY": 0.01,
+            **overrides,
+        }
+        with patch.multiple(openai_wrapper, **settings):
+            try:
+                return await coroutine_factory()
+            finally:
+                await stub_client.close()
+
+    cache_dir = tempfile.TemporaryDirectory()
+    try:
+        return asyncio.run(run())
+    finally:
+        cache_dir.cleanup()
+
+
+class TestGetResponse:
+    """Test completions, retries and concurrency limits."""
+
+    def test_returns_completion_content(self):
+        """Test the completion content is returned."""
+        with run_stub_server(content=lambda message: f"echo: {message}") as server:
+            result = _call(server, lambda: openai_wrapper.get_response("aspirin"))
+
+        assert result == "echo: aspirin"
+        assert server.requests[0]["model"] == "stub-model"
+
+    def test_retries_rate_limits(self):
+        """Test 429 responses are retried until the call succeeds."""
+        with run_stub_server(fail_first=2, fail_status=429) as server:
+            result = _call(server, lambda: openai_wrapper.get_response("text"))
+
+        assert "caffeine" in result
+        assert len(server.requests) == 3
+
+    def test_gives_up_after_max_retries(self):
+        """Test persistent server errors surface as a sanitized exception."""
+        with run_stub_server(fail_first=100, fail_status=500) as server:
+            with pytest.raises(Exception) as exc_info:
+                _call(
+                    server,
+                    lambda: openai_wrapper.get_response("text"),
+                    OPENAI_MAX_RETRIES=2,
+                )
+
+        assert "OpenAI API error" in str(exc_info.value)
+        assert len(server.requests) == 3
+
+    def test_client_errors_are_not_retried(self):
+        """Test 4xx responses other than 429 fail immediately."""
+        with run_stub_server(fail_first=100, fail_status=400) as server:
+            with pytest.raises(Exception):
+                _call(server, lambda: openai_wrapper.get_response("text"))
+
+        assert len(server.requests) == 1
+
+    def test_concurrency_is_limited(self):
+        """Test the semaphore bounds concurrent requests."""
+
+        async def burst():
+            return await asyncio.gather(
+                *(openai_wrapper.get_response(f"text {i}") for i in range(6))
+            )
+
+        with run_stub_server(delay=0.1) as server:
+            start = time.monotonic()
+            results = _call(server, burst, _request_semaphore=asyncio.Semaphore(2))
+            elapsed = time.monotonic() - start
+
+        assert len(results) == 6
+        assert server.max_in_flight == 2
+        assert elapsed >= 0.3
+
+
+class TestGetSpans:
+    """Test span extraction and request coalescing."""
+
+    def test_identical_requests_share_one_completion(self):
+        """Test concurrent identical texts trigger a single API call."""
+        text = "caffeine was isolated from the leaves."
+
+        async def burst():
+            return await asyncio.gather(
+                *(openai_wrapper.get_spans(text) for _ in range(5))
+            )
+
+        with run_stub_server(delay=0.1) as server:
+            results = _call(server, burst)
+
+        assert len(server.requests) == 1
+        assert all(result == results[0] for result in results)
+        assert results[0][1] == [
+            {"label": "compound_name", "start_offset": 0, "end_offset": 8}
+        ]
+        assert openai_wrapper._in_flight_spans == {}
+
+    def test_sequential_requests_are_not_coalesced(self):
+        """Test requests are only shared while one is in flight."""
+
+        async def sequential():
+            await openai_wrapper.get_spans("caffeine", use_cache=False)
+            await openai_wrapper.get_spans("caffeine", use_cache=False)
+
+        with run_stub_server() as server:
+            _call(server, sequential)
+
+        assert len(server.requests) == 2
+
+    def test_spans_to_json(self):
+        """Test extracted text conversion to JSON data."""
+        assert openai_wrapper.spans_to_json('{"a": "b"}') == {"a": "b"}
+        assert openai_wrapper.spans_to_json("not json") == {"raw_text": "not json"}
+        assert openai_wrapper.spans_to_json("") == {"error": "No data extracted"}
+
+
+class TestLLMCache:
+    """Test the persistent LLM response cache."""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+    def test_repeated_text_is_served_from_cache(self, cache):
+        """Test a repeated text costs no second API call."""
+
+        async def twice():
+            first = await openai_wrapper.get_response("caffeine")
+            second = await openai_wrapper.get_response("caffeine")
+            return first, second
+
+        with run_stub_server() as server:
+            first, second = _call(server, twice, cache=cache)
+
+        assert first == second
+        assert len(server.requests) == 1
+        assert cache.get_stats()["hits"] == 1
+
+    def test_bypass_refreshes_cached_response(self, cache):
+        """Test use_cache=False calls the API and replaces the cached entry."""
+        responses = iter(["old", "new"])
+
+        async def bypass():
+            await openai_wrapper.get_response("caffeine")
+            await openai_wrapper.get_response("caffeine", use_cache=False)
+            return await openai_wrapper.get_response("caffeine")
+
+        with run_stub_server(content=lambda message: next(responses)) as server:
+            result = _call(server, bypass, cache=cache)
+
+        assert result == "new"
+        assert len(server.requests) == 2
+
+    def test_key_depends_on_model(self, cache):
+        """Test responses are not shared between models."""
+
+        async def other_model():
+            await openai_wrapper.get_response("caffeine")
+            openai_wrapper.fine_tuned_model = "other-model"
+            await openai_wrapper.get_response("caffeine")
+
+        with run_stub_server() as server:
+            _call(server, other_model, cache=cache)
+
+        assert len(server.requests) == 2
+
+    def test_least_recently_used_entries_are_evicted(self, cache):
+        """Test the cache keeps at most max_entries responses."""
+        cache.set("a", "model", "A")
+        time.sleep(0.01)
+        cache.set("b", "model", "B")
+        time.sleep(0.01)
+        assert cache.get("a") == "A"
+        time.sleep(0.01)
+        cache.set("c", "model", "C")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "A"
+        assert cache.get_stats()["size"] == 2
+
+    def test_hits_are_not_written_one_by_one(self, cache):
+        """Test cache hits defer writing their last use to the next store."""
+
+        def last_used():
+            return cache._conn.execute(
+                "SELECT last_used_at FROM responses WHERE key = 'a'"
+            ).fetchone()[0]
+
+        cache.set("a", "model", "A")
+        stored = last_used()
+        time.sleep(0.01)
+        assert cache.get("a") == "A"
+
+        assert last_used() == stored
+        cache.set("b", "model", "B")
+        assert last_used() > stored
+
+    def test_disabled_cache_stores_nothing(self, tmp_path):
+        """Test the global switch turns the cache off."""
+        cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), enabled=False)
+        cache.set("a", "model", "A")
+
+        assert cache.get("a") is None
+        assert cache.get_stats()["size"] == 0
+
+
+class TestChunkedExtraction:
+    """Test splitting long texts and merging chunk annotations."""
+
+    def test_short_text_is_one_chunk(self):
+        """Test texts under the chunk size are not split."""
+        assert openai_wrapper.split_text("short text", chunk_size=100) == [(0, 10)]
+
+    def test_chunks_follow_boundaries_and_cover_text(self):
+        """Test chunks end on paragraph or sentence boundaries and overlap."""
+        paragraphs = [
+            " ".join(f"Sentence {p}.{s} mentions caffeine." for s in range(5))
+            for p in range(6)
+        ]
+        text = "\n\n".join(paragraphs)
+        chunks = openai_wrapper.split_text(text, chunk_size=300, overlap=80)
+
+        assert len(chunks) > 1
+        assert chunks[0][0] == 0 and chunks[-1][1] == len(text)
+        for (start, end), (next_start, _) in zip(chunks, chunks[1:]):
+            assert end - start <= 300
+            assert next_start <= end
+            assert end - next_start <= 80
+            assert text[end - 1] in ".\n " or end == len(text)
+
+    def test_unbroken_text_is_cut_at_chunk_size(self):
+        """Test text without boundaries is still split."""
+        chunks = openai_wrapper.split_text("x" * 250, chunk_size=100, overlap=10)
+        assert chunks == [(0, 100), (100, 200), (200, 250)]
+
+    def test_merge_extracted_entities(self):
+        """Test values from overlapping chunks are deduplicated in order."""
+        merged = {}
+        openai_wrapper.merge_extracted_entities(merged, {"name": "caffeine, theine"})
+        openai_wrapper.merge_extracted_entities(
+            merged, {"name": "theine, aspirin", "source": "nan"}
+        )
+        assert merged == {"name": "caffeine, theine, aspirin"}
+
+    def test_long_text_is_annotated_in_parallel_chunks(self):
+        """Test chunk results are merged with offsets into the full text."""
+        first = "Caffeine was found. " * 20
+        second = "Aspirin was found. " * 20
+        text = first.strip() + "\n\n" + second.strip()
+
+        def annotate(message):
+            names = [name for name in ("Caffeine", "Aspirin") if name in message]
+            return json.dumps({"compound_name": ", ".join(names)})
+
+        with run_stub_server(content=annotate, delay=0.2) as server:
+            start = time.monotonic()
+            extracted_text, positions = _call(
+                server,
+                lambda: openai_wrapper.get_spans(text),
+                OPENAI_CHUNK_SIZE=450,
+            )
+            elapsed = time.monotonic() - start
+
+        assert len(server.requests) == 2
+        assert elapsed < 0.4
+        assert json.loads(extracted_text) == {"compound_name": "Caffeine, Aspirin"}
+        assert len(positions) == 40
+        for position in positions:
+            found = text[position["start_offset"] : position["end_offset"]]
+            assert found in ("Caffeine", "Aspirin")
+
+
+class TestFindPositions:
+    """Test the multi-pattern entity locator."""
+
+    def test_all_mentions_including_nested(self):
+        """Test every mention is reported, grouped by label and value."""
+        text = "caffeine citrate and caffeine"
+        positions = openai_wrapper.find_positions(
+            text, {"name": "caffeine, caffeine citrate", "salt": "citrate"}
+        )
+        assert [
+            (p["label"], p["start_offset"], p["end_offset"]) for p in positions
+        ] == [
+            ("name", 0, 8),
+            ("name", 21, 29),
+            ("name", 0, 16),
+            ("salt", 9, 16),
+        ]
+
+    def test_repeated_value_matches_are_not_overlapping(self):
+        """Test occurrences of one value follow re.finditer semantics."""
+        positions = openai_wrapper.find_positions("aaaa", {"x": "aa"})
+        assert [(p["start_offset"], p["end_offset"]) for p in positions] == [
+            (0, 2),
+            (2, 4),
+        ]
+
+    def test_longest_overlap_policy(self):
+        """Test overlapping mentions reduce to the leftmost longest one."""
+        text = "caffeine citrate and caffeine"
+        positions = openai_wrapper.find_positions(
+            text,
+            {"name": "caffeine, caffeine citrate", "salt": "citrate"},
+            overlap="longest",
+        )
+        assert [
+            (p["label"], p["start_offset"], p["end_offset"]) for p in positions
+        ] == [("name", 0, 16), ("name", 21, 29)]
+
+    def test_skips_empty_and_nan_values(self):
+        """Test empty and "nan" values are ignored."""
+        assert openai_wrapper.find_positions("nan text", {"x": "nan, ''"}) == []
+
+    def test_special_characters_are_literal(self):
+        """Test values are matched literally, not as regular expressions."""
+        positions = openai_wrapper.find_positions(
+            "(+)-catechin and (-)-epicatechin",
+            {"name": "(+)-catechin, (-)-epicatechin"},
+        )
+        assert [(p["start_offset"], p["end_offset"]) for p in positions] == [
+            (0, 12),
+            (17, 32),
+        ]
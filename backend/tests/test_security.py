@@ -3,6 +3,9 @@ Security tests for MARCUS application.
 Tests all security implementations.
 """
 
+import asyncio
+import hashlib
+import io
 import os
 import json
 import time
@@ -15,13 +18,18 @@ try:
         EnvironmentValidator,
         APIKeyManager,
         get_cors_origins,
+        verify_admin_key,
     )
+    from app.security import file_validator
     from app.security.file_validator import FileUploadValidator, validate_pdf_upload
     from app.security.rate_limiter import (
+        ClientRecord,
         RateLimiter,
         RateLimitRule,
         get_client_identifier,
+        get_scope_client_identifier,
     )
+    from app.middleware.rate_limit_middleware import RateLimitMiddleware
     from app.security.session_security import SessionEncryption, SessionSecurity
 
     SECURITY_MODULES_AVAILABLE = True
@@ -173,6 +181,51 @@ class TestAPIKeyManager:
         assert old_masked != new_masked
 
 
+class AsyncUpload:
+    """In-memory stand-in for UploadFile with its async read and seek."""
+
+    def __init__(self, filename, content_type, content, size=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.reads = []
+        self._buffer = io.BytesIO(content)
+
+    async def read(self, size=-1):
+        self.reads.append(size)
+        return self._buffer.read(size)
+
+    async def seek(self, offset):
+        self._buffer.seek(offset)
+
+
+class TestAdminKey:
+    """Test checking keys of administrative requests."""
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_matching_key_is_accepted(self):
+        """Test the configured admin key is accepted."""
+        assert verify_admin_key("admin-key", "admin-key")
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_missing_or_wrong_key_is_rejected(self):
+        """Test missing and wrong keys are rejected."""
+        assert not verify_admin_key(None, "admin-key")
+        assert not verify_admin_key("other-key", "admin-key")
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_unconfigured_key_disables_administration(self):
+        """Test nothing is accepted while no admin key is configured."""
+        assert not verify_admin_key("", "")
+        assert not verify_admin_key("anything", "")
+
+
 class TestFileUploadValidator:
     """Test file upload validation functionality."""
 
@@ -201,14 +254,17 @@ class TestFileUploadValidator:
         mock_file.content_type = "application/pdf"
 
         # Create async mock methods
+        # Valid PDF header (1004 bytes total)
+        content = io.BytesIO(b"%PDF-1.4\n" + b"0" * 995)
+
         async def mock_seek(offset, whence=0):
-            return 0
+            return content.seek(offset, whence)
 
         async def mock_tell():
-            return 1004  # Actual size including PDF header
+            return content.tell()
 
-        async def mock_read():
-            return b"%PDF-1.4\n" + b"0" * 995  # Valid PDF header (1004 bytes total)
+        async def mock_read(size=-1):
+            return content.read(size)
 
         mock_file.seek = mock_seek
         mock_file.tell = mock_tell
@@ -233,6 +289,7 @@ class TestFileUploadValidator:
         mock_file.content_type = "application/pdf"
         mock_file.seek = Mock(return_value=0)
         mock_file.tell = Mock(return_value=FileUploadValidator.MAX_FILE_SIZE + 1)
+        mock_file.size = FileUploadValidator.MAX_FILE_SIZE + 1
 
         validator = FileUploadValidator()
 
@@ -270,6 +327,63 @@ class TestFileUploadValidator:
             fake_content = b"This is not a PDF file"
             validator._verify_file_content(fake_content, "test.pdf")
 
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_validate_file_streams_to_destination(self, tmp_path, monkeypatch):
+        """Test a valid upload is hashed and saved in chunks in one pass."""
+        monkeypatch.setattr(file_validator, "UPLOAD_CHUNK_SIZE", 64)
+        content = b"%PDF-1.4\n" + os.urandom(1000)
+        upload = AsyncUpload("paper.pdf", "application/pdf", content)
+        destination = tmp_path / "paper.pdf"
+
+        result = asyncio.run(
+            FileUploadValidator().validate_file(upload, destination=str(destination))
+        )
+
+        assert result["size"] == len(content)
+        assert result["hash"] == hashlib.sha256(content).hexdigest()
+        assert destination.read_bytes() == content
+        assert os.listdir(tmp_path) == ["paper.pdf"]
+        # Never more than one chunk in memory at a time
+        assert set(upload.reads) == {64}
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_validate_file_rejects_oversized_stream(self, tmp_path, monkeypatch):
+        """Test an upload without a declared size is cut off at the limit."""
+        monkeypatch.setattr(file_validator, "UPLOAD_CHUNK_SIZE", 64)
+        validator = FileUploadValidator()
+        validator.MAX_FILE_SIZE = 200
+        upload = AsyncUpload("big.pdf", "application/pdf", b"%PDF-1.4\n" + b"0" * 10**4)
+
+        with pytest.raises(Exception):
+            asyncio.run(
+                validator.validate_file(upload, destination=str(tmp_path / "big.pdf"))
+            )
+
+        assert validator.stats["rejected_size"] == 1
+        assert os.listdir(tmp_path) == []
+        assert len(upload.reads) == 4
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_validate_file_rejects_spoofed_content_before_writing(self, tmp_path):
+        """Test the magic bytes of the first chunk are checked before saving."""
+        validator = FileUploadValidator()
+        upload = AsyncUpload("fake.pdf", "application/pdf", b"MZ\x90\x00" * 100)
+
+        with pytest.raises(Exception):
+            asyncio.run(
+                validator.validate_file(upload, destination=str(tmp_path / "fake.pdf"))
+            )
+
+        assert validator.stats["rejected_content"] > 0
+        assert validator.stats["accepted"] == 0
+        assert os.listdir(tmp_path) == []
+
 
 class TestRateLimiter:
     """Test rate limiting functionality."""
@@ -338,6 +452,58 @@ class TestRateLimiter:
         assert result["allowed"] is False
         assert "retry_after" in result
 
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_token_bucket_refill(self):
+        """Test the burst is spent at once and refills at the sustained rate."""
+        limiter = RateLimiter(enabled=True)
+        limiter.enabled = True
+        limiter.rules["default"] = RateLimitRule(requests=6, window=60, burst=2)
+        now = [1000.0]
+        limiter.clock = lambda: now[0]
+
+        results = [limiter.is_allowed("client", "/api/test") for _ in range(9)]
+        assert [r["allowed"] for r in results] == [True] * 8 + [False]
+        assert [r["remaining"] for r in results[:3]] == [7, 6, 5]
+        assert results[8]["retry_after"] == 10
+
+        # One request every 10 seconds is regained
+        now[0] += 10
+        assert limiter.is_allowed("client", "/api/test")["allowed"] is True
+        assert limiter.is_allowed("client", "/api/test")["allowed"] is False
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_client_record_size_is_constant(self):
+        """Test client state does not grow with the number of requests."""
+        limiter = RateLimiter(enabled=True)
+        limiter.enabled = True
+        limiter.rules["default"] = RateLimitRule(requests=10**4, window=60)
+
+        for _ in range(1000):
+            limiter.is_allowed("client", "/api/test")
+        value = limiter.backend.get("marcus:ratelimit:client")
+
+        assert len(value) < 200
+        assert list(ClientRecord.from_json(value).tat) == ["default"]
+        assert ClientRecord.from_json('{"requests": []}') == ClientRecord()
+        assert limiter.get_client_stats("client")["current_requests"] > 0
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_rule_changes_take_effect(self):
+        """Test rules replaced after use are recompiled."""
+        limiter = RateLimiter(enabled=True)
+        limiter.enabled = True
+        limiter.is_allowed("client", "/api/test")
+
+        limiter.update_rule("default", RateLimitRule(requests=1, window=60))
+        assert limiter.is_allowed("other", "/api/test")["allowed"] is True
+        assert limiter.is_allowed("other", "/api/test")["allowed"] is False
+
     @pytest.mark.skipif(
         not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
     )
@@ -367,6 +533,138 @@ class TestRateLimiter:
         assert client_id == "ip:192.168.1.1"
 
 
+class TestRateLimitMiddleware:
+    """Test the ASGI rate limiting middleware."""
+
+    @staticmethod
+    def run_request(middleware, path="/api/test", headers=()):
+        """Send one HTTP request through the middleware and collect the messages."""
+        scope = {
+            "type": "http",
+            "path": path,
+            "headers": list(headers),
+            "query_string": b"",
+            "client": ("10.0.0.1", 1234),
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(middleware(scope, receive, send))
+        return messages
+
+    @staticmethod
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for chunk in (b"a", b"b"):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_headers_added_and_body_streamed(self):
+        """Test allowed responses gain headers and keep their body chunks."""
+        middleware = RateLimitMiddleware(self.streaming_app, exempt_paths=["/health"])
+        with patch("app.middleware.rate_limit_middleware.rate_limiter") as limiter:
+            limiter.enabled = True
+            limiter.is_allowed.return_value = {
+                "allowed": True,
+                "remaining": 10,
+                "current_requests": 1,
+                "limit": 11,
+                "window": 60,
+                "endpoint_type": "default",
+            }
+            messages = self.run_request(middleware, headers=[(b"x-session-id", b"abc")])
+
+        limiter.is_allowed.assert_called_once_with("session:abc", "/api/test")
+        headers = dict(messages[0]["headers"])
+        assert headers[b"x-ratelimit-remaining"] == b"10"
+        assert [m.get("body") for m in messages[1:]] == [b"a", b"b", b""]
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_blocked_request_gets_429(self):
+        """Test blocked requests are answered without calling the app."""
+        called = []
+
+        async def app(scope, receive, send):
+            called.append(scope)
+
+        middleware = RateLimitMiddleware(app, exempt_paths=["/health"])
+        with patch("app.middleware.rate_limit_middleware.rate_limiter") as limiter:
+            limiter.enabled = True
+            limiter.is_allowed.return_value = {
+                "allowed": False,
+                "reason": "rate_limit_exceeded",
+                "retry_after": 7,
+                "limit": 5,
+                "window": 60,
+                "endpoint_type": "upload",
+            }
+            messages = self.run_request(middleware)
+            exempt = self.run_request(middleware, path="/health")
+
+        assert messages[0]["status"] == 429
+        assert dict(messages[0]["headers"])[b"retry-after"] == b"7"
+        assert json.loads(messages[1]["body"])["error_code"] == "RATE_LIMIT_EXCEEDED"
+        assert exempt == [] and len(called) == 1
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_default_exemptions_still_limit_the_api(self):
+        """Test the default exempt list does not exempt API paths."""
+        called = []
+
+        async def app(scope, receive, send):
+            called.append(scope["path"])
+
+        middleware = RateLimitMiddleware(app)
+        with patch("app.middleware.rate_limit_middleware.rate_limiter") as limiter:
+            limiter.enabled = True
+            limiter.is_allowed.return_value = {
+                "allowed": False,
+                "reason": "rate_limit_exceeded",
+                "retry_after": 7,
+                "limit": 5,
+                "window": 60,
+                "endpoint_type": "ocsr",
+            }
+            limited = self.run_request(middleware, path="/v1/ocsr/generate_smiles")
+            for path in ["/", "/favicon.ico", "/health", "/latest/docs"]:
+                self.run_request(middleware, path=path)
+
+        assert limited[0]["status"] == 429
+        limiter.is_allowed.assert_called_once_with(
+            "ip:10.0.0.1", "/v1/ocsr/generate_smiles"
+        )
+        assert called == ["/", "/favicon.ico", "/health", "/latest/docs"]
+
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_scope_client_identifier(self):
+        """Test client identifiers read straight from the ASGI scope."""
+        scope = {"headers": [], "query_string": b"", "client": ("10.0.0.1", 1)}
+
+        assert get_scope_client_identifier(scope) == "ip:10.0.0.1"
+        scope["query_string"] = b"user_id=u1"
+        assert get_scope_client_identifier(scope) == "user:u1"
+        scope["headers"] = [(b"x-session-id", b"s1")]
+        assert get_scope_client_identifier(scope) == "session:s1"
+        scope["state"] = {"session_id": "s2"}
+        assert get_scope_client_identifier(scope) == "session:s2"
+        forwarded = {"headers": [(b"x-forwarded-for", b"1.2.3.4, 5.6.7.8")]}
+        assert get_scope_client_identifier(forwarded) == "ip:1.2.3.4"
+
+
 class TestSessionSecurity:
     """Test session security functionality."""
 
@@ -456,6 +754,23 @@ class TestSessionSecurity:
         )
         assert validation["valid"] is False
 
+    @pytest.mark.skipif(
+        not SECURITY_MODULES_AVAILABLE, reason="Security modules not available"
+    )
+    def test_cleanup_expires_only_due_sessions(self):
+        """Test cleanup removes sessions past their deadline and keeps the rest."""
+        encryption = SessionEncryption("test_secret_key")
+        security = SessionSecurity(encryption)
+
+        security.create_secure_session("old_session")
+        security.create_secure_session("new_session")
+        security._expiry.schedule("old_session", 0)
+
+        security.cleanup_expired_sessions()
+
+        assert list(security.active_sessions) == ["new_session"]
+        assert security.session_stats["expired"] == 1
+
 
 class TestSecurityIntegration:
     """Test security features integration."""
@@ -0,0 +1,164 @@
+"""
+Tests for coalesced WebSocket queue broadcasts.
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    from app.modules import session_broadcast
+    from app.modules.session_broadcast import SessionWebSocketManager
+    from app.modules.session_manager import SessionManager
+
+    SESSION_BROADCAST_AVAILABLE = True
+except ImportError as e:
+    print(f"Session broadcast not available for testing: {e}")
+    SESSION_BROADCAST_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not SESSION_BROADCAST_AVAILABLE, reason="Session broadcast not available"
+)
+
+
+class FakeWebSocket:
+    """Records the messages sent to one client."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+@pytest.fixture(autouse=True)
+def fast_broadcasts(monkeypatch):
+    monkeypatch.setattr(session_broadcast, "BROADCAST_COALESCE_WINDOW", 0.05)
+
+
+async def connect_sessions(manager, ws_manager, count):
+    sessions, sockets = [], []
+    for _ in range(count):
+        session = await manager.create_session()
+        socket = FakeWebSocket()
+        await ws_manager.connect(socket, session["session_id"])
+        sessions.append(session)
+        sockets.append(socket)
+    return sessions, sockets
+
+
+async def stop(manager, ws_manager):
+    ws_manager._worker_task.cancel()
+    manager._cleanup_task.cancel()
+
+
+class TestSessionBroadcast:
+    """Test coalescing, per-client diffs and heartbeat replies."""
+
+    def test_changes_are_coalesced(self):
+        """Test a burst of changes produces a single broadcast."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            ws_manager = SessionWebSocketManager(manager)
+            _, sockets = await connect_sessions(manager, ws_manager, 3)
+            await asyncio.sleep(0.2)
+            broadcasts = ws_manager.stats["broadcasts"]
+
+            for _ in range(10):
+                await ws_manager.broadcast_queue_update()
+            await asyncio.sleep(0.2)
+            await stop(manager, ws_manager)
+            return ws_manager.stats["broadcasts"] - broadcasts, sockets
+
+        extra_broadcasts, sockets = asyncio.run(scenario())
+
+        assert extra_broadcasts == 1
+        # Each client got its initial state once; nothing changed afterwards
+        assert [len(socket.sent) for socket in sockets] == [1, 1, 1]
+        assert sockets[2].sent[0]["session_status"]["queue_position"] == 2
+
+    def test_only_changed_clients_are_sent_updates(self):
+        """Test clients whose own state is unchanged receive nothing."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            ws_manager = SessionWebSocketManager(manager)
+            sessions, sockets = await connect_sessions(manager, ws_manager, 4)
+            await asyncio.sleep(0.2)
+            for socket in sockets:
+                socket.sent.clear()
+
+            # The last waiting client leaves; nobody else moves
+            ws_manager.disconnect(sessions[3]["session_id"])
+            await manager.remove_session(sessions[3]["session_id"])
+            await ws_manager.broadcast_queue_update()
+            await asyncio.sleep(0.2)
+            unaffected = [len(socket.sent) for socket in sockets[:3]]
+
+            # The first waiting client leaves; the one behind moves up
+            ws_manager.disconnect(sessions[1]["session_id"])
+            await manager.remove_session(sessions[1]["session_id"])
+            await ws_manager.broadcast_queue_update()
+            await asyncio.sleep(0.2)
+            await stop(manager, ws_manager)
+            return unaffected, sockets
+
+        unaffected, sockets = asyncio.run(scenario())
+
+        assert unaffected == [0, 0, 0]
+        assert sockets[0].sent == []
+        assert len(sockets[2].sent) == 1
+        message = sockets[2].sent[0]
+        assert message["type"] == "queue_update"
+        assert message["session_status"]["queue_position"] == 1
+        assert message["queue_status"]["waiting_queue_length"] == 1
+
+    def test_heartbeat_reply_uses_last_broadcast(self):
+        """Test heartbeats are answered from the last broadcast state."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            ws_manager = SessionWebSocketManager(manager)
+            sessions, _ = await connect_sessions(manager, ws_manager, 2)
+            waiting_id = sessions[1]["session_id"]
+
+            # Before any broadcast the status is computed directly
+            first = json.loads(await ws_manager.heartbeat_reply(waiting_id))
+            await asyncio.sleep(0.2)
+
+            calls = []
+            original = manager.get_session_status
+
+            async def counting_status(session_id):
+                calls.append(session_id)
+                return await original(session_id)
+
+            manager.get_session_status = counting_status
+            second = json.loads(await ws_manager.heartbeat_reply(waiting_id))
+            missing = await ws_manager.heartbeat_reply("missing")
+            await stop(manager, ws_manager)
+            return first, second, calls, missing
+
+        first, second, calls, missing = asyncio.run(scenario())
+
+        assert first["type"] == second["type"] == "status_update"
+        assert first["session_status"]["queue_position"] == 1
+        assert second["session_status"] == first["session_status"]
+        assert second["queue_status"]["waiting_queue_length"] == 1
+        assert calls == []
+        assert missing is None
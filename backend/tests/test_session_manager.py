@@ -0,0 +1,288 @@
+"""
+Tests for session management.
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    from app.modules.session_manager import (
+        ACTIVITY_FLUSH_INTERVAL,
+        LAST_ACTIVITY_KEY,
+        LAST_REQUEST_KEY,
+        SESSION_DURATION_KEY,
+        SessionManager,
+    )
+
+    SESSION_MANAGER_AVAILABLE = True
+except ImportError as e:
+    print(f"Session manager not available for testing: {e}")
+    SESSION_MANAGER_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not SESSION_MANAGER_AVAILABLE, reason="Session manager not available"
+)
+
+
+class TestSessionManager:
+    """Test activation, queueing and promotion of sessions."""
+
+    def test_promotes_waiting_sessions_in_order(self):
+        """Test removing an active session promotes the head of the queue."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            active = await manager.create_session()
+            first = await manager.create_session()
+            second = await manager.create_session()
+
+            assert active["status"] == "active"
+            assert (first["queue_position"], second["queue_position"]) == (1, 2)
+
+            await manager.remove_session(active["session_id"])
+            promoted = await manager.get_session_status(first["session_id"])
+            waiting = await manager.get_session_status(second["session_id"])
+            manager._cleanup_task.cancel()
+            return promoted, waiting
+
+        promoted, waiting = asyncio.run(scenario())
+
+        assert promoted["status"] == "active"
+        assert waiting["status"] == "waiting"
+        assert waiting["queue_position"] == 1
+
+    def test_update_activity_of_waiting_session(self):
+        """Test activity updates reach sessions still in the queue."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=0)
+            session = await manager.create_session()
+            updated = await manager.update_session_activity(session["session_id"])
+            missing = await manager.update_session_activity("missing")
+            manager._cleanup_task.cancel()
+            return updated, missing
+
+        assert asyncio.run(scenario()) == (True, False)
+
+    def test_idle_sessions_do_not_block_queue(self):
+        """Test a waiting user is promoted once the active session goes idle."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1, idle_timeout=60)
+            idle = await manager.create_session()
+            waiting = await manager.create_session()
+            before = await manager.get_session_status(waiting["session_id"])
+
+            await manager.begin_request(idle["session_id"])
+            await manager.end_request(idle["session_id"])
+            # Activity is written in batches; flush before backdating it
+            manager._flush_activity()
+            stale = manager.backend.hget(LAST_REQUEST_KEY, idle["session_id"])
+            manager.backend.hset(
+                LAST_REQUEST_KEY, idle["session_id"], str(float(stale) - 120)
+            )
+            after = await manager.get_session_status(waiting["session_id"])
+            still_active = await manager.get_session_status(idle["session_id"])
+            manager._cleanup_task.cancel()
+            return before, after, still_active
+
+        before, after, still_active = asyncio.run(scenario())
+
+        assert before["status"] == "waiting"
+        assert after["status"] == "active"
+        assert still_active["status"] == "active"
+
+    def test_in_flight_request_keeps_slot(self):
+        """Test a session with a running request is never treated as idle."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1, idle_timeout=0)
+            busy = await manager.create_session()
+            await manager.begin_request(busy["session_id"])
+            waiting = await manager.create_session()
+            status = await manager.get_session_status(waiting["session_id"])
+            manager._cleanup_task.cancel()
+            return status
+
+        assert asyncio.run(scenario())["status"] == "waiting"
+
+    def test_cleanup_expires_only_inactive_sessions(self):
+        """Test cleanup removes sessions past the timeout and promotes the queue."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            stale = await manager.create_session()
+            kept = await manager.create_session()
+
+            # Pretend the active session was last seen long ago
+            manager.backend.hset(
+                LAST_ACTIVITY_KEY, stale["session_id"], str(time.time() - 600)
+            )
+            manager._expiry.schedule(stale["session_id"], 0)
+            await manager.cleanup_expired_sessions()
+
+            statuses = (
+                await manager.get_session_status(stale["session_id"]),
+                await manager.get_session_status(kept["session_id"]),
+            )
+            manager._cleanup_task.cancel()
+            return statuses
+
+        stale_status, kept_status = asyncio.run(scenario())
+
+        assert stale_status is None
+        assert kept_status["status"] == "active"
+
+    def test_cleanup_keeps_sessions_active_elsewhere(self):
+        """Test a due session is kept if another worker recorded activity."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            session = await manager.create_session()
+            manager._expiry.schedule(session["session_id"], 0)
+            await manager.cleanup_expired_sessions()
+            status = await manager.get_session_status(session["session_id"])
+            manager._cleanup_task.cancel()
+            return status, manager._expiry.deadline(session["session_id"])
+
+        status, deadline = asyncio.run(scenario())
+
+        assert status["status"] == "active"
+        assert deadline > time.time()
+
+    def test_activity_writes_are_batched(self):
+        """Test activity is kept in memory until flushed in one batch."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            session = await manager.create_session()
+            session_id = session["session_id"]
+            manager.backend.hset(LAST_ACTIVITY_KEY, session_id, "1.0")
+
+            for _ in range(3):
+                await manager.begin_request(session_id)
+                await manager.end_request(session_id)
+            before = manager.backend.hget(LAST_ACTIVITY_KEY, session_id)
+            pending = len(manager._pending_activity)
+            await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL + 0.1)
+            after = manager.backend.hget(LAST_ACTIVITY_KEY, session_id)
+            last_request = manager.backend.hget(LAST_REQUEST_KEY, session_id)
+            manager._cleanup_task.cancel()
+            return before, pending, after, last_request
+
+        before, pending, after, last_request = asyncio.run(scenario())
+
+        assert before == "1.0"
+        assert pending == 1
+        assert float(after) > 1.0
+        assert last_request == after
+
+    def test_session_state_reports_without_decoding(self):
+        """Test the cheap state check for active, waiting and unknown sessions."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            active = await manager.create_session()
+            waiting = await manager.create_session()
+            states = (
+                manager.session_state(active["session_id"]),
+                manager.session_state(waiting["session_id"]),
+                manager.session_state("unknown"),
+            )
+            manager._cleanup_task.cancel()
+            return states
+
+        assert asyncio.run(scenario()) == ("active", "waiting", None)
+
+    def test_wait_estimates_follow_observed_durations(self):
+        """Test queue estimates use measured session durations, not a constant."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1, idle_timeout=5)
+            for _ in range(5):
+                manager._record_duration(SESSION_DURATION_KEY, 100)
+            manager.record_job_time("ocsr", 4)
+            await manager.create_session()
+            first = await manager.create_session()
+            second = await manager.create_session()
+            statuses = (
+                await manager.get_session_status(first["session_id"]),
+                await manager.get_session_status(second["session_id"]),
+            )
+            snapshot = await manager.get_queue_snapshot()
+            statistics = manager.get_statistics()
+            manager._cleanup_task.cancel()
+            return statuses, snapshot, statistics
+
+        (first, second), snapshot, statistics = asyncio.run(scenario())
+
+        # The active session has about 100 s left, then each user takes 100 s
+        assert first["estimated_wait_time"] == pytest.approx(100, abs=1)
+        assert second["estimated_wait_time"] == pytest.approx(200, abs=1)
+        waits = sorted(
+            session["estimated_wait_time"]
+            for session in snapshot["sessions"].values()
+            if session["status"] == "waiting"
+        )
+        assert waits == [first["estimated_wait_time"], second["estimated_wait_time"]]
+        assert statistics["session_duration"]["count"] == 5
+        assert statistics["session_duration"]["p50"] == 100
+        assert statistics["job_service_time"]["ocsr"]["ewma"] == 4
+        assert statistics["estimated_wait_for_new_session"] == pytest.approx(300, abs=1)
+
+    def test_status_requests_reuse_wait_estimates(self, monkeypatch):
+        """Test waiting sessions read kept estimates instead of replaying the queue."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1, idle_timeout=5)
+            await manager.create_session()
+            waiting = [await manager.create_session() for _ in range(50)]
+            await manager.get_queue_snapshot()
+
+            replays = []
+            estimate = manager._estimate_wait_times
+
+            def counting(count):
+                replays.append(count)
+                return estimate(count)
+
+            monkeypatch.setattr(manager, "_estimate_wait_times", counting)
+            for session in waiting:
+                await manager.get_session_status(session["session_id"])
+            kept = list(replays)
+
+            # Removing a session changes the waits, so they are recomputed once
+            await manager.remove_session(waiting[0]["session_id"])
+            for session in waiting[1:]:
+                await manager.get_session_status(session["session_id"])
+            manager._cleanup_task.cancel()
+            return kept, replays
+
+        kept, replays = asyncio.run(scenario())
+
+        assert kept == []
+        assert replays == [49]
+
+    def test_removed_sessions_record_their_duration(self):
+        """Test removing an active session adds a session duration sample."""
+
+        async def scenario():
+            manager = SessionManager(max_concurrent_users=1)
+            session = await manager.create_session()
+            await manager.remove_session(session["session_id"])
+            manager._cleanup_task.cancel()
+            return manager.get_statistics()["session_duration"]
+
+        assert asyncio.run(scenario())["count"] == 1
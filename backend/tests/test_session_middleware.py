@@ -0,0 +1,245 @@
+"""
+Tests for the session middleware.
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    import app.middleware.session_middleware as session_middleware
+    from app.middleware.session_middleware import SessionMiddleware
+    from app.modules.session_manager import (
+        IN_FLIGHT_KEY,
+        LAST_ACTIVITY_KEY,
+        SessionManager,
+    )
+
+    SESSION_MIDDLEWARE_AVAILABLE = True
+except ImportError as e:
+    print(f"Session middleware not available for testing: {e}")
+    SESSION_MIDDLEWARE_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not SESSION_MIDDLEWARE_AVAILABLE, reason="Session middleware not available"
+)
+
+
+def make_scope(path, headers=(), query_string=b""):
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": list(headers),
+        "query_string": query_string,
+        "client": ("127.0.0.1", 50000),
+    }
+
+
+async def streaming_app(scope, receive, send):
+    """Application streaming its body in several chunks."""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    for chunk in (b"first", b"second"):
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def run_request(middleware, scope):
+    """Send one request through middleware and collect the ASGI messages."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """Replace the global session manager with a fresh one."""
+    manager = SessionManager(max_concurrent_users=1)
+    monkeypatch.setattr(session_middleware, "session_manager", manager)
+    yield manager
+    if manager._cleanup_task:
+        manager._cleanup_task.cancel()
+
+
+class TestSessionMiddleware:
+    """Test session validation as ASGI middleware."""
+
+    def test_active_session_streams_through(self, manager):
+        """Test streamed bodies are passed on chunk by chunk with session headers."""
+
+        async def scenario():
+            session = await manager.create_session()
+            middleware = SessionMiddleware(streaming_app, exempt_paths=["/health"])
+            scope = make_scope(
+                "/v1/ocsr/engines",
+                headers=[(b"x-session-id", session["session_id"].encode())],
+            )
+            return session["session_id"], scope, await run_request(middleware, scope)
+
+        session_id, scope, messages = asyncio.run(scenario())
+
+        start, *bodies = messages
+        headers = dict(start["headers"])
+        assert start["status"] == 200
+        assert headers[b"x-session-id"] == session_id.encode()
+        assert headers[b"x-session-status"] == b"active"
+        assert [body["body"] for body in bodies] == [b"first", b"second", b""]
+        assert scope["state"]["session_id"] == session_id
+
+    def test_missing_session_is_rejected(self, manager):
+        """Test API requests without a session ID get a 401."""
+        middleware = SessionMiddleware(streaming_app, exempt_paths=["/health"])
+        messages = asyncio.run(run_request(middleware, make_scope("/v1/ocsr/engines")))
+
+        assert messages[0]["status"] == 401
+        assert json.loads(messages[1]["body"])["error_code"] == "NO_SESSION"
+
+    def test_unknown_and_waiting_sessions_are_rejected(self, manager):
+        """Test unknown sessions get a 404 and queued sessions a 403."""
+
+        async def scenario():
+            await manager.create_session()
+            waiting = await manager.create_session()
+            middleware = SessionMiddleware(streaming_app, exempt_paths=["/health"])
+            unknown = await run_request(
+                middleware,
+                make_scope("/v1/ocsr/engines", query_string=b"session_id=unknown"),
+            )
+            queued = await run_request(
+                middleware,
+                make_scope(
+                    "/latest/ocsr/engines",
+                    headers=[
+                        (
+                            b"cookie",
+                            f"marcus_session_id={waiting['session_id']}".encode(),
+                        )
+                    ],
+                ),
+            )
+            return unknown, queued
+
+        unknown, queued = asyncio.run(scenario())
+
+        assert unknown[0]["status"] == 404
+        assert queued[0]["status"] == 403
+        assert json.loads(queued[1]["body"])["queue_position"] == 1
+
+    def test_exempt_paths_pass_through(self, manager):
+        """Test exempt paths reach the application without a session."""
+        middleware = SessionMiddleware(streaming_app, exempt_paths=["/health"])
+        messages = asyncio.run(run_request(middleware, make_scope("/health")))
+
+        assert messages[0]["status"] == 200
+        assert b"x-session-id" not in dict(messages[0]["headers"])
+
+    def test_default_exemptions_still_gate_the_api(self, manager):
+        """Test the default exempt list does not exempt versioned API paths."""
+        middleware = SessionMiddleware(streaming_app)
+
+        async def scenario():
+            return [
+                await run_request(middleware, make_scope(path))
+                for path in ["/v1/ocsr/engines", "/latest/ocsr/engines", "/", "/v1"]
+            ]
+
+        api, latest, root, version_root = asyncio.run(scenario())
+
+        assert api[0]["status"] == 401
+        assert json.loads(api[1]["body"])["error_code"] == "NO_SESSION"
+        assert latest[0]["status"] == 401
+        assert root[0]["status"] == 200
+        assert version_root[0]["status"] == 200
+
+    def test_default_exemptions_cover_docs_and_sessions(self, manager):
+        """Test docs, health and session endpoints need no session."""
+        middleware = SessionMiddleware(streaming_app)
+
+        async def scenario():
+            return [
+                await run_request(middleware, make_scope(path))
+                for path in [
+                    "/health",
+                    "/session/create",
+                    "/latest/docs",
+                    "/v1/openapi.json",
+                ]
+            ]
+
+        assert [messages[0]["status"] for messages in asyncio.run(scenario())] == [
+            200
+        ] * 4
+
+    def test_validated_heavy_requests_are_admission_controlled(
+        self, manager, monkeypatch
+    ):
+        """Test heavy API requests reserve work units and keep the session busy."""
+        from app.modules.admission_control import AdmissionController
+
+        controller = AdmissionController(capacity=4, costs={"ocsr": 2})
+        monkeypatch.setattr(session_middleware, "admission_controller", controller)
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen["in_flight_units"] = controller.in_flight_units
+            seen["in_flight"] = manager.backend.hget(
+                IN_FLIGHT_KEY, scope["state"]["session_id"]
+            )
+            await streaming_app(scope, receive, send)
+
+        async def scenario():
+            session = await manager.create_session()
+            scope = make_scope(
+                "/v1/ocsr/generate_smiles",
+                headers=[(b"x-session-id", session["session_id"].encode())],
+            )
+            scope["method"] = "POST"
+            return await run_request(SessionMiddleware(app), scope)
+
+        messages = asyncio.run(scenario())
+
+        assert messages[0]["status"] == 200
+        assert seen == {"in_flight_units": 2, "in_flight": "1"}
+        assert controller.in_flight_units == 0
+        assert controller.get_stats()["classes"]["ocsr"]["completed"] == 1
+
+    def test_requests_batch_activity_updates(self, manager):
+        """Test API requests record activity without writing it each time."""
+
+        async def scenario():
+            session = await manager.create_session()
+            session_id = session["session_id"]
+            manager.backend.hset(LAST_ACTIVITY_KEY, session_id, "1.0")
+            middleware = SessionMiddleware(streaming_app, exempt_paths=["/health"])
+            scope = make_scope(
+                "/v1/ocsr/engines", headers=[(b"x-session-id", session_id.encode())]
+            )
+            for _ in range(5):
+                await run_request(middleware, dict(scope))
+            unflushed = manager.backend.hget(LAST_ACTIVITY_KEY, session_id)
+            manager._flush_activity()
+            flushed = manager.backend.hget(LAST_ACTIVITY_KEY, session_id)
+            return unflushed, flushed
+
+        unflushed, flushed = asyncio.run(scenario())
+
+        assert unflushed == "1.0"
+        assert float(flushed) > 1.0
@@ -0,0 +1,300 @@
+"""
+Tests for structure similarity, clustering and MCS.
+"""
+
+import asyncio
+import os
+import threading
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    import numpy as np
+    from rdkit import Chem, DataStructs
+    from rdkit.Chem import AllChem
+
+    from app.modules.molecule_cache import (
+        FINGERPRINT_BITS,
+        MORGAN_RADIUS,
+        get_structure_from_smiles,
+    )
+    from app.modules import similarity
+    from app.modules.similarity import (
+        MCS_MAX_TIMEOUT,
+        MCS_MIN_TIMEOUT,
+        MCSCancelledError,
+        TooManyNeighboursError,
+        _butina_clusters,
+        _find_mcs_blocking,
+        _neighbour_lists,
+        _threshold_clusters,
+        cluster_structures,
+        compare_smiles_list,
+        find_mcs_cancellable,
+        iter_similar_pairs,
+        mcs_timeout,
+        stack_fingerprints,
+        tanimoto_matrix,
+        unpack_fingerprints,
+    )
+
+    SIMILARITY_AVAILABLE = True
+except ImportError as e:
+    print(f"Similarity module not available for testing: {e}")
+    SIMILARITY_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not SIMILARITY_AVAILABLE, reason="Similarity module not available"
+)
+
+SMILES = [
+    "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",  # caffeine
+    "CN1C=NC2=C1C(=O)NC(=O)N2C",  # theobromine
+    "CC(=O)OC1=CC=CC=C1C(=O)O",  # aspirin
+    "OC1=CC=CC=C1C(=O)O",  # salicylic acid
+]
+
+
+def structures(smiles_list):
+    return [get_structure_from_smiles(smiles) for smiles in smiles_list]
+
+
+class TestSimilarityMatrix:
+    """Test the vectorised Tanimoto matrix and engine agreement summary."""
+
+    def test_matches_rdkit_tanimoto(self):
+        """Test the matrix equals RDKit's bulk Tanimoto on the same fingerprints."""
+        fingerprints = [
+            AllChem.GetMorganFingerprintAsBitVect(
+                Chem.MolFromSmiles(smiles), MORGAN_RADIUS, nBits=FINGERPRINT_BITS
+            )
+            for smiles in SMILES
+        ]
+        expected = np.array(
+            [
+                DataStructs.BulkTanimotoSimilarity(fp, fingerprints)
+                for fp in fingerprints
+            ]
+        )
+
+        matrix = tanimoto_matrix(unpack_fingerprints(structures(SMILES)))
+
+        assert matrix.shape == (4, 4)
+        np.testing.assert_allclose(matrix, expected)
+
+    def test_rectangular_and_empty_fingerprints(self):
+        """Test two different matrices, and empty fingerprints scoring zero."""
+        bits = unpack_fingerprints(structures(SMILES[:2]))
+        empty = np.zeros((1, bits.shape[1]), dtype=np.float32)
+
+        matrix = tanimoto_matrix(np.vstack([bits, empty]), bits[:1])
+
+        assert matrix.shape == (3, 1)
+        assert matrix[0, 0] == pytest.approx(1.0)
+        assert matrix[2, 0] == 0.0
+        assert tanimoto_matrix(empty)[0, 0] == 0.0
+
+    def test_agreement_summary(self):
+        """Test agreement is counted over valid pairs only."""
+        result = compare_smiles_list(
+            [SMILES[0], "Cn1cnc2c1c(=O)n(C)c(=O)n2C", SMILES[2], "not a smiles"],
+            ["decimer", "molnextr", "molscribe", "broken"],
+        )
+        summary = result["agreement_summary"]
+
+        assert result["identical"] is False
+        # Caffeine written two ways agrees; every pair with aspirin does not
+        assert summary["total_comparisons"] == 3
+        assert summary["total_agreements"] == 1
+        assert summary["pair_agreements"] == {
+            "decimer-molnextr": True,
+            "decimer-molscribe": False,
+            "molnextr-molscribe": False,
+        }
+        assert summary["invalid_smiles"] == [
+            {"engine": "broken", "smiles": "not a smiles"}
+        ]
+        matrix = np.array(result["matrix"])
+        assert matrix[0, 1] == pytest.approx(1.0)
+        assert np.all(matrix[3, :3] == 0.0) and matrix[3, 3] == 1.0
+
+    def test_identical_inputs(self):
+        """Test identical SMILES are reported as such."""
+        result = compare_smiles_list([SMILES[0]] * 3, ["a", "b", "c"])
+
+        assert result["identical"] is True
+        assert result["agreement_summary"]["agreement_percentage"] == 100
+
+
+class TestClustering:
+    """Test blocked all-pairs search, clustering and deduplication."""
+
+    def test_blocks_find_the_same_pairs(self):
+        """Test the pairs found do not depend on the block size."""
+        packed = stack_fingerprints(structures(SMILES))
+        full = tanimoto_matrix(unpack_fingerprints(structures(SMILES)))
+
+        def pairs(block_size):
+            return sorted(
+                (i, j, round(value, 6))
+                for rows, cols, values in iter_similar_pairs(packed, 0.3, block_size)
+                for i, j, value in zip(rows.tolist(), cols.tolist(), values.tolist())
+            )
+
+        expected = sorted(
+            (i, j, round(full[i, j], 6))
+            for i in range(4)
+            for j in range(i + 1, 4)
+            if full[i, j] >= 0.3
+        )
+        assert pairs(1) == pairs(3) == pairs(2048) == expected
+        assert (0, 1) in {(i, j) for i, j, _ in expected}
+
+    def test_butina_and_threshold_clusters_of_a_chain(self):
+        """Test a chain is one component but several Butina clusters."""
+        neighbours = [[1], [0, 2], [1, 3], [2]]
+
+        assert _threshold_clusters(neighbours) == [[1, 2, 0, 3]]
+        assert _butina_clusters(neighbours) == [[1, 0, 2], [3]]
+
+    def test_neighbour_pairs_are_capped(self):
+        """Test exceeding the pair cap raises instead of growing the lists."""
+        packed = stack_fingerprints(structures(SMILES))
+
+        assert _neighbour_lists(packed, 0.0, 2, max_pairs=6)[0] == [1, 2, 3]
+        with pytest.raises(TooManyNeighboursError):
+            _neighbour_lists(packed, 0.0, 2, max_pairs=5)
+
+    def test_duplicates_clusters_and_invalid_structures(self):
+        """Test exact duplicates are grouped and near duplicates clustered."""
+        records = [
+            {"id": "a", "smiles": SMILES[0], "source": "p1"},
+            {"id": "b", "smiles": "Cn1cnc2c1c(=O)n(C)c(=O)n2C", "source": "p2"},
+            {"id": "c", "smiles": SMILES[1]},
+            {"id": "d", "smiles": SMILES[2]},
+            {"id": "e", "smiles": "not a smiles"},
+        ]
+
+        result = cluster_structures(records, threshold=0.5)
+
+        assert result["total_structures"] == 5
+        assert result["unique_structures"] == 3
+        assert [
+            [member["id"] for member in group["members"]]
+            for group in result["duplicate_groups"]
+        ] == [["a", "b"]]
+        assert [
+            sorted(member["id"] for member in cluster["members"])
+            for cluster in result["clusters"]
+        ] == [["a", "b", "c"]]
+        assert result["clusters"][0]["unique_structures"] == 2
+        assert result["invalid_structures"] == [records[4]]
+
+        with_singletons = cluster_structures(
+            records, threshold=0.5, include_singletons=True
+        )
+        assert [cluster["size"] for cluster in with_singletons["clusters"]] == [3, 1]
+
+
+@pytest.fixture
+def empty_mcs_cache():
+    with similarity._mcs_cache_lock:
+        similarity._mcs_cache.clear()
+    yield
+    with similarity._mcs_cache_lock:
+        similarity._mcs_cache.clear()
+
+
+@pytest.mark.usefixtures("empty_mcs_cache")
+class TestMCS:
+    """Test the cached, cancellable MCS search."""
+
+    def test_second_call_is_cached(self):
+        """Test a repeated comparison is answered from the cache in any order."""
+        first = asyncio.run(find_mcs_cancellable(structures(SMILES[:2])))
+        again = asyncio.run(find_mcs_cancellable(structures(SMILES[1::-1])))
+
+        assert first["cached"] is False and again["cached"] is True
+        assert again["mcs_smarts"] == first["mcs_smarts"]
+        assert first["atom_count"] == 13 and first["timed_out"] is False
+
+    def test_identical_inputs_match_fmcs_output(self):
+        """Test the identical-input shortcut returns FMCS-style SMARTS."""
+        chiral = structures(["C[C@H](N)C(=O)O"] * 2)
+
+        result = asyncio.run(find_mcs_cancellable(chiral))
+        expected = _find_mcs_blocking(chiral, MCS_MIN_TIMEOUT, threading.Event())
+
+        assert "@H" not in result["mcs_smarts"]
+        assert result["atom_count"] == expected["atom_count"] == 6
+        assert result["bond_count"] == expected["bond_count"] == 5
+        shortcut = Chem.MolFromSmarts(result["mcs_smarts"])
+        fmcs = Chem.MolFromSmarts(expected["mcs_smarts"])
+        for query in (shortcut, fmcs):
+            Chem.FastFindRings(query)
+        assert shortcut.HasSubstructMatch(fmcs) and fmcs.HasSubstructMatch(shortcut)
+        assert Chem.MolFromSmiles("C[C@@H](N)C(=O)O").HasSubstructMatch(shortcut)
+
+    def test_timed_out_results_are_not_cached(self, monkeypatch):
+        """Test a timed-out search is retried on the next request."""
+        calls = []
+
+        def timed_out(structures, timeout, cancel_event):
+            calls.append(timeout)
+            return {
+                "mcs_smarts": "[#6]",
+                "atom_count": 1,
+                "bond_count": 0,
+                "timed_out": True,
+                "cancelled": False,
+            }
+
+        monkeypatch.setattr(similarity, "_find_mcs_blocking", timed_out)
+
+        for _ in range(2):
+            result = asyncio.run(find_mcs_cancellable(structures(SMILES[:2])))
+            assert result["timed_out"] is True and result["cached"] is False
+        assert len(calls) == 2
+
+    def test_disconnect_cancels_the_search(self, monkeypatch):
+        """Test a client disconnect aborts FMCS and nothing is cached."""
+        released = threading.Event()
+
+        def blocking(structures, timeout, cancel_event):
+            released.set()
+            cancel_event.wait(5)
+            return {
+                "mcs_smarts": "",
+                "atom_count": 0,
+                "bond_count": 0,
+                "timed_out": False,
+                "cancelled": cancel_event.is_set(),
+            }
+
+        async def is_disconnected():
+            return released.is_set()
+
+        monkeypatch.setattr(similarity, "_find_mcs_blocking", blocking)
+        monkeypatch.setattr(similarity, "MCS_DISCONNECT_POLL_INTERVAL", 0.01)
+
+        with pytest.raises(MCSCancelledError):
+            asyncio.run(find_mcs_cancellable(structures(SMILES[:2]), is_disconnected))
+        assert len(similarity._mcs_cache) == 0
+
+    def test_timeout_grows_with_molecule_size(self):
+        """Test the timeout stays between the configured bounds."""
+        small = mcs_timeout(structures(["C"]))
+        large = mcs_timeout(structures(["C" * 400]))
+
+        assert small == MCS_MIN_TIMEOUT + 1
+        assert large == MCS_MAX_TIMEOUT
+        assert mcs_timeout([]) == MCS_MIN_TIMEOUT
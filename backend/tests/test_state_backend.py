@@ -0,0 +1,240 @@
+"""
+Tests for the shared state backends, including sessions and rate limits shared
+by several workers.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    from app.modules.session_manager import SessionManager
+    from app.modules.state_backend import (
+        IndexedQueue,
+        MemoryStateBackend,
+        StateBackendError,
+        create_state_backend,
+    )
+    from app.security.rate_limiter import RateLimiter, RateLimitRule
+
+    STATE_BACKEND_AVAILABLE = True
+except ImportError as e:
+    print(f"State backend not available for testing: {e}")
+    STATE_BACKEND_AVAILABLE = False
+
+from redis_stub_server import run_stub_server
+
+pytestmark = pytest.mark.skipif(
+    not STATE_BACKEND_AVAILABLE, reason="State backend not available"
+)
+
+
+@pytest.fixture(scope="module")
+def redis_server():
+    with run_stub_server() as server:
+        yield server
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend_factory(request, tmp_path, redis_server):
+    """Return a factory of backends that share state, like separate workers."""
+    if request.param == "memory":
+        backend = MemoryStateBackend()
+        return lambda: backend
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path / 'state.sqlite3'}"
+        return lambda: create_state_backend(url)
+    with redis_server.lock:
+        redis_server.data.clear()
+    return lambda: create_state_backend(redis_server.url)
+
+
+class TestStateBackend:
+    """Test every backend against the same behaviour."""
+
+    def test_values(self, backend_factory):
+        """Test get, set, expiry, counters and prefix scans."""
+        backend = backend_factory()
+        backend.set("a:1", "one")
+        backend.set("a:2", "two", ttl=0.05)
+        backend.set("b:1", "three")
+
+        assert backend.get("a:1") == "one"
+        assert sorted(backend.scan_keys("a:")) == ["a:1", "a:2"]
+        time.sleep(0.1)
+        assert backend.get("a:2") is None
+        assert backend.scan_keys("a:") == ["a:1"]
+
+        assert backend.incr("counter") == 1
+        assert backend.incr("counter", 5) == 6
+        backend.delete("a:1", "counter")
+        assert backend.get("a:1") is None
+        assert backend.get("counter") is None
+
+    def test_update(self, backend_factory):
+        """Test read-modify-write updates and deletes."""
+        backend = backend_factory()
+        append = lambda value: ((value or "") + "x", len(value or ""))
+
+        assert backend.update("key", append) == 0
+        assert backend.update("key", append) == 1
+        assert backend.get("key") == "xx"
+        assert backend.update("key", lambda value: (None, value)) == "xx"
+        assert backend.get("key") is None
+
+    def test_hashes(self, backend_factory):
+        """Test hash fields, counts and increments."""
+        backend = backend_factory()
+        backend.hset("h", "a", "1")
+        backend.hset("h", "b", "2")
+
+        assert backend.hget("h", "a") == "1"
+        assert backend.hgetall("h") == {"a": "1", "b": "2"}
+        assert backend.hincrby("h", "a", 4) == 5
+        assert backend.hdel("h", "b", "missing") == 1
+        assert backend.hlen("h") == 1
+        backend.delete("h")
+        assert backend.hgetall("h") == {}
+
+    def test_queue_matches_list_model(self, backend_factory):
+        """Test queue order and positions against a plain list."""
+        backend = backend_factory()
+        model = []
+        rng = random.Random(0)
+
+        for i in range(120):
+            action = rng.random()
+            if action < 0.5 or not model:
+                assert backend.queue_push("q", f"s{i}") == len(model) + 1
+                model.append(f"s{i}")
+            elif action < 0.75:
+                assert backend.queue_pop("q") == model.pop(0)
+            else:
+                member = rng.choice(model)
+                assert backend.queue_remove("q", member)
+                model.remove(member)
+
+            assert backend.queue_len("q") == len(model)
+            for position, member in enumerate(model, start=1):
+                assert backend.queue_position("q", member) == position
+        assert backend.queue_members("q") == model
+        assert backend.queue_position("q", "missing") is None
+
+    def test_lock_is_exclusive_across_workers(self, backend_factory):
+        """Test a lock taken through one backend blocks the others."""
+        first, second = backend_factory(), backend_factory()
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with first.lock("l"):
+                entered.set()
+                release.wait(2)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        entered.wait(2)
+        with pytest.raises(StateBackendError):
+            with second.lock("l", timeout=0.05):
+                pass
+        release.set()
+        thread.join()
+        with second.lock("l", timeout=1):
+            pass
+
+
+def test_redis_lock_release_keeps_a_lock_taken_over(redis_server):
+    """Test releasing an expired lock leaves another worker's lock and expiry."""
+    with redis_server.lock:
+        redis_server.data.clear()
+    first = create_state_backend(redis_server.url)
+    second = create_state_backend(redis_server.url)
+
+    with first.lock("l", timeout=0.05):
+        time.sleep(0.1)
+        # The lock expired while held, and another worker took it
+        assert second._command("SET", "l", "other", "NX", "PX", 5000) == "OK"
+
+    assert second.get("l") == "other"
+    with redis_server.lock:
+        assert "l" in redis_server.expires
+
+    # Our own lock is still released normally
+    second.delete("l")
+    with first.lock("l", timeout=1):
+        pass
+    assert first.get("l") is None
+
+
+def test_indexed_queue_renumbering():
+    """Test positions stay correct once sequence numbers are renumbered."""
+    queue = IndexedQueue(capacity=8)
+    model = []
+    rng = random.Random(1)
+
+    for i in range(500):
+        if rng.random() < 0.55 or not model:
+            assert queue.append(f"s{i}") == len(model) + 1
+            model.append(f"s{i}")
+        else:
+            member = rng.choice(model)
+            assert queue.remove(member)
+            model.remove(member)
+        for position, member in enumerate(model, start=1):
+            assert queue.position(member) == position
+
+
+class TestSharedState:
+    """Test sessions and rate limits stay consistent across workers."""
+
+    def test_sessions_shared_by_workers(self, backend_factory):
+        """Test two session managers enforce one concurrency limit."""
+
+        async def scenario():
+            workers = [
+                SessionManager(max_concurrent_users=1, backend=backend_factory())
+                for _ in range(2)
+            ]
+            first = await workers[0].create_session()
+            second = await workers[1].create_session()
+            queued_status = await workers[0].get_session_status(second["session_id"])
+
+            await workers[0].remove_session(first["session_id"])
+            promoted_status = await workers[1].get_session_status(second["session_id"])
+            for worker in workers:
+                worker._cleanup_task.cancel()
+            return first, second, queued_status, promoted_status
+
+        first, second, queued_status, promoted_status = asyncio.run(scenario())
+
+        assert first["status"] == "active"
+        assert second["status"] == "waiting"
+        assert queued_status["queue_position"] == 1
+        assert promoted_status["status"] == "active"
+
+    def test_rate_limit_shared_by_workers(self, backend_factory):
+        """Test requests to different workers count against one limit."""
+        workers = [RateLimiter(backend=backend_factory()) for _ in range(2)]
+        for worker in workers:
+            worker.enabled = True
+            worker.rules["default"] = RateLimitRule(requests=3, window=60, penalty=1)
+
+        results = [workers[i % 2].is_allowed("client", "/api") for i in range(4)]
+
+        assert [result["allowed"] for result in results] == [True, True, True, False]
+        assert workers[0].get_client_stats("client")["violations"] == 1
+        assert workers[1].reset_client("client") is True
+        assert workers[0].get_client_stats("client") == {"exists": False}
@@ -0,0 +1,105 @@
+"""
+Tests for the persistent structure index.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# Test configuration, applied before the app configuration is imported
+TEST_ENV_VARS = {
+    "OPENAI_API_KEY": "sk-test1234567890abcdef1234567890abcdef1234567890abcdef",
+    "SECRET_KEY": "test_secret_key_for_testing_purposes_only",
+    "CORS_ORIGINS": "http://localhost:3000",
+    "STRUCTURE_INDEX_PATH": os.path.join(tempfile.mkdtemp(), "structure_index.sqlite3"),
+}
+for key, value in TEST_ENV_VARS.items():
+    os.environ.setdefault(key, value)
+
+try:
+    from app.modules.structure_index import StructureIndex, source_from_image_path
+
+    STRUCTURE_INDEX_AVAILABLE = True
+except ImportError as e:
+    print(f"Structure index not available for testing: {e}")
+    STRUCTURE_INDEX_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not STRUCTURE_INDEX_AVAILABLE, reason="Structure index not available"
+)
+
+CAFFEINE = "CN1C=NC2=C1C(=O)N(C(=O)N2C)C"
+THEOBROMINE = "CN1C=NC2=C1C(=O)NC(=O)N2C"
+ASPIRIN = "CC(=O)OC1=CC=CC=C1C(=O)O"
+BENZENE = "c1ccccc1"
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = StructureIndex(str(tmp_path / "index.sqlite3"))
+    index.add_structure(CAFFEINE, engine="decimer", source_pdf="paper1")
+    index.add_structure(THEOBROMINE, engine="decimer", source_pdf="paper1")
+    index.add_structure(ASPIRIN, engine="molscribe", source_pdf="paper2")
+    return index
+
+
+class TestStructureIndex:
+    """Test adding structures and searching the index."""
+
+    def test_same_structure_is_stored_once(self, index):
+        """Test re-adding a structure from the same source keeps one row."""
+        first = index.add_structure("Cn1cnc2c1c(=O)n(C)c(=O)n2C", engine="decimer")
+        again = index.add_structure(CAFFEINE, engine="decimer")
+
+        assert first == again
+        assert index.add_structure("not a smiles") is None
+        assert index.get_stats()["structures"] == 4
+        assert index.get_stats()["unique_structures"] == 3
+        assert index.get_stats()["source_pdfs"] == 2
+
+    def test_search_similar(self, index):
+        """Test hits are ranked by similarity and filtered by the minimum."""
+        hits = index.search_similar(CAFFEINE, k=3)
+
+        assert [hit["smiles"] for hit in hits] == [CAFFEINE, THEOBROMINE, ASPIRIN]
+        assert hits[0]["similarity"] == pytest.approx(1.0)
+        assert hits[0]["source_pdf"] == "paper1"
+        assert hits[1]["similarity"] > hits[2]["similarity"]
+        assert len(index.search_similar(CAFFEINE, k=3, min_similarity=0.5)) == 2
+        assert len(index.search_similar(CAFFEINE, k=1)) == 1
+        with pytest.raises(ValueError):
+            index.search_similar("not a smiles")
+
+    def test_search_substructure(self, index):
+        """Test SMILES and SMARTS queries only return verified matches."""
+        scaffold = index.search_substructure(THEOBROMINE)
+        smarts = index.search_substructure("c1ccccc1C(=O)[OH]", query_type="smarts")
+
+        assert sorted(hit["smiles"] for hit in scaffold) == sorted(
+            [CAFFEINE, THEOBROMINE]
+        )
+        assert [hit["smiles"] for hit in smarts] == [ASPIRIN]
+        assert index.search_substructure(BENZENE) == smarts
+        with pytest.raises(ValueError):
+            index.search_substructure("[", query_type="smarts")
+
+    def test_search_sees_structures_added_later(self, index):
+        """Test structures added after a search are found by the next one."""
+        assert len(index.search_substructure(BENZENE)) == 1
+        index.add_structure("OC1=CC=CC=C1C(=O)O", source_pdf="paper3")
+
+        hits = index.search_substructure(BENZENE)
+
+        assert sorted(hit["source_pdf"] for hit in hits) == ["paper2", "paper3"]
+        assert len(index.search_substructure(BENZENE, limit=1)) == 1
+
+    def test_source_from_image_path(self):
+        """Test segment images are traced back to their PDF and segment."""
+        assert source_from_image_path(
+            "/uploads/segments/paper1/all_segments/page_1_0.png"
+        ) == {"source_pdf": "paper1", "segment_id": "page_1_0"}
+        assert source_from_image_path("/uploads/chem_images/upload.png") == {
+            "source_pdf": "",
+            "segment_id": "upload",
+        }
@@ -1,4 +1,5 @@
 import axios from 'axios'
+import sessionService from './sessionService'
 // Get the API URL with proper fallbacks
 const getApiBaseUrl = () => {
   // In production on the marcus.decimer.ai server
@@ -116,6 +117,21 @@ export const getApiImageUrl = (path) => {
   return result;
 }
 
+// Headers identifying the current session; versioned API requests need them
+export const getSessionHeaders = () => {
+  const sessionId = sessionService.getSessionId();
+  return sessionId ? { 'X-Session-ID': sessionId } : {};
+};
+
+// fetch() for API URLs outside the axios client, e.g. images loaded as blobs.
+// Cookies are not sent cross-origin by default, so the session goes in a header.
+export const fetchWithSession = (url, options = {}) => {
+  return fetch(url, {
+    ...options,
+    headers: { ...getSessionHeaders(), ...(options.headers || {}) }
+  });
+};
+
 // Create axios instance with default config
 const api = axios.create({
   baseURL: getApiBaseUrl(),
@@ -132,6 +148,9 @@ api.interceptors.request.use(
     // Log the request URL for debugging
     console.log('API Request (original):', config.method.toUpperCase(), config.baseURL + config.url);
 
+    // Versioned API requests need an active session
+    Object.assign(config.headers, getSessionHeaders());
+
     // Add version prefix if not already present
     if (config.url && !config.url.startsWith('/v') && !config.url.startsWith('/latest')) {
       config.url = '/latest' + config.url;
@@ -37,6 +37,7 @@ class SessionService {
       const validation = sessionSecurityManager.validateSession();
       if (validation.valid && validation.sessionData) {
         this.sessionId = validation.sessionData.sessionId;
+        this.setSessionCookie(this.sessionId);
         console.log('Recovered secure session:', this.sessionId);
         
         if (validation.requiresReauth) {
@@ -53,6 +54,7 @@ class SessionService {
     const storedSessionId = sessionStorage.getItem(this.sessionKey);
     if (storedSessionId) {
       this.sessionId = storedSessionId;
+      this.setSessionCookie(storedSessionId);
       console.log('Recovered session from regular storage:', storedSessionId);
     }
   }
@@ -63,6 +65,7 @@ class SessionService {
   storeSession(sessionId) {
     if (sessionId) {
       this.sessionId = sessionId;
+      this.setSessionCookie(sessionId);
       
       // Use secure storage with encryption
       try {
@@ -78,10 +81,23 @@ class SessionService {
     }
   }
 
+  /**
+   * Mirror the session ID in a cookie, so requests the API clients do not
+   * make themselves, such as segment images in <img> tags, carry it too
+   */
+  setSessionCookie(sessionId) {
+    if (sessionId) {
+      document.cookie = `${this.sessionKey}=${encodeURIComponent(sessionId)}; path=/; SameSite=Lax`;
+    } else {
+      document.cookie = `${this.sessionKey}=; path=/; max-age=0; SameSite=Lax`;
+    }
+  }
+
   /**
    * Clear stored session securely
    */
   clearStoredSession() {
+    this.setSessionCookie(null);
     try {
       sessionSecurityManager.invalidateSession('user_logout');
       console.log('Session cleared securely');
@@ -557,6 +573,7 @@ class SessionService {
         
         // Clear local session references
         this.sessionId = null;
+        this.setSessionCookie(null);
         sessionStorage.removeItem(this.sessionKey);
       }
     };